@@ -382,8 +382,8 @@ def arg_botcmd(
                 description=func.__doc__,
             )
 
-            @wraps(func)
-            def wrapper(self, msg, args):
+            def parse_args(args):
+                """Returns the args and kwargs to call func with, or the replies explaining why it failed."""
                 # Attempt to sanitize arguments of bad characters
                 try:
                     sanitizer_re = re.compile(
@@ -397,29 +397,60 @@ def arg_botcmd(
                     args = shlex.split(args)
                     parsed_args = err_command_parser.parse_args(args)
                 except ArgumentParseError as e:
-                    yield f"I couldn't parse the arguments; {e}"
-                    yield err_command_parser.format_usage()
-                    return
+                    return (
+                        None,
+                        None,
+                        (
+                            f"I couldn't parse the arguments; {e}",
+                            err_command_parser.format_usage(),
+                        ),
+                    )
                 except HelpRequested:
-                    yield err_command_parser.format_help()
-                    return
+                    return None, None, (err_command_parser.format_help(),)
                 except ValueError as ve:
-                    yield f"I couldn't parse this command; {ve}"
-                    yield err_command_parser.format_help()
-                    return
+                    return (
+                        None,
+                        None,
+                        (
+                            f"I couldn't parse this command; {ve}",
+                            err_command_parser.format_help(),
+                        ),
+                    )
 
                 if unpack_args:
-                    func_args = []
-                    func_kwargs = vars(parsed_args)
-                else:
-                    func_args = [parsed_args]
-                    func_kwargs = {}
-
-                if inspect.isgeneratorfunction(func):
-                    for reply in func(self, msg, *func_args, **func_kwargs):
-                        yield reply
-                else:
-                    yield func(self, msg, *func_args, **func_kwargs)
+                    return [], vars(parsed_args), ()
+                return [parsed_args], {}, ()
+
+            if inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func):
+
+                @wraps(func)
+                async def wrapper(self, msg, args):
+                    func_args, func_kwargs, errors = parse_args(args)
+                    for error in errors:
+                        yield error
+                    if errors:
+                        return
+
+                    if inspect.isasyncgenfunction(func):
+                        async for reply in func(self, msg, *func_args, **func_kwargs):
+                            yield reply
+                    else:
+                        yield await func(self, msg, *func_args, **func_kwargs)
+
+            else:
+
+                @wraps(func)
+                def wrapper(self, msg, args):
+                    func_args, func_kwargs, errors = parse_args(args)
+                    if errors:
+                        yield from errors
+                        return
+
+                    if inspect.isgeneratorfunction(func):
+                        for reply in func(self, msg, *func_args, **func_kwargs):
+                            yield reply
+                    else:
+                        yield func(self, msg, *func_args, **func_kwargs)
 
             _tag_botcmd(
                 wrapper,
@@ -569,6 +600,19 @@ def cmdfilter(*args, **kwargs):
     Note that a cmdfilter plugin *could* modify `cmd` or `args` above
     and send that through in order to make it appear as if the user
     issued a different command.
+
+    A filter applies to every command by default, it can be restricted to some
+    commands and/or to the commands of some plugins so the others skip it::
+
+        @cmdfilter(commands=("deploy", "rollback"), plugins=("Ops",))
+        def ops_filter(self, msg, cmd, args, dry_run):
+            ...
+
+    :param catch_unprocessed: if True, the filter is also called with
+        emptycmd=True when the command has not been found.
+    :param commands: the names of the commands to filter, None for all of them.
+    :param plugins: the names of the plugins whose commands are filtered,
+        None for all of them.
     """
 
     def decorate(func):
@@ -577,6 +621,17 @@ def cmdfilter(*args, **kwargs):
         ):  # don't override generated functions
             func._err_command_filter = True
         func.catch_unprocessed = kwargs.get("catch_unprocessed", False)
+        commands, plugins = kwargs.get("commands"), kwargs.get("plugins")
+        if isinstance(commands, str):
+            commands = (commands,)
+        if isinstance(plugins, str):
+            plugins = (plugins,)
+        func._err_command_filter_commands = (
+            None if commands is None else frozenset(commands)
+        )
+        func._err_command_filter_plugins = (
+            None if plugins is None else frozenset(plugins)
+        )
         return func
 
     if len(args):
@@ -3,7 +3,6 @@ import logging
 import random
 import time
 from abc import ABC, abstractmethod
-from collections import defaultdict, deque
 from typing import Any, BinaryIO, List, Mapping, Optional, Sequence, Tuple, Type
 
 log = logging.getLogger(__name__)
@@ -796,10 +795,6 @@ class Backend(ABC):
     you to implement the missing parts.
     """
 
-    cmd_history = defaultdict(
-        lambda: deque(maxlen=10)
-    )  # this will be a per user history
-
     MSG_ERROR_OCCURRED = (
         "Sorry for your inconvenience. " "An unexpected error occurred."
     )
@@ -23,7 +23,9 @@ from errbot.backends.base import (
     Stream,
 )
 from errbot.core import ErrBot
+from errbot.rendering import ConverterPool
 from errbot.rendering.ansiext import NSC, AnsiExtension, CharacterTable, enable_format
+from errbot.tracing import span
 from errbot.utils import rate_limited
 
 log = logging.getLogger(__name__)
@@ -743,7 +745,7 @@ class IRCBackend(ErrBot):
             reconnect_on_kick=reconnect_on_kick,
             reconnect_on_disconnect=reconnect_on_disconnect,
         )
-        self.md = irc_md()
+        self.md = ConverterPool(irc_md)
 
     def set_message_size_limit(self, limit: int = 510, hard_limit: int = 510) -> None:
         """
@@ -751,6 +753,12 @@ class IRCBackend(ErrBot):
         """
         super().set_message_size_limit(limit, hard_limit)
 
+    def message_size(self, text: str) -> int:
+        """
+        IRC counts the message size in bytes
+        """
+        return len(text.encode("utf-8"))
+
     def send_message(self, msg: Message) -> None:
         super().send_message(msg)
         if msg.is_direct:
@@ -760,7 +768,8 @@ class IRCBackend(ErrBot):
             msg_func = self.conn.send_public_message
             msg_to = msg.to.room
 
-        body = self.md.convert(msg.body)
+        with span("markdown"):
+            body = self.md.convert(msg.body)
         for line in body.split("\n"):
             msg_func(msg_to, line)
 
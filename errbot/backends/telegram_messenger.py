@@ -13,8 +13,9 @@ from errbot.backends.base import (
     Stream,
 )
 from errbot.core import ErrBot
-from errbot.rendering import text
+from errbot.rendering import ConverterPool, text
 from errbot.rendering.ansiext import TEXT_CHRS, enable_format
+from errbot.tracing import span
 
 log = logging.getLogger(__name__)
 
@@ -204,7 +205,7 @@ class TelegramBackend(ErrBot):
 
         compact = config.COMPACT_OUTPUT if hasattr(config, "COMPACT_OUTPUT") else False
         enable_format("text", TEXT_CHRS, borders=not compact)
-        self.md_converter = text()
+        self.md_converter = ConverterPool(text)
 
     def set_message_size_limit(self, limit: int = 1024, hard_limit: int = 1024) -> None:
         """
@@ -297,7 +298,8 @@ class TelegramBackend(ErrBot):
 
     def send_message(self, msg: Message) -> None:
         super().send_message(msg)
-        body = self.md_converter.convert(msg.body)
+        with span("markdown"):
+            body = self.md_converter.convert(msg.body)
         try:
             self.telegram.sendMessage(msg.to.id, body)
         except Exception:
@@ -24,7 +24,8 @@ from errbot.backends.base import (
 from errbot.bootstrap import setup_bot
 from errbot.core import ErrBot
 from errbot.core_plugins.wsview import reset_app
-from errbot.rendering import text
+from errbot.rendering import ConverterPool, text
+from errbot.tracing import span
 from errbot.utils import deprecated
 
 log = logging.getLogger(__name__)
@@ -278,12 +279,14 @@ class TestBackend(ErrBot):
             config.BOT_ADMINS[0]
         )  # By default, assume this is the admin talking
         self.reset_rooms()
-        self.md = text()
+        self.md = ConverterPool(text)
 
     def send_message(self, msg: Message) -> None:
         log.info("\n\n\nMESSAGE:\n%s\n\n\n", msg.body)
         super().send_message(msg)
-        self.outgoing_message_queue.put(self.md.convert(msg.body))
+        with span("markdown"):
+            body = self.md.convert(msg.body)
+        self.outgoing_message_queue.put(body)
 
     def send_stream_request(
         self,
@@ -526,6 +529,8 @@ class TestBot:
         self.bot.thread_pool.join()
         self.bot.flow_executor._pool.close()
         self.bot.flow_executor._pool.join()
+        self.bot.event_loop.stop()
+        self.bot.callback_watchdog.stop()
         self.bot_thread = None
 
     def pop_message(self, timeout: int = 5, block: bool = True):
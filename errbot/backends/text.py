@@ -25,7 +25,7 @@ from errbot.backends.base import (
 )
 from errbot.core import ErrBot
 from errbot.logs import console_hdlr
-from errbot.rendering import ansi, imtext, text, xhtml
+from errbot.rendering import ConverterPool, ansi, imtext, text, xhtml
 from errbot.rendering.ansiext import ANSI_CHRS, AnsiExtension, enable_format
 
 log = logging.getLogger(__name__)
@@ -233,13 +233,13 @@ class TextBackend(ErrBot):
             else False
         )
         if not self.demo_mode:
-            self.md_html = xhtml()  # for more debug feedback on md
-            self.md_text = text()  # for more debug feedback on md
-            self.md_borderless_ansi = borderless_ansi()
-            self.md_im = imtext()
+            self.md_html = ConverterPool(xhtml)  # for more debug feedback on md
+            self.md_text = ConverterPool(text)  # for more debug feedback on md
+            self.md_borderless_ansi = ConverterPool(borderless_ansi)
+            self.md_im = ConverterPool(imtext)
             self.md_lexer = get_lexer_by_name("md", stripall=True)
 
-        self.md_ansi = ansi()
+        self.md_ansi = ConverterPool(ansi)
         self.html_lexer = get_lexer_by_name("html", stripall=True)
         self.terminal_formatter = Terminal256Formatter(style="paraiso-dark")
         self.user = self.build_identifier(self.bot_config.BOT_ADMINS[0])
@@ -21,7 +21,8 @@ from errbot.backends.base import (
     RoomOccupant,
 )
 from errbot.core import ErrBot
-from errbot.rendering import text, xhtml, xhtmlim
+from errbot.rendering import ConverterPool, text, xhtml, xhtmlim
+from errbot.tracing import span
 
 log = logging.getLogger(__name__)
 
@@ -458,8 +459,8 @@ class XMPPBackend(ErrBot):
         # MUC subject events
         self.conn.add_event_handler("groupchat_subject", self.chat_topic)
         self._room_topics = {}
-        self.md_xhtml = xhtml()
-        self.md_text = text()
+        self.md_xhtml = ConverterPool(xhtml)
+        self.md_text = ConverterPool(text)
 
     def create_connection(self) -> XMPPConnection:
         return XMPPConnection(
@@ -577,14 +578,18 @@ class XMPPBackend(ErrBot):
 
         log.debug("send_message to %s", msg.to)
 
-        # We need to unescape the unicode characters (not the markup incompatible ones)
-        mhtml = (
-            xhtmlim.unescape(self.md_xhtml.convert(msg.body)) if self.xhtmlim else None
-        )
+        with span("markdown"):
+            # We need to unescape the unicode characters (not the markup incompatible ones)
+            mhtml = (
+                xhtmlim.unescape(self.md_xhtml.convert(msg.body))
+                if self.xhtmlim
+                else None
+            )
+            mbody = self.md_text.convert(msg.body)
 
         self.conn.client.send_message(
             mto=str(msg.to),
-            mbody=self.md_text.convert(msg.body),
+            mbody=mbody,
             mhtml=mhtml,
             mtype="chat" if msg.is_direct else "groupchat",
         )
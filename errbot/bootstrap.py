@@ -57,6 +57,42 @@ def bot_config_defaults(config: object) -> None:
         config.BOT_ASYNC = True
     if not hasattr(config, "BOT_ASYNC_POOLSIZE"):
         config.BOT_ASYNC_POOLSIZE = 10
+    if not hasattr(config, "BOT_ASYNC_USER_WEIGHTS"):
+        config.BOT_ASYNC_USER_WEIGHTS = {}
+    if not hasattr(config, "BOT_ASYNC_MAX_PER_USER"):
+        config.BOT_ASYNC_MAX_PER_USER = None
+    if not hasattr(config, "BOT_ASYNC_MAX_PER_ROOM"):
+        config.BOT_ASYNC_MAX_PER_ROOM = None
+    if not hasattr(config, "BOT_ASYNC_MAX_PER_COMMAND"):
+        config.BOT_ASYNC_MAX_PER_COMMAND = None
+    if not hasattr(config, "BOT_ASYNC_QUEUE_SIZE"):
+        config.BOT_ASYNC_QUEUE_SIZE = None
+    if not hasattr(config, "BOT_ASYNC_QUEUE_OVERFLOW"):
+        config.BOT_ASYNC_QUEUE_OVERFLOW = "reject"
+    if not hasattr(config, "BOT_METRICS"):
+        config.BOT_METRICS = True
+    if not hasattr(config, "BOT_SLOW_CALLBACK_THRESHOLD"):
+        config.BOT_SLOW_CALLBACK_THRESHOLD = 5.0
+    if not hasattr(config, "BOT_PARALLEL_CALLBACKS"):
+        config.BOT_PARALLEL_CALLBACKS = False
+    if not hasattr(config, "BOT_CALLBACK_POOLSIZE"):
+        config.BOT_CALLBACK_POOLSIZE = 4
+    if not hasattr(config, "BOT_TRACE_USERS"):
+        config.BOT_TRACE_USERS = ()
+    if not hasattr(config, "BOT_TRACE_ROOMS"):
+        config.BOT_TRACE_ROOMS = ()
+    if not hasattr(config, "BOT_TRACE_SAMPLE_RATE"):
+        config.BOT_TRACE_SAMPLE_RATE = 0.0
+    if not hasattr(config, "BOT_TRACE_BUFFER_SIZE"):
+        config.BOT_TRACE_BUFFER_SIZE = 1000
+    if not hasattr(config, "BOT_TRACE_EXPORT"):
+        config.BOT_TRACE_EXPORT = False
+    if not hasattr(config, "BOT_HISTORY_LENGTH"):
+        config.BOT_HISTORY_LENGTH = 10
+    if not hasattr(config, "BOT_HISTORY_USERS"):
+        config.BOT_HISTORY_USERS = 1000
+    if not hasattr(config, "BOT_HISTORY_PERSIST"):
+        config.BOT_HISTORY_PERSIST = False
     if not hasattr(config, "CHATROOM_PRESENCE"):
         config.CHATROOM_PRESENCE = ()
     if not hasattr(config, "CHATROOM_RELAY"):
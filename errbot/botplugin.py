@@ -1,8 +1,11 @@
+import inspect
 import logging
 import re
 import shlex
+from concurrent.futures import Future
 from io import IOBase
 from threading import Timer, current_thread
+from time import monotonic
 from types import ModuleType
 from typing import Any, Callable, List, Mapping, Optional, Sequence, Tuple
 
@@ -17,6 +20,7 @@ from errbot.backends.base import (
     Stream,
 )
 
+from .metrics import POLLER_LAG
 from .storage import StoreMixin, StoreNotOpenError
 
 log = logging.getLogger(__name__)
@@ -302,6 +306,7 @@ class BotPluginBase(StoreMixin):
                 "kwargs": kwargs,
             },
         )
+        t.scheduled_at = monotonic() + interval  # to measure the lag of the poller
         self.current_timers.append(t)  # save the timer to be able to kill it
         t.name = f"Poller thread for {type(method.__self__).__name__}"
         t.daemon = True  # so it is not locking on exit
@@ -316,20 +321,37 @@ class BotPluginBase(StoreMixin):
         kwargs: Mapping = None,
     ) -> None:
         previous_timer = current_thread()
+        scheduled_at = getattr(previous_timer, "scheduled_at", None)
+        if scheduled_at is not None:
+            self._bot.metrics.observe(
+                POLLER_LAG, monotonic() - scheduled_at, plugin=self.name
+            )
         if previous_timer in self.current_timers:
             log.debug("Previous timer found and removed")
             self.current_timers.remove(previous_timer)
 
         if (method, args, kwargs) in self.current_pollers:
+            if times is not None:
+                times -= 1
+
+            if inspect.iscoroutinefunction(method):
+                # the timer thread does not wait for the coroutine, the next poll is
+                # programmed when it is done so the polls still do not overlap.
+                def next_poll(future: Future) -> None:
+                    if not future.cancelled() and future.exception() is not None:
+                        log.error("A poller crashed", exc_info=future.exception())
+                    self.program_next_poll(interval, method, times, args, kwargs)
+
+                future = self._bot.event_loop.submit(method(*args, **kwargs))
+                future.add_done_callback(next_poll)
+                return
+
             # noinspection PyBroadException
             try:
                 method(*args, **kwargs)
             except Exception:
                 log.exception("A poller crashed")
 
-            if times is not None:
-                times -= 1
-
             self.program_next_poll(interval, method, times, args, kwargs)
 
     def create_dynamic_plugin(
@@ -148,6 +148,78 @@ SENTRY_OPTIONS = {}
 # Size of the thread pool for the asynchronous mode.
 # BOT_ASYNC_POOLSIZE = 10
 
+# In asynchronous mode, the commands waiting for a thread are queued per user
+# and the users are served in round-robin so a single user flooding the bot
+# cannot starve the others. Give some users more turns per round with:
+# BOT_ASYNC_USER_WEIGHTS = {"gbin@localhost": 2}
+#
+# Maximum number of commands executing at the same time for a single user,
+# a single room and a single command. None means unlimited.
+# BOT_ASYNC_MAX_PER_USER = None
+# BOT_ASYNC_MAX_PER_ROOM = None
+# BOT_ASYNC_MAX_PER_COMMAND = None
+
+# Maximum number of commands waiting for a thread, None means unlimited.
+# Bound it to keep a burst of messages (like the ones replayed by a backend
+# after a reconnection) from piling up in memory.
+# BOT_ASYNC_QUEUE_SIZE = None
+#
+# What to do with the commands in excess when the queue is full:
+# "reject" refuses the new command and tells the user,
+# "drop_oldest" drops the oldest waiting command and tells its user,
+# "coalesce" merges the new command with an identical one (same user, command
+# and arguments) already waiting, or refuses it if there is none.
+# BOT_ASYNC_QUEUE_OVERFLOW = "reject"
+
+# Record the execution time of the commands, filters, callbacks and sends.
+# They are reported by !status metrics and the /metrics URL of the Webserver
+# plugin. The overhead is negligible but it can be turned off here.
+# Like any webhook, /metrics (and /traces, see BOT_TRACE_EXPORT) is served
+# without authentication to whoever can reach the Webserver plugin: bind it to
+# localhost or put it behind an authenticating proxy.
+# BOT_METRICS = True
+
+# The plugin callbacks (callback_message etc.) are executed one after the other
+# on the thread receiving the messages so a slow one delays all the others.
+# Log where a callback is when it has been running for more than this number of
+# seconds, None or 0 disables the watchdog. See also !status callbacks.
+# BOT_SLOW_CALLBACK_THRESHOLD = 5.0
+
+# Execute the callbacks of the plugins declaring themselves order-independent
+# (ParallelCallbacks = true in the [Core] section of their .plug file) on a
+# separate thread pool, concurrently with the other plugins, so the thread of
+# the backend does not wait for them. The plugins explicitly listed in
+# PLUGINS_CALLBACK_ORDER are always called in order.
+# BOT_PARALLEL_CALLBACKS = False
+# BOT_CALLBACK_POOLSIZE = 4
+
+# Log how the messages of these users and rooms are dispatched (prefixes,
+# matched commands, arguments...) at INFO level, to debug a problem without
+# running the whole bot at DEBUG level. Messages are only traced for everybody
+# when the errbot.tracing logger is at DEBUG level.
+# BOT_TRACE_USERS = ("@gbin",)
+# BOT_TRACE_ROOMS = ("#errbotio",)
+
+# Record the steps of the dispatch of the messages of BOT_TRACE_USERS and
+# BOT_TRACE_ROOMS plus this fraction of all the messages (0.01 is 1%) as spans:
+# receive, process_message, callback_message, filters, queue, command, template,
+# send and markdown. The last BOT_TRACE_BUFFER_SIZE spans are kept in memory
+# and, if BOT_TRACE_EXPORT is set, exported in the OpenTelemetry (OTLP) JSON
+# format by the /traces URL of the Webserver plugin. The spans do not carry the
+# users but they tell which commands ran and when, and the URL is not
+# authenticated so it is off by default.
+# BOT_TRACE_SAMPLE_RATE = 0.0
+# BOT_TRACE_BUFFER_SIZE = 1000
+# BOT_TRACE_EXPORT = False
+
+# The history of the commands recalled by !! and !N keeps the last
+# BOT_HISTORY_LENGTH commands of the BOT_HISTORY_USERS users who talked to the
+# bot the most recently. Set BOT_HISTORY_PERSIST to True to keep it across
+# restarts, in the storage of the backend.
+# BOT_HISTORY_LENGTH = 10
+# BOT_HISTORY_USERS = 1000
+# BOT_HISTORY_PERSIST = False
+
 ##########################################################################
 # Account and chatroom (MUC) configuration                               #
 ##########################################################################
@@ -327,7 +399,8 @@ REVERSE_CHATROOM_RELAY = {}
 
 # Define the maximum length a single message may be. If a plugin tries to
 # send a message longer than this length, it will be broken up into multiple
-# shorter messages that do fit.
+# shorter messages that do fit, between paragraphs, list items or table rows when
+# possible.
 # MESSAGE_SIZE_LIMIT = 10000
 
 # XMPP TLS certificate verification. In order to validate offered certificates,
@@ -21,20 +21,51 @@ from collections.abc import Mapping
 from datetime import datetime
 from multiprocessing.pool import ThreadPool
 from threading import RLock
+from time import perf_counter
 from typing import Any, Callable, List, Optional, Tuple
 
 from errbot import CommandError
 from errbot.flow import FlowExecutor, FlowRoot
 
 from .backends.base import Backend, Identifier, Message, Presence, Room
+from .dispatch import CommandRegistry
+from .eventloop import EventLoopThread
+from .executor import OVERFLOW_DROP_OLDEST, ExecutionBarrier, FairScheduler, Job
+from .history import CommandHistory
+from .metrics import (
+    CALLBACK_DURATION,
+    COMMAND_DURATION,
+    COMMAND_ERRORS,
+    FILTERS_DURATION,
+    MESSAGES_RECEIVED,
+    MESSAGES_SENT,
+    SEND_DURATION,
+    MetricsRegistry,
+    TimedStoragePlugin,
+)
+from .rendering.splitter import split_markdown
 from .storage import StoreMixin
 from .streaming import Tee
 from .templating import tenv
-from .utils import split_string_after
+from .tracing import (
+    DispatchTrace,
+    DispatchTracer,
+    Span,
+    activate,
+    current_trace,
+    span,
+    start_span,
+)
+from .watchdog import CallbackWatchdog
 
 log = logging.getLogger(__name__)
 
 
+def is_coroutine_command(func: Callable) -> bool:
+    """Returns True if the command is defined with async def and needs to run on the event loop."""
+    return inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
+
+
 # noinspection PyAbstractClass
 class ErrBot(Backend, StoreMixin):
     """ErrBot is the layer taking care of commands management and dispatching."""
@@ -55,9 +86,22 @@ class ErrBot(Backend, StoreMixin):
             log.debug(
                 "created a thread pool of size %d.", bot_config.BOT_ASYNC_POOLSIZE
             )
-        self.commands = {}  # the dynamically populated list of commands available on the bot
-        self.re_commands = {}  # the dynamically populated list of regex-based commands available on the bot
-        self.command_filters = []  # the dynamically populated list of filters
+            self.command_scheduler = FairScheduler(
+                self.thread_pool,
+                bot_config.BOT_ASYNC_POOLSIZE,
+                weights=bot_config.BOT_ASYNC_USER_WEIGHTS,
+                max_per_user=bot_config.BOT_ASYNC_MAX_PER_USER,
+                max_per_room=bot_config.BOT_ASYNC_MAX_PER_ROOM,
+                max_per_command=bot_config.BOT_ASYNC_MAX_PER_COMMAND,
+                max_queued=bot_config.BOT_ASYNC_QUEUE_SIZE,
+                overflow=bot_config.BOT_ASYNC_QUEUE_OVERFLOW,
+                on_shed=self._command_shed,
+            )
+        self.cmd_history = CommandHistory(  # this is a per user history
+            bot_config.BOT_HISTORY_LENGTH, bot_config.BOT_HISTORY_USERS
+        )
+        # the commands, regex commands and command filters, replaced on every change
+        self._registry = CommandRegistry()
         self.MSG_UNKNOWN_COMMAND = (
             'Unknown command: "%(command)s". '
             'Type "' + bot_config.BOT_PREFIX + 'help" for available commands.'
@@ -73,6 +117,23 @@ class ErrBot(Backend, StoreMixin):
         self.storage_plugin = None
         self._plugin_errors_during_startup = None
         self.flow_executor = FlowExecutor(self)
+        self.event_loop = EventLoopThread()  # runs the async def commands & callbacks
+        self._execution_barrier = ExecutionBarrier()  # isolates the admin commands
+        self.metrics = MetricsRegistry(enabled=bot_config.BOT_METRICS)
+        self.metrics.register_collector(self._collect_metrics)
+        self.callback_watchdog = CallbackWatchdog(
+            bot_config.BOT_SLOW_CALLBACK_THRESHOLD
+        )
+        self.tracer = DispatchTracer(
+            bot_config.BOT_TRACE_USERS,
+            bot_config.BOT_TRACE_ROOMS,
+            bot_config.BOT_TRACE_SAMPLE_RATE,
+            bot_config.BOT_TRACE_BUFFER_SIZE,
+        )
+        self.callback_pool = None
+        if bot_config.BOT_PARALLEL_CALLBACKS:
+            self.callback_pool = ThreadPool(bot_config.BOT_CALLBACK_POOLSIZE)
+            atexit.register(self.callback_pool.close)
         self._gbl = RLock()  # this protects internal structures of this class
         self.set_message_size_limit()
 
@@ -80,6 +141,13 @@ class ErrBot(Backend, StoreMixin):
     def message_size_limit(self) -> int:
         return self.bot_config.MESSAGE_SIZE_LIMIT
 
+    def message_size(self, text: str) -> int:
+        """
+        Returns the size of text as counted against the message size limit.
+        Override it in the backends with a limit in bytes instead of characters.
+        """
+        return len(text)
+
     def set_message_size_limit(
         self, limit: int = 10000, hard_limit: int = 10000
     ) -> None:
@@ -110,8 +178,52 @@ class ErrBot(Backend, StoreMixin):
 
     def attach_storage_plugin(self, storage_plugin) -> None:
         # the storage_plugin is needed by the plugins
+        if self.metrics.enabled:
+            storage_plugin = TimedStoragePlugin(storage_plugin, self.metrics)
         self.storage_plugin = storage_plugin
 
+    def _collect_metrics(self):
+        """Reports the state of the executors and of the connection to the metrics."""
+        backend = {"backend": self.mode}
+        scheduler = getattr(self, "command_scheduler", None)
+        if scheduler is not None:
+            yield (
+                "errbot_command_queue_depth",
+                "gauge",
+                "Commands waiting for a thread of the pool.",
+                [({}, scheduler.queued)],
+            )
+            yield (
+                "errbot_command_queue_oldest_wait_seconds",
+                "gauge",
+                "Time the oldest queued command has been waiting for.",
+                [({}, scheduler.oldest_wait)],
+            )
+            yield (
+                "errbot_thread_pool_active_workers",
+                "gauge",
+                "Threads of the pool executing a command.",
+                [({}, scheduler.running)],
+            )
+            yield (
+                "errbot_thread_pool_size",
+                "gauge",
+                "Threads in the pool.",
+                [({}, self.bot_config.BOT_ASYNC_POOLSIZE)],
+            )
+        yield (
+            "errbot_flows_in_flight",
+            "gauge",
+            "Conversation flows in progress.",
+            [({}, len(self.flow_executor.in_flight))],
+        )
+        yield (
+            "errbot_backend_reconnections",
+            "gauge",
+            "Consecutive failed (re)connections to the backend.",
+            [(backend, self._reconnection_count)],
+        )
+
     def initialize_backend_storage(self) -> None:
         """
         Initialize storage for the backend to use.
@@ -120,18 +232,32 @@ class ErrBot(Backend, StoreMixin):
         assert self.plugin_manager is not None
         assert self.storage_plugin is not None
         self.open_storage(self.storage_plugin, f"{self.mode}_backend")
+        if self.bot_config.BOT_HISTORY_PERSIST:
+            self.cmd_history.load(self.get("cmd_history", {}))
 
     @property
-    def all_commands(self) -> dict:
-        """Return both commands and re_commands together."""
-        with self._gbl:
-            newd = dict(**self.commands)
-            newd.update(self.re_commands)
-        return newd
+    def commands(self) -> Mapping[str, Callable]:
+        """The commands available on the bot, a read-only snapshot."""
+        return self._registry.commands
+
+    @property
+    def re_commands(self) -> Mapping[str, Callable]:
+        """The regex-based commands available on the bot, a read-only snapshot."""
+        return self._registry.re_commands
+
+    @property
+    def command_filters(self) -> Tuple[Callable, ...]:
+        """The command filters, in order, a read-only snapshot."""
+        return self._registry.command_filters
+
+    @property
+    def all_commands(self) -> Mapping[str, Callable]:
+        """Return both commands and re_commands together, a read-only snapshot."""
+        return self._registry.all_commands
 
     def _dispatch_to_plugins(self, method: Callable, *args, **kwargs) -> None:
         """
-        Dispatch the given method to all active plugins.
+        Dispatch the given method to all active plugins implementing it.
 
         Will catch and log any exceptions that occur.
 
@@ -139,14 +265,49 @@ class ErrBot(Backend, StoreMixin):
         :param *args: Passed to the callback function.
         :param **kwargs: Passed to the callback function.
         """
-        for plugin in self.plugin_manager.get_all_active_plugins():
+        ordered = []
+        for plugin in self.plugin_manager.get_subscribers(method):
             plugin_name = plugin.name
             log.debug("Triggering %s on %s.", method, plugin_name)
-            # noinspection PyBroadException
-            try:
-                getattr(plugin, method)(*args, **kwargs)
-            except Exception:
-                log.exception("%s on %s crashed.", method, plugin_name)
+            callback = getattr(plugin, method)
+            if inspect.iscoroutinefunction(callback):
+                self.event_loop.schedule(
+                    callback(*args, **kwargs), f"{method} on {plugin_name}"
+                )
+            elif (
+                self.callback_pool is not None
+                and self.plugin_manager.has_parallel_callbacks(plugin_name)
+            ):
+                # order-independent plugins don't hold the thread of the backend.
+                self.callback_pool.apply_async(
+                    self._run_callback_safely,
+                    (plugin_name, method, callback) + args,
+                    kwargs,
+                )
+            else:
+                ordered.append((plugin_name, callback))
+        for plugin_name, callback in ordered:
+            self._run_callback_safely(plugin_name, method, callback, *args, **kwargs)
+
+    def _run_callback_safely(
+        self, plugin_name: str, method: str, callback: Callable, *args, **kwargs
+    ) -> None:
+        """Same as _run_callback but logs the crashes instead of raising."""
+        # noinspection PyBroadException
+        try:
+            self._run_callback(plugin_name, method, callback, *args, **kwargs)
+        except Exception:
+            log.exception("%s on %s crashed.", method, plugin_name)
+
+    def _run_callback(
+        self, plugin_name: str, method: str, callback: Callable, *args, **kwargs
+    ) -> None:
+        """Run a plugin callback, timed and under the eye of the watchdog."""
+        with self.callback_watchdog.watch(plugin_name, method):
+            with self.metrics.timer(
+                CALLBACK_DURATION, plugin=plugin_name, callback=method
+            ):
+                callback(*args, **kwargs)
 
     def send(
         self,
@@ -208,11 +369,13 @@ class ErrBot(Backend, StoreMixin):
         return self.send(identifier, text, in_reply_to, groupchat_nick_reply)
 
     def split_and_send_message(self, msg: Message) -> None:
-        for part in split_string_after(msg.body, self.message_size_limit):
-            partial_message = msg.clone()
-            partial_message.body = part
-            partial_message.partial = True
-            self.send_message(partial_message)
+        with self.metrics.timer(SEND_DURATION), span("send"):
+            parts = split_markdown(msg.body, self.message_size_limit, self.message_size)
+            for part in parts:
+                partial_message = msg.clone()
+                partial_message.body = part
+                partial_message.partial = True
+                self.send_message(partial_message)
 
     def send_message(self, msg: Message) -> None:
         """
@@ -221,10 +384,18 @@ class ErrBot(Backend, StoreMixin):
         :param msg: the message to send.
         :return: None
         """
-        for bot in self.plugin_manager.get_all_active_plugins():
+        self.metrics.inc(MESSAGES_SENT, backend=self.mode)
+        for bot in self.plugin_manager.get_subscribers("callback_botmessage"):
+            if inspect.iscoroutinefunction(bot.callback_botmessage):
+                self.event_loop.schedule(
+                    bot.callback_botmessage(msg), "A callback_botmessage handler"
+                )
+                continue
             # noinspection PyBroadException
             try:
-                bot.callback_botmessage(msg)
+                self._run_callback(
+                    bot.name, "callback_botmessage", bot.callback_botmessage, msg
+                )
             except Exception:
                 log.exception("Crash in a callback_botmessage handler")
 
@@ -269,7 +440,7 @@ class ErrBot(Backend, StoreMixin):
             )
 
         username = msg.frm.person
-        user_cmd_history = self.cmd_history[username]
+        registry = self._registry
 
         if msg.delayed:
             log.debug("Message from history, ignore it.")
@@ -279,9 +450,9 @@ class ErrBot(Backend, StoreMixin):
             log.debug("Ignoring message from self.")
             return False
 
-        log.debug("*** frm = %s", frm)
-        log.debug("*** username = %s", username)
-        log.debug("*** text = %s", text)
+        trace = current_trace()
+        if trace:
+            trace.log('Received "%s" from %s (%s).', text, frm, username)
 
         prefixed = False  # Keeps track whether text was prefixed with a bot prefix
         only_check_re_command = (
@@ -303,7 +474,8 @@ class ErrBot(Backend, StoreMixin):
                 length = len(prefix)
                 if tomatch.startswith(prefix) and length > longest:
                     longest = length
-            log.debug('Called with alternate prefix "%s"', text[:longest])
+            if trace:
+                trace.log('Called with alternate prefix "%s".', text[:longest])
             text = text[longest:]
 
             # Now also remove the separator from the text
@@ -314,10 +486,11 @@ class ErrBot(Backend, StoreMixin):
                 if text[:length] == sep:
                     text = text[length:]
         elif msg.is_direct and self.bot_config.BOT_PREFIX_OPTIONAL_ON_CHAT:
-            log.debug(
-                'Assuming "%s" to be a command because BOT_PREFIX_OPTIONAL_ON_CHAT is True',
-                text,
-            )
+            if trace:
+                trace.log(
+                    'Assuming "%s" to be a command because BOT_PREFIX_OPTIONAL_ON_CHAT is True.',
+                    text,
+                )
         elif not text.startswith(self.bot_config.BOT_PREFIX):
             only_check_re_command = True
         if text.startswith(self.bot_config.BOT_PREFIX):
@@ -329,24 +502,18 @@ class ErrBot(Backend, StoreMixin):
         command = None
         args = ""
         if not only_check_re_command:
-            first = True
-            i = len(text.split())
-            while cmd is None:
-                # maxsplit so we can preserve linebreaks and other whitespace in args
-                text_split = text.split(maxsplit=i)
-                command = "_".join(text_split[:i])
-
-                with self._gbl:
-                    if command in self.commands:
-                        cmd = command
-                        if not first:
-                            args = text_split[-1]
-                    else:
-                        i -= 1
-                        first = False
-                if i <= 0:
-                    break
+            words = text.split()
+            i = registry.trie.longest_prefix(words)
+            if i:
+                cmd = command = "_".join(words[:i])
+                if i < len(words):
+                    # maxsplit so we can preserve linebreaks and other whitespace in args
+                    args = text.split(maxsplit=i)[-1]
+            else:
+                command = words[0] if words else ""
 
+            # only looked up: the chat must not evict the histories of the commands.
+            user_cmd_history = self.cmd_history.get(username) or ()
             if (
                 command == self.bot_config.BOT_PREFIX
             ):  # we did "!!" so recall the last command
@@ -364,45 +531,28 @@ class ErrBot(Backend, StoreMixin):
         # Try to match one of the regex commands if the regular commands produced no match
         matched_on_re_command = False
         if not cmd:
-            with self._gbl:
-                if prefixed or (
-                    msg.is_direct and self.bot_config.BOT_PREFIX_OPTIONAL_ON_CHAT
-                ):
-                    commands = dict(self.re_commands)
-                else:
-                    commands = {
-                        k: self.re_commands[k]
-                        for k in self.re_commands
-                        if not self.re_commands[k]._err_command_prefix_required
-                    }
-
-            for name, func in commands.items():
-                if func._err_command_matchall:
-                    match = list(func._err_command_re_pattern.finditer(text))
-                else:
-                    match = func._err_command_re_pattern.search(text)
-                if match:
-                    log.debug(
+            commands = registry.re_commands_index(
+                prefixed
+                or (msg.is_direct and self.bot_config.BOT_PREFIX_OPTIONAL_ON_CHAT)
+            )
+            for name, func, match in commands.matches(text):
+                if trace:
+                    trace.log(
                         'Matching "%s" against "%s" produced a match.',
                         text,
                         func._err_command_re_pattern.pattern,
                     )
-                    matched_on_re_command = True
-                    self._process_command(msg, name, text, match)
-                else:
-                    log.debug(
-                        'Matching "%s" against "%s" produced no match.',
-                        text,
-                        func._err_command_re_pattern.pattern,
-                    )
+                matched_on_re_command = True
+                self._process_command(msg, name, text, match, trace)
         if matched_on_re_command:
             return True
 
         if cmd:
-            self._process_command(msg, cmd, args, match=None)
+            self._process_command(msg, cmd, args, None, trace)
         elif not only_check_re_command:
-            log.debug("Command not found")
-            for cmd_filter in self.command_filters:
+            if trace:
+                trace.log('Command "%s" not found.', command)
+            for cmd_filter in registry.command_filters:
                 if getattr(cmd_filter, "catch_unprocessed", False):
                     try:
                         reply = cmd_filter(msg, cmd, args, False, emptycmd=True)
@@ -416,11 +566,15 @@ class ErrBot(Backend, StoreMixin):
     def _process_command_filters(
         self, msg: Message, cmd, args, dry_run: bool = False
     ) -> Tuple[Optional[Message], Optional[str], Optional[Tuple]]:
+        chain = self._registry.filter_chain(cmd)
+        if not chain:
+            return msg, cmd, args
         try:
-            for cmd_filter in self.command_filters:
-                msg, cmd, args = cmd_filter(msg, cmd, args, dry_run)
-                if msg is None:
-                    return None, None, None
+            with self.metrics.timer(FILTERS_DURATION), span("filters", command=cmd):
+                for cmd_filter in chain:
+                    msg, cmd, args = cmd_filter(msg, cmd, args, dry_run)
+                    if msg is None:
+                        return None, None, None
             return msg, cmd, args
         except Exception:
             log.exception(
@@ -428,7 +582,9 @@ class ErrBot(Backend, StoreMixin):
             )
             return None, None, None
 
-    def _process_command(self, msg, cmd, args, match):
+    def _process_command(
+        self, msg, cmd, args, match, trace: Optional[DispatchTrace] = None
+    ):
         """Process and execute a bot command"""
 
         # first it must go through the command filters
@@ -439,28 +595,22 @@ class ErrBot(Backend, StoreMixin):
 
         frm = msg.frm
         username = frm.person
-        user_cmd_history = self.cmd_history[username]
-
-        log.info(f'Processing command "{cmd}" with parameters "{args}" from {frm}')
 
-        if (cmd, args) in user_cmd_history:
-            user_cmd_history.remove((cmd, args))  # Avoids duplicate history items
+        log.info('Processing command "%s" with parameters "%s" from %s', cmd, args, frm)
+        if trace:
+            trace.log('Processing command "%s" with parameters "%s".', cmd, args)
 
-        with self._gbl:
-            f = self.re_commands[cmd] if match else self.commands[cmd]
-
-        if f._err_command_admin_only and self.bot_config.BOT_ASYNC:
-            # If it is an admin command, wait until the queue is completely depleted so
-            # we don't have strange concurrency issues on load/unload/updates etc...
-            self.thread_pool.close()
-            self.thread_pool.join()
-            self.thread_pool = ThreadPool(self.bot_config.BOT_ASYNC_POOLSIZE)
-            atexit.register(self.thread_pool.close)
+        f = self.re_commands[cmd] if match else self.commands[cmd]
 
         if f._err_command_historize:
-            user_cmd_history.append(
-                (cmd, args)
-            )  # add it to the history only if it is authorized to be so
+            # add it to the history only if it is authorized to be so, once.
+            self.cmd_history[username].append((cmd, args))
+        else:
+            user_cmd_history = self.cmd_history.get(username)
+            if user_cmd_history is not None:
+                user_cmd_history.discard((cmd, args))
+
+        duplicate_key = (username, cmd, args)
 
         # Don't check for None here as None can be a valid argument to str.split.
         # '' was chosen as default argument because this isn't a valid argument to str.split()
@@ -478,30 +628,78 @@ class ErrBot(Backend, StoreMixin):
                 )
                 return
 
-        if self.bot_config.BOT_ASYNC:
-            result = self.thread_pool.apply_async(
-                self._execute_and_send,
-                [],
-                {
-                    "cmd": cmd,
-                    "args": args,
-                    "match": match,
-                    "msg": msg,
-                    "template_name": f._err_command_template,
-                },
+        execution = {
+            "cmd": cmd,
+            "args": args,
+            "match": match,
+            "msg": msg,
+            "template_name": f._err_command_template,
+        }
+        # Admin commands are executed exclusively so we don't have strange concurrency
+        # issues on load/unload/updates etc... but the caller does not wait for them.
+        if self.bot_config.BOT_ASYNC and is_coroutine_command(f):
+            self.event_loop.submit(
+                self._execute_async_behind_barrier(
+                    f._err_command_admin_only, **execution
+                )
             )
-            if f._err_command_admin_only:
-                # Again, if it is an admin command, wait until the queue is completely
-                # depleted so we don't have strange concurrency issues.
-                result.wait()
-        else:
-            self._execute_and_send(
-                cmd=cmd,
-                args=args,
-                match=match,
-                msg=msg,
-                template_name=f._err_command_template,
+        elif self.bot_config.BOT_ASYNC:
+            self.command_scheduler.submit(
+                self._execute_behind_barrier,
+                dict(
+                    execution,
+                    exclusive=f._err_command_admin_only,
+                    queued=start_span("queue", command=cmd),
+                ),
+                user=username,
+                room=str(frm.room) if msg.is_group else None,
+                command=cmd,
+                duplicate_key=duplicate_key,
             )
+        else:
+            self._execute_and_send(**execution)
+
+    def _command_shed(self, job: Job, policy: str) -> None:
+        """Tells the user their command will not be executed because the bot is overloaded."""
+        cmd, msg = job.kwargs["cmd"], job.kwargs["msg"]
+        if policy == OVERFLOW_DROP_OLDEST:
+            reply = f"Sorry, I am overloaded and had to drop your command {cmd}."
+        else:
+            reply = f"Sorry, I am overloaded, try {cmd} again later."
+        self.send_simple_reply(msg, reply)
+
+    def _execute_behind_barrier(
+        self, exclusive: bool, queued: Optional[Span] = None, **execution
+    ) -> None:
+        """Execute a command from the thread pool, alone if it is exclusive.
+
+        :param queued: the span timing the wait in the queue if the message is traced.
+        """
+        if queued is not None:
+            queued.finish()
+            with activate(queued.parent):
+                self._execute_behind_barrier(exclusive, **execution)
+        elif exclusive:
+            with self._execution_barrier.exclusive():
+                self._execute_and_send(**execution)
+        else:
+            with self._execution_barrier.shared():
+                self._execute_and_send(**execution)
+
+    async def _execute_async_behind_barrier(self, exclusive: bool, **execution) -> None:
+        """Execute an async def command on the event loop, alone if it is exclusive."""
+        barrier = self._execution_barrier
+        if exclusive:
+            acquire = barrier.acquire_exclusive_async
+            release = barrier.release_exclusive
+        else:
+            acquire, release = barrier.acquire_shared_async, barrier.release_shared
+        # waits on the loop, without holding a thread.
+        await acquire()
+        try:
+            await self._execute_and_send_async(**execution)
+        finally:
+            release()
 
     @staticmethod
     def process_template(template_name, template_parameters):
@@ -509,13 +707,58 @@ class ErrBot(Backend, StoreMixin):
         # The template needs to be set and the answer from the user command needs to be a mapping
         # If not just convert the answer to string.
         if template_name and isinstance(template_parameters, Mapping):
-            return (
-                tenv().get_template(template_name + ".md").render(**template_parameters)
-            )
+            with span("template", template=template_name):
+                return (
+                    tenv()
+                    .get_template(template_name + ".md")
+                    .render(**template_parameters)
+                )
 
         # Reply should be all text at this point (See https://github.com/errbotio/errbot/issues/96)
         return str(template_parameters)
 
+    def _reply_diversion(self, cmd) -> Tuple[bool, bool]:
+        """Returns whether the replies to the command go in private and whether they are threaded."""
+        private = (
+            "ALL_COMMANDS" in self.bot_config.DIVERT_TO_PRIVATE
+            or cmd in self.bot_config.DIVERT_TO_PRIVATE
+        )
+        threaded = (
+            "ALL_COMMANDS" in self.bot_config.DIVERT_TO_THREAD
+            or cmd in self.bot_config.DIVERT_TO_THREAD
+        )
+        return private, threaded
+
+    def _command_to_execute(self, cmd, match, msg) -> Optional[Callable]:
+        """Returns the method implementing the command or None if it must not run in this context."""
+        commands = self.re_commands if match else self.commands
+        method = commands[cmd]
+        # first check if we need to reattach a flow context
+        flow, _ = self.flow_executor.check_inflight_flow_triggered(cmd, msg.frm)
+        if flow:
+            log.debug("Reattach context from flow %s to the message", flow._root.name)
+            msg.ctx = flow.ctx
+        elif method._err_command_flow_only:
+            # check if it is a flow_only command but we are not in a flow.
+            log.debug(
+                "%s is tagged flow_only and we are not in a flow. Ignores the command.",
+                cmd,
+            )
+            return None
+        return method
+
+    def _command_error_reply(self, error: Exception, msg: Message) -> str:
+        """Returns the reply reporting the error raised by a command. Must be called from the except block."""
+        if isinstance(error, CommandError):
+            if error.template:
+                return self.process_template(error.template, error.reason)
+            return error.reason
+        tb = traceback.format_exc()
+        log.exception(
+            f'An error happened while processing a message ("{msg.body}"): {tb}"'
+        )
+        return self.MSG_ERROR_OCCURRED + f":\n{error}"
+
     def _execute_and_send(self, cmd, args, match, msg, template_name=None):
         """Execute a bot command and send output back to the caller
 
@@ -527,36 +770,38 @@ class ErrBot(Backend, StoreMixin):
             the markdown output, if any
 
         """
-        private = (
-            "ALL_COMMANDS" in self.bot_config.DIVERT_TO_PRIVATE
-            or cmd in self.bot_config.DIVERT_TO_PRIVATE
-        )
-        threaded = (
-            "ALL_COMMANDS" in self.bot_config.DIVERT_TO_THREAD
-            or cmd in self.bot_config.DIVERT_TO_THREAD
-        )
         commands = self.re_commands if match else self.commands
-        try:
-            with self._gbl:
-                method = commands[cmd]
-            # first check if we need to reattach a flow context
-            flow, _ = self.flow_executor.check_inflight_flow_triggered(cmd, msg.frm)
-            if flow:
-                log.debug(
-                    "Reattach context from flow %s to the message", flow._root.name
-                )
-                msg.ctx = flow.ctx
-            elif method._err_command_flow_only:
-                # check if it is a flow_only command but we are not in a flow.
-                log.debug(
-                    "%s is tagged flow_only and we are not in a flow. Ignores the command.",
-                    cmd,
-                )
-                return
+        method = commands.get(cmd)
+        if method is not None and is_coroutine_command(method):
+            # An async def command executed synchronously, run it on the loop and wait for it.
+            self.event_loop.submit(
+                self._execute_and_send_async(cmd, args, match, msg, template_name)
+            ).result()
+            return
 
-            if inspect.isgeneratorfunction(method):
-                replies = method(msg, match) if match else method(msg, args)
-                for reply in replies:
+        private, threaded = self._reply_diversion(cmd)
+        started = perf_counter()
+        with self.flow_executor.hold_flows():  # flow hints after the replies
+            try:
+                method = self._command_to_execute(cmd, match, msg)
+                if method is None:
+                    return
+
+                if inspect.isgeneratorfunction(method):
+                    replies = method(msg, match) if match else method(msg, args)
+                    # the replies are sent while the command runs, their spans nest.
+                    with span("command", command=cmd):
+                        for reply in replies:
+                            if reply:
+                                self.send_simple_reply(
+                                    msg,
+                                    self.process_template(template_name, reply),
+                                    private,
+                                    threaded,
+                                )
+                else:
+                    with span("command", command=cmd):
+                        reply = method(msg, match) if match else method(msg, args)
                     if reply:
                         self.send_simple_reply(
                             msg,
@@ -564,33 +809,77 @@ class ErrBot(Backend, StoreMixin):
                             private,
                             threaded,
                         )
-            else:
-                reply = method(msg, match) if match else method(msg, args)
-                if reply:
-                    self.send_simple_reply(
-                        msg,
-                        self.process_template(template_name, reply),
-                        private,
-                        threaded,
-                    )
 
-            # The command is a success, check if this has not made a flow progressed
-            self.flow_executor.trigger(cmd, msg.frm, msg.ctx)
+                # The command is a success, check if this has not made a flow progressed
+                self.flow_executor.trigger(cmd, msg.frm, msg.ctx)
 
-        except CommandError as command_error:
-            reason = command_error.reason
-            if command_error.template:
-                reason = self.process_template(command_error.template, reason)
-            self.send_simple_reply(msg, reason, private, threaded)
+            except Exception as e:
+                self.metrics.inc(COMMAND_ERRORS, command=cmd)
+                self.send_simple_reply(
+                    msg, self._command_error_reply(e, msg), private, threaded
+                )
+            finally:
+                self.metrics.observe(
+                    COMMAND_DURATION, perf_counter() - started, command=cmd
+                )
 
-        except Exception as e:
-            tb = traceback.format_exc()
-            log.exception(
-                f'An error happened while processing a message ("{msg.body}"): {tb}"'
-            )
-            self.send_simple_reply(
-                msg, self.MSG_ERROR_OCCURRED + f":\n{e}", private, threaded
-            )
+    async def _execute_and_send_async(self, cmd, args, match, msg, template_name=None):
+        """Execute an async def bot command on the event loop and send output back to the caller
+
+        It takes the same parameters as _execute_and_send. The replies are sent from
+        a thread of the event loop executor so a slow backend does not hold the other
+        coroutines.
+        """
+        private, threaded = self._reply_diversion(cmd)
+        started = perf_counter()
+        with self.flow_executor.hold_flows():  # flow hints after the replies
+            try:
+                method = self._command_to_execute(cmd, match, msg)
+                if method is None:
+                    return
+
+                if inspect.isasyncgenfunction(method):
+                    replies = method(msg, match) if match else method(msg, args)
+                    with span("command", command=cmd):
+                        async for reply in replies:
+                            if reply:
+                                await self.event_loop.run_in_thread(
+                                    self.send_simple_reply,
+                                    msg,
+                                    self.process_template(template_name, reply),
+                                    private,
+                                    threaded,
+                                )
+                else:
+                    with span("command", command=cmd):
+                        reply = await (
+                            method(msg, match) if match else method(msg, args)
+                        )
+                    if reply:
+                        await self.event_loop.run_in_thread(
+                            self.send_simple_reply,
+                            msg,
+                            self.process_template(template_name, reply),
+                            private,
+                            threaded,
+                        )
+
+                # The command is a success, check if this has not made a flow progressed
+                self.flow_executor.trigger(cmd, msg.frm, msg.ctx)
+
+            except Exception as e:
+                self.metrics.inc(COMMAND_ERRORS, command=cmd)
+                await self.event_loop.run_in_thread(
+                    self.send_simple_reply,
+                    msg,
+                    self._command_error_reply(e, msg),
+                    private,
+                    threaded,
+                )
+            finally:
+                self.metrics.observe(
+                    COMMAND_DURATION, perf_counter() - started, command=cmd
+                )
 
     def unknown_command(self, _, cmd: str, args: Optional[str]) -> str:
         """Override the default unknown command behavior"""
@@ -612,12 +901,14 @@ class ErrBot(Backend, StoreMixin):
     def inject_commands_from(self, instance_to_inject):
         with self._gbl:
             plugin_name = instance_to_inject.name
+            new_commands = dict(self.commands)
+            new_re_commands = dict(self.re_commands)
             for name, value in inspect.getmembers(instance_to_inject, inspect.ismethod):
                 if getattr(value, "_err_command", False):
                     commands = (
-                        self.re_commands
+                        new_re_commands
                         if getattr(value, "_err_re_command")
-                        else self.commands
+                        else new_commands
                     )
                     name = getattr(value, "_err_command_name")
 
@@ -638,10 +929,9 @@ class ErrBot(Backend, StoreMixin):
                         log.debug(
                             "Adding regex command: %s -> %s.", name, value.__name__
                         )
-                        self.re_commands = commands
                     else:
                         log.debug("Adding command: %s -> %s.", name, value.__name__)
-                        self.commands = commands
+            self._registry = self._registry.replace(new_commands, new_re_commands)
 
     def inject_flows_from(self, instance_to_inject) -> None:
         classname = instance_to_inject.__class__.__name__
@@ -658,12 +948,14 @@ class ErrBot(Backend, StoreMixin):
 
     def inject_command_filters_from(self, instance_to_inject) -> None:
         with self._gbl:
+            command_filters = list(self.command_filters)
             for name, method in inspect.getmembers(
                 instance_to_inject, inspect.ismethod
             ):
                 if getattr(method, "_err_command_filter", False):
                     log.debug("Adding command filter: %s", name)
-                    self.command_filters.append(method)
+                    command_filters.append(method)
+            self._registry = self._registry.replace(command_filters=command_filters)
 
     def remove_flows_from(self, instance_to_inject) -> None:
         for name, value in inspect.getmembers(instance_to_inject, inspect.ismethod):
@@ -673,24 +965,27 @@ class ErrBot(Backend, StoreMixin):
 
     def remove_commands_from(self, instance_to_inject) -> None:
         with self._gbl:
+            commands = dict(self.commands)
+            re_commands = dict(self.re_commands)
             for name, value in inspect.getmembers(instance_to_inject, inspect.ismethod):
                 if getattr(value, "_err_command", False):
                     name = getattr(value, "_err_command_name")
-                    if getattr(value, "_err_re_command") and name in self.re_commands:
-                        del self.re_commands[name]
-                    elif (
-                        not getattr(value, "_err_re_command") and name in self.commands
-                    ):
-                        del self.commands[name]
+                    if getattr(value, "_err_re_command") and name in re_commands:
+                        del re_commands[name]
+                    elif not getattr(value, "_err_re_command") and name in commands:
+                        del commands[name]
+            self._registry = self._registry.replace(commands, re_commands)
 
     def remove_command_filters_from(self, instance_to_inject) -> None:
         with self._gbl:
+            command_filters = list(self.command_filters)
             for name, method in inspect.getmembers(
                 instance_to_inject, inspect.ismethod
             ):
                 if getattr(method, "_err_command_filter", False):
                     log.debug("Removing command filter: %s", name)
-                    self.command_filters.remove(method)
+                    command_filters.remove(method)
+            self._registry = self._registry.replace(command_filters=command_filters)
 
     def _admins_to_notify(self) -> List:
         """
@@ -711,9 +1006,19 @@ class ErrBot(Backend, StoreMixin):
 
     def callback_message(self, msg: Message) -> None:
         """Processes for commands and dispatches the message to all the plugins."""
-        if self.process_message(msg):
-            # Act only in the backend tells us that this message is OK to broadcast
-            self._dispatch_to_plugins("callback_message", msg)
+        self.metrics.inc(MESSAGES_RECEIVED, backend=self.mode)
+        trace = self.tracer.trace(msg)
+        if trace is None:
+            if self.process_message(msg):
+                # Act only in the backend tells us that this message is OK to broadcast
+                self._dispatch_to_plugins("callback_message", msg)
+            return
+        with trace.root("receive", backend=self.mode):
+            with span("process_message"):
+                broadcast = self.process_message(msg)
+            if broadcast:
+                with span("callback_message"):
+                    self._dispatch_to_plugins("callback_message", msg)
 
     def callback_mention(self, msg: Message, people: List[Identifier]) -> None:
         log.debug("%s has/have been mentioned", ", ".join(str(p) for p in people))
@@ -836,6 +1141,12 @@ class ErrBot(Backend, StoreMixin):
         )
 
     def shutdown(self) -> None:
+        self.event_loop.stop()
+        self.callback_watchdog.stop()
+        if self.callback_pool is not None:
+            self.callback_pool.close()
+        if self.bot_config.BOT_HISTORY_PERSIST:
+            self["cmd_history"] = self.cmd_history.dump()
         self.close_storage()
         self.plugin_manager.shutdown()
         self.repo_manager.shutdown()
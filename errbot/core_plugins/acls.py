@@ -1,10 +1,24 @@
 import fnmatch
+import re
+from functools import lru_cache
+from typing import Dict, Mapping, Optional, Pattern, Tuple
 
 from errbot import BotPlugin, cmdfilter
 from errbot.backends.base import RoomOccupant
 
 BLOCK_COMMAND = (None, None, None)
 
+# the filters of an ACL that are lists of unix glob patterns.
+GLOB_FILTERS = (
+    "allowusers",
+    "denyusers",
+    "allowrooms",
+    "denyrooms",
+    "allowargs",
+    "denyargs",
+)
+DECISIONS_CACHE_SIZE = 10000
+
 
 def get_acl_usr(msg):
     """Return the ACL attribute of the sender of the given message"""
@@ -22,16 +36,33 @@ def get_acl_room(room):
     return str(room)  # old behaviour
 
 
+def _patterns(patterns) -> Tuple[str, ...]:
+    if isinstance(patterns, str):
+        return (patterns,)
+    return tuple(str(pattern) for pattern in patterns)
+
+
+@lru_cache(maxsize=1024)
+def _compile(patterns: Tuple[str, ...]) -> Pattern:
+    # (?!) never matches, like any() over no pattern.
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns) or "(?!)")
+
+
+def compile_globs(patterns) -> Pattern:
+    """
+    Compile a list of unix glob patterns into a single regex matching any of them.
+    """
+    return _compile(_patterns(patterns))
+
+
 def glob(text, patterns):
     """
     Match text against the list of patterns according to unix glob rules.
     Return True if a match is found, False otherwise.
     """
-    if isinstance(patterns, str):
-        patterns = (patterns,)
     if not isinstance(text, str):
         text = str(text)
-    return any(fnmatch.fnmatchcase(text, str(pattern)) for pattern in patterns)
+    return compile_globs(patterns).match(text) is not None
 
 
 def ciglob(text, patterns):
@@ -41,9 +72,56 @@ def ciglob(text, patterns):
     Match text against the list of patterns according to unix glob rules.
     Return True if a match is found, False otherwise.
     """
-    if isinstance(patterns, str):
-        patterns = (patterns,)
-    return glob(text.lower(), [p.lower() for p in patterns])
+    return glob(text.lower(), [p.lower() for p in _patterns(patterns)])
+
+
+def compile_acl(acl: Mapping) -> Dict:
+    """
+    Return a copy of the given ACL with its glob filters compiled and its disabled
+    (None) filters removed.
+    """
+    return {
+        key: compile_globs(value) if key in GLOB_FILTERS else value
+        for key, value in acl.items()
+        if value is not None
+    }
+
+
+class CompiledACLs:
+    """
+    The ACL configuration compiled into regexes, with the ACL resolved for each
+    plugin:command and the decisions taken for each command, user and room.
+    """
+
+    def __init__(self, default: Mapping, access_controls: Mapping, admins):
+        self.config = (default, access_controls, admins)
+        self.default = default
+        self.rules = []
+        for pattern, acl in access_controls.items():
+            if ":" not in pattern:
+                pattern = f"*:{pattern}"
+            self.rules.append((compile_globs(pattern.lower()), acl))
+        self.admins = compile_globs(admins)
+        self.acls = {}
+        self.decisions = {}
+
+    def is_compiled_from(self, default: Mapping, access_controls: Mapping, admins):
+        """Check whether these are the compiled objects, by identity to stay cheap."""
+        d, a, b = self.config
+        return d is default and a is access_controls and b is admins
+
+    def acl(self, cmd_str: str) -> Dict:
+        """Return the compiled ACL of the given plugin:command."""
+        acl = self.acls.get(cmd_str)
+        if acl is None:
+            merged = dict(self.default)
+            lowered = cmd_str.lower()
+            for pattern, rule in self.rules:
+                if pattern.match(lowered):
+                    merged.update(rule)
+                    break
+            acl = self.acls[cmd_str] = compile_acl(merged)
+        return acl
 
 
 class ACLS(BotPlugin):
@@ -52,6 +130,36 @@ class ACLS(BotPlugin):
     restricted via various rules.
     """
 
+    _compiled = None
+
+    def activate(self):
+        super().activate()
+        self.reload_acls()
+
+    def reload_acls(self) -> CompiledACLs:
+        """
+        Compile the ACL configuration, dropping the cached decisions.
+        """
+        config = self.bot_config
+        self._compiled = CompiledACLs(
+            config.ACCESS_CONTROLS_DEFAULT, config.ACCESS_CONTROLS, config.BOT_ADMINS
+        )
+        return self._compiled
+
+    def compiled_acls(self) -> CompiledACLs:
+        """
+        Return the compiled ACL configuration, recompiled if it has been reloaded.
+
+        The configuration changed in place is only compiled again by reload_acls.
+        """
+        config = self.bot_config
+        compiled = self._compiled
+        if compiled is None or not compiled.is_compiled_from(
+            config.ACCESS_CONTROLS_DEFAULT, config.ACCESS_CONTROLS, config.BOT_ADMINS
+        ):
+            compiled = self.reload_acls()
+        return compiled
+
     def access_denied(self, msg, reason, dry_run):
         if not dry_run and not self.bot_config.HIDE_RESTRICTED_ACCESS:
             self._bot.send_simple_reply(msg, reason)
@@ -67,89 +175,83 @@ class ACLS(BotPlugin):
         :param args: Arguments passed to the command.
         :param dry_run: True when this is a dry-run.
         """
-        self.log.debug("Check %s for ACLs.", cmd)
         f = self._bot.all_commands[cmd]
         cmd_str = f"{f.__self__.name}:{cmd}"
+        compiled = self.compiled_acls()
+        acl = compiled.acl(cmd_str)
 
-        usr = get_acl_usr(msg)
-        acl = self.bot_config.ACCESS_CONTROLS_DEFAULT.copy()
-        for pattern, acls in self.bot_config.ACCESS_CONTROLS.items():
-            if ":" not in pattern:
-                pattern = f"*:{pattern}"
-            if ciglob(cmd_str, (pattern,)):
-                acl.update(acls)
-                break
-
-        self.log.info(
-            f"Matching ACL {acl} against username {usr} for command {cmd_str}."
-        )
-        if "allowargs" in acl and not glob(args, acl["allowargs"]):
-            return self.access_denied(
-                msg,
-                "You're not allowed to access this command using the provided arguments",
-                dry_run,
-            )
-        if "denyargs" in acl and glob(args, acl["denyargs"]):
-            return self.access_denied(
-                msg,
-                "You're not allowed to access this command using the provided arguments",
-                dry_run,
-            )
+        if "allowargs" in acl or "denyargs" in acl:
+            str_args = args if isinstance(args, str) else str(args)
+            if ("allowargs" in acl and not acl["allowargs"].match(str_args)) or (
+                "denyargs" in acl and acl["denyargs"].match(str_args)
+            ):
+                return self.access_denied(
+                    msg,
+                    "You're not allowed to access this command using the provided arguments",
+                    dry_run,
+                )
 
-        if "allowusers" in acl and not glob(usr, acl["allowusers"]):
-            return self.access_denied(
-                msg, "You're not allowed to access this command from this user", dry_run
-            )
-        if "denyusers" in acl and glob(usr, acl["denyusers"]):
-            return self.access_denied(
-                msg, "You're not allowed to access this command from this user", dry_run
-            )
+        usr = get_acl_usr(msg)
+        room = None
         if msg.is_group:
             if not isinstance(msg.frm, RoomOccupant):
                 raise Exception(
                     f"msg.frm is not a RoomOccupant. Class of frm: {msg.frm.__class__}"
                 )
             room = get_acl_room(msg.frm.room)
-            if "allowmuc" in acl and acl["allowmuc"] is False:
-                return self.access_denied(
-                    msg,
-                    "You're not allowed to access this command from a chatroom",
-                    dry_run,
-                )
 
-            if "allowrooms" in acl and not glob(room, acl["allowrooms"]):
-                return self.access_denied(
-                    msg,
-                    "You're not allowed to access this command from this room",
-                    dry_run,
-                )
+        key = (cmd_str, f._err_command_admin_only, usr, room)
+        try:
+            reason = compiled.decisions[key]
+        except KeyError:
+            self.log.info(
+                "Matching ACL %s against username %s for command %s.",
+                acl,
+                usr,
+                cmd_str,
+            )
+            reason = self.decide(
+                compiled, acl, str(usr), room, f._err_command_admin_only
+            )
+            if len(compiled.decisions) >= DECISIONS_CACHE_SIZE:
+                compiled.decisions.clear()
+            compiled.decisions[key] = reason
 
-            if "denyrooms" in acl and glob(room, acl["denyrooms"]):
-                return self.access_denied(
-                    msg,
-                    "You're not allowed to access this command from this room",
-                    dry_run,
-                )
+        if reason is not None:
+            return self.access_denied(msg, reason, dry_run)
+        return msg, cmd, args
+
+    @staticmethod
+    def decide(
+        compiled: CompiledACLs,
+        acl: Dict,
+        usr: str,
+        room: Optional[str],
+        admin_only: bool,
+    ) -> Optional[str]:
+        """
+        Return why the user cannot run a command from the room (None for a direct
+        message) or None if they can.
+        """
+        if "allowusers" in acl and not acl["allowusers"].match(usr):
+            return "You're not allowed to access this command from this user"
+        if "denyusers" in acl and acl["denyusers"].match(usr):
+            return "You're not allowed to access this command from this user"
+        if room is not None:
+            if "allowmuc" in acl and acl["allowmuc"] is False:
+                return "You're not allowed to access this command from a chatroom"
+            if "allowrooms" in acl and not acl["allowrooms"].match(str(room)):
+                return "You're not allowed to access this command from this room"
+            if "denyrooms" in acl and acl["denyrooms"].match(str(room)):
+                return "You're not allowed to access this command from this room"
         elif "allowprivate" in acl and acl["allowprivate"] is False:
-            return self.access_denied(
-                msg,
-                "You're not allowed to access this command via private message to me",
-                dry_run,
-            )
+            return "You're not allowed to access this command via private message to me"
 
-        self.log.debug(f"Check if {cmd} is admin only command.")
-        if f._err_command_admin_only:
-            if not glob(get_acl_usr(msg), self.bot_config.BOT_ADMINS):
-                return self.access_denied(
-                    msg, "This command requires bot-admin privileges", dry_run
-                )
+        if admin_only:
+            if not compiled.admins.match(usr):
+                return "This command requires bot-admin privileges"
             # For security reasons, admin-only commands are direct-message only UNLESS
             # specifically overridden by setting allowmuc to True for such commands.
-            if msg.is_group and not acl.get("allowmuc", False):
-                return self.access_denied(
-                    msg,
-                    "This command may only be issued through a direct message",
-                    dry_run,
-                )
-
-        return msg, cmd, args
+            if room is not None and not acl.get("allowmuc", False):
+                return "This command may only be issued through a direct message"
+        return None
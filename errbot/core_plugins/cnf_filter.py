@@ -2,12 +2,12 @@ from errbot import BotPlugin, cmdfilter
 
 
 class CommandNotFoundFilter(BotPlugin):
-    @cmdfilter(catch_unprocessed=True)
+    @cmdfilter(catch_unprocessed=True, commands=())
     def cnf_filter(self, msg, cmd, args, dry_run, emptycmd=False):
         """
         Check if command exists.  If not, signal plugins.  This plugin
-        will be called twice: once as a command filter and then again
-        as a "command not found" filter. See the emptycmd parameter.
+        targets no command (commands=()) so it is only called as a
+        "command not found" filter. See the emptycmd parameter.
 
         :param msg: Original chat message.
         :param cmd: Parsed command.
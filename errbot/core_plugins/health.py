@@ -4,6 +4,13 @@ import signal
 from datetime import datetime
 
 from errbot import BotPlugin, arg_botcmd, botcmd
+from errbot.metrics import (
+    CALLBACK_DURATION,
+    COMMAND_DURATION,
+    COMMAND_ERRORS,
+    FILTERS_DURATION,
+    SEND_DURATION,
+)
 from errbot.utils import format_timedelta, global_restart
 
 
@@ -14,11 +21,13 @@ class Health(BotPlugin):
         plugins_statuses = self.status_plugins(msg, args)
         loads = self.status_load(msg, args)
         gc = self.status_gc(msg, args)
+        queue = self.status_queue(msg, args)
 
         return {
             "plugins_statuses": plugins_statuses["plugins_statuses"],
             "loads": loads["loads"],
             "gc": gc["gc"],
+            "queue": queue["queue"],
         }
 
     @botcmd(template="status_load")
@@ -38,6 +47,67 @@ class Health(BotPlugin):
         """shows the garbage collection details"""
         return {"gc": gc.get_count()}
 
+    @botcmd(template="status_queue")
+    def status_queue(self, _, args):
+        """shows the depth and wait time of the command queue"""
+        scheduler = getattr(self._bot, "command_scheduler", None)
+        return {"queue": scheduler.stats() if scheduler is not None else None}
+
+    @botcmd(template="status_metrics")
+    def status_metrics(self, _, args):
+        """shows the execution time of the commands, filters, sends and callbacks"""
+        metrics = self._bot.metrics
+        errors = {
+            labels["command"]: count for labels, count in metrics.series(COMMAND_ERRORS)
+        }
+        commands = sorted(
+            (
+                (
+                    labels["command"],
+                    histogram.count,
+                    errors.get(labels["command"], 0),
+                    histogram.mean,
+                    histogram.quantile(0.95),
+                )
+                for labels, histogram in metrics.series(COMMAND_DURATION)
+            ),
+            key=lambda command: command[1] * command[3],  # total time spent
+            reverse=True,
+        )
+        return {
+            "enabled": metrics.enabled,
+            "commands": commands,
+            "filters": metrics.histogram(FILTERS_DURATION),
+            "sends": metrics.histogram(SEND_DURATION),
+        }
+
+    @botcmd(template="status_callbacks")
+    def status_callbacks(self, _, args):
+        """ranks the plugins by time spent in their callbacks (callback_message etc.)"""
+        metrics = self._bot.metrics
+        watchdog = self._bot.callback_watchdog
+        plugins = {}
+        for labels, histogram in metrics.series(CALLBACK_DURATION):
+            plugin = plugins.setdefault(labels["plugin"], [0.0, 0, 0, []])
+            plugin[0] += histogram.sum
+            plugin[1] += histogram.count
+            plugin[3].append((labels["callback"], histogram.count, histogram.sum))
+        for (name, _), slow in watchdog.slow_callbacks.items():
+            plugins.setdefault(name, [0.0, 0, 0, []])[2] += slow
+        ranking = sorted(
+            (
+                (name, total, count, slow, sorted(callbacks, key=lambda c: -c[2]))
+                for name, (total, count, slow, callbacks) in plugins.items()
+            ),
+            key=lambda plugin: plugin[1],
+            reverse=True,
+        )
+        return {
+            "enabled": metrics.enabled,
+            "threshold": watchdog.threshold,
+            "plugins": ranking,
+        }
+
     @botcmd(template="status_plugins")
     def status_plugins(self, _, args):
         """shows the plugin status"""
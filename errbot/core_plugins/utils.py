@@ -47,7 +47,7 @@ class Utils(BotPlugin):
     def history(self, msg, args):
         """display the command history"""
         answer = []
-        user_cmd_history = self._bot.cmd_history[msg.frm.person]
+        user_cmd_history = self._bot.cmd_history.get(msg.frm.person) or ()
         length = len(user_cmd_history)
         for i in range(0, length):
             c = user_cmd_history[i]
@@ -6,12 +6,14 @@ from random import randrange
 from threading import Thread
 from urllib.request import unquote
 
+from flask import Response
 from OpenSSL import crypto
 from webtest import TestApp
 from werkzeug.serving import ThreadedWSGIServer
 
 from errbot import BotPlugin, botcmd, webhook
 from errbot.core_plugins import flask_app
+from errbot.metrics import CONTENT_TYPE
 
 
 def make_ssl_certificate(key_path, cert_path):
@@ -141,6 +143,23 @@ class Webserver(BotPlugin):
             "rules": (((rule.rule, rule.endpoint) for rule in flask_app.url_map._rules))
         }
 
+    @webhook("/metrics", methods=("GET",), raw=True)
+    def metrics(self, request):
+        """
+        Exposes the metrics of the bot in the OpenMetrics format for Prometheus & co
+        """
+        return Response(self._bot.metrics.render(), content_type=CONTENT_TYPE)
+
+    @webhook("/traces", methods=("GET",), raw=True)
+    def traces(self, request):
+        """
+        Exports the recorded dispatch spans in the OpenTelemetry (OTLP) JSON format,
+        only if BOT_TRACE_EXPORT is set as it tells which commands ran and when
+        """
+        if not self.bot_config.BOT_TRACE_EXPORT:
+            return Response("Not Found", status=404)
+        return self._bot.tracer.export()
+
     @webhook
     def echo(self, incoming_request):
         """
@@ -0,0 +1,396 @@
+"""Indexes used to resolve incoming text to bot commands"""
+
+import logging
+import re
+from itertools import chain
+from types import MappingProxyType
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+log = logging.getLogger(__name__)
+
+# Flags that can be scoped to a single alternative with (?flags:...).
+SCOPABLE_FLAGS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s"}
+
+# Constructs that would change meaning (or not compile) once the pattern is
+# embedded in a bigger alternation: global inline flags, references to groups by
+# number or name and conditionals.
+UNCOMBINABLE_RE = re.compile(r"\(\?[aiLmsux]+\)|\\[1-9]|\(\?P=|\(\?\(")
+
+# Characters that can be matched case-insensitively by non-ASCII characters (like
+# the dotless i or the long s) and would be missed by comparing lowercased text.
+CASE_FOLDING_TRAPS = frozenset("iskISK")
+
+REPEATS = tuple(
+    op
+    for op in (
+        sre_parse.MAX_REPEAT,
+        sre_parse.MIN_REPEAT,
+        getattr(sre_parse, "POSSESSIVE_REPEAT", None),
+    )
+    if op is not None
+)
+ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+# Key marking a trie node as the end of a command name. Segments are always
+# strings so None can never collide with one of them.
+_END = None
+
+
+class CommandTrie:
+    """
+    Word-level prefix tree over the registered command names.
+
+    Command names are stored split on "_" so that both "!plugin config" and
+    "!plugin_config" resolve to the plugin_config command, exactly like joining
+    the words of the message with "_" would.
+    """
+
+    def __init__(self):
+        self._root: Dict = {}
+
+    def add(self, name: str) -> None:
+        node = self._root
+        for segment in name.split("_"):
+            node = node.setdefault(segment, {})
+        node[_END] = True
+
+    def longest_prefix(self, words: List[str]) -> int:
+        """
+        Find the longest run of leading words forming a command name.
+
+        :param words: the words of the message, as returned by str.split().
+        :return: the number of words making up the command, 0 if there is none.
+        """
+        node = self._root
+        longest = 0
+        for count, word in enumerate(words, 1):
+            for segment in word.split("_"):
+                node = node.get(segment)
+                if node is None:
+                    return longest
+            if _END in node:
+                longest = count
+        return longest
+
+    def __contains__(self, name: str) -> bool:
+        return self.longest_prefix([name]) == 1
+
+
+def _literal_runs(subpattern, ignorecase: bool) -> List[str]:
+    """Collects the literal strings any match of the parsed subpattern must contain."""
+    runs = []
+    run = []
+    for op, av in subpattern:
+        if op == sre_parse.LITERAL:
+            char = chr(av)
+            if not ignorecase:
+                run.append(char)
+                continue
+            if char.isascii() and char not in CASE_FOLDING_TRAPS:
+                run.append(char.lower())
+                continue
+        if run:
+            runs.append("".join(run))
+            run = []
+        if op == sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, p = av
+            scoped_ignorecase = (
+                ignorecase or bool(add_flags & re.IGNORECASE)
+            ) and not del_flags & re.IGNORECASE
+            runs.extend(_literal_runs(p, scoped_ignorecase))
+        elif op in REPEATS and av[0] >= 1:
+            runs.extend(_literal_runs(av[2], ignorecase))
+        elif op == ATOMIC_GROUP:
+            runs.extend(_literal_runs(av, ignorecase))
+    if run:
+        runs.append("".join(run))
+    return runs
+
+
+def required_literal(pattern: re.Pattern) -> Optional[Tuple[str, bool]]:
+    """
+    Extracts the longest literal string that is part of every match of the pattern.
+
+    :param pattern: a compiled regular expression.
+    :return: the literal and True if it needs to be looked up in lowercased text
+        (case-insensitive pattern), or None if no literal is mandatory.
+    """
+    if not isinstance(pattern.pattern, str):
+        return None
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        log.debug("Could not parse %s to extract its literals.", pattern.pattern)
+        return None
+    ignorecase = bool(parsed.state.flags & re.IGNORECASE)
+    runs = _literal_runs(parsed, ignorecase)
+    if not runs:
+        return None
+    return max(runs, key=len), ignorecase
+
+
+def _trie_pattern(literals: Iterable[str]) -> str:
+    """Returns a regex matching any of the literals, factored on their prefixes."""
+    trie: Dict = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    def pattern(node: Dict) -> str:
+        branches = [
+            re.escape(char) + pattern(child)
+            for char, child in node.items()
+            if char is not _END
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # greedy, so the longest literal is preferred to its prefixes.
+        return f"(?:{body})?" if _END in node else body
+
+    return pattern(trie)
+
+
+class LiteralIndex:
+    """
+    Finds which of a set of literals occur in a text in a single scan.
+
+    The literals are arranged in a prefix tree compiled into one regex, looked up
+    at every position of the text, so the cost depends on the length of the text
+    and not on the number of literals. The longest literal starting at a position
+    is found, the others starting there are its prefixes.
+    """
+
+    def __init__(self, literals: Iterable[str]):
+        literals = set(literals)
+        self._prefixes = {
+            literal: tuple(other for other in literals if literal.startswith(other))
+            for literal in literals
+        }
+        self._scanner = re.compile(f"(?=({_trie_pattern(literals)}))")
+
+    def find(self, text: str) -> Set[str]:
+        found = set()
+        for match in self._scanner.finditer(text):
+            found.update(self._prefixes[match.group(1)])
+        return found
+
+
+def _scoped(pattern: re.Pattern) -> str:
+    """Returns the source of the pattern with its flags scoped to it, or None if it cannot be combined."""
+    flags = pattern.flags & ~re.UNICODE
+    if UNCOMBINABLE_RE.search(pattern.pattern):
+        return None
+    letters = ""
+    for flag, letter in SCOPABLE_FLAGS.items():
+        if flags & flag:
+            letters += letter
+            flags &= ~flag
+    if flags:  # ASCII, LOCALE, VERBOSE etc. are not safe to scope.
+        return None
+    return f"(?{letters}:{pattern.pattern})" if letters else f"(?:{pattern.pattern})"
+
+
+class RegexCommandIndex:
+    """
+    Precompiled dispatch index over a set of regex commands.
+
+    The longest literal every match of a pattern must contain is extracted when
+    the index is built, and the literals of all the commands are put in a
+    LiteralIndex (one for the case-sensitive ones, one for the others, looked up
+    in the lowercased text). A message is scanned once for all of them and only
+    the commands whose literal occurs in it are evaluated.
+
+    The combinable patterns without any such literal are joined in a single
+    alternation which is searched first: as long as it does not match, none of them
+    can match and the message costs a single scan instead of one per command.
+    Several commands can answer the same message so when it does match, every
+    pattern is still evaluated to get its own match object. Patterns that cannot be
+    combined are always evaluated on their own.
+    """
+
+    def __init__(self, re_commands: Mapping[str, Callable]):
+        self._commands: Tuple[Tuple[str, Callable], ...] = tuple(re_commands.items())
+        # literal -> positions of its commands, for the case-sensitive literals and
+        # the lowercased ones.
+        by_literal: Tuple[Dict[str, List[int]], Dict[str, List[int]]] = ({}, {})
+        self._unindexed: List[int] = []  # the commands evaluated for every message
+        self._combined = set()
+        group_names = set()
+        alternatives = []
+        for position, (name, func) in enumerate(self._commands):
+            pattern = func._err_command_re_pattern
+            literal = required_literal(pattern)
+            if literal is not None:
+                literal, ignorecase = literal
+                by_literal[ignorecase].setdefault(literal, []).append(position)
+                continue
+            self._unindexed.append(position)
+            source = _scoped(pattern)
+            if source is None or not group_names.isdisjoint(pattern.groupindex):
+                log.debug("Regex command %s will be matched on its own.", name)
+                continue
+            group_names.update(pattern.groupindex)
+            alternatives.append(source)
+            self._combined.add(name)
+
+        self._literal_indexes = []
+        for ignorecase, positions in enumerate(by_literal):
+            if not positions:
+                continue
+            try:
+                index = LiteralIndex(positions)
+            except (re.error, RecursionError):
+                log.exception("Could not index the literals of the regex commands.")
+                self._unindexed.extend(chain.from_iterable(positions.values()))
+                continue
+            self._literal_indexes.append((index, positions, bool(ignorecase)))
+        self._unindexed.sort()
+
+        self._alternation = None
+        if alternatives:
+            try:
+                self._alternation = re.compile("|".join(alternatives))
+            except re.error:
+                log.exception("Could not combine the regex commands.")
+                self._combined.clear()
+
+    def matches(self, text: str) -> Iterator[Tuple[str, Callable, object]]:
+        """
+        Yields the name, the function and the match of every command matching text, in order.
+
+        The match is a list of matches for the commands declared with matchall.
+        """
+        positions = self._unindexed
+        for index, by_literal, ignorecase in self._literal_indexes:
+            found = index.find(text.lower() if ignorecase else text)
+            if found:
+                if positions is self._unindexed:
+                    positions = list(positions)
+                for literal in found:
+                    positions.extend(by_literal[literal])
+        if positions is not self._unindexed:
+            positions.sort()
+
+        alternation_matched = None  # only searched if one of its commands is reached
+        for position in positions:
+            name, func = self._commands[position]
+            if name in self._combined:
+                if alternation_matched is None:
+                    alternation_matched = self._alternation.search(text) is not None
+                if not alternation_matched:
+                    continue
+            if func._err_command_matchall:
+                match = list(func._err_command_re_pattern.finditer(text))
+            else:
+                match = func._err_command_re_pattern.search(text)
+            if match:
+                yield name, func, match
+
+
+def filter_applies(cmd_filter: Callable, cmd: str, plugin: Optional[str]) -> bool:
+    """Returns True if the command filter targets the command of the given plugin."""
+    commands = getattr(cmd_filter, "_err_command_filter_commands", None)
+    plugins = getattr(cmd_filter, "_err_command_filter_plugins", None)
+    return (commands is None or cmd in commands) and (
+        plugins is None or plugin in plugins
+    )
+
+
+class CommandRegistry:
+    """
+    Immutable snapshot of the commands and command filters of the bot.
+
+    The bot replaces it with a new one when plugins add or remove commands or
+    filters, so the dispatch reads it without taking any lock. The indexes derived
+    from it are built on first use and cached on the snapshot: two threads can
+    build the same one concurrently, which is harmless.
+    """
+
+    def __init__(
+        self,
+        commands: Mapping[str, Callable] = MappingProxyType({}),
+        re_commands: Mapping[str, Callable] = MappingProxyType({}),
+        command_filters: Iterable[Callable] = (),
+    ):
+        self.commands = MappingProxyType(dict(commands))
+        self.re_commands = MappingProxyType(dict(re_commands))
+        self.command_filters = tuple(command_filters)
+        self.trie = CommandTrie()
+        for name in self.commands:
+            self.trie.add(name)
+        self._re_commands_indexes = None
+        self._all_commands = None
+        self._filter_chains = {}
+
+    def replace(
+        self,
+        commands: Optional[Mapping[str, Callable]] = None,
+        re_commands: Optional[Mapping[str, Callable]] = None,
+        command_filters: Optional[Iterable[Callable]] = None,
+    ) -> "CommandRegistry":
+        """Returns a new snapshot with the given parts replaced."""
+        return CommandRegistry(
+            self.commands if commands is None else commands,
+            self.re_commands if re_commands is None else re_commands,
+            self.command_filters if command_filters is None else command_filters,
+        )
+
+    @property
+    def all_commands(self) -> Mapping[str, Callable]:
+        """Both the commands and the regex commands, the latter winning on clashes."""
+        if self._all_commands is None:
+            merged = dict(self.commands)
+            merged.update(self.re_commands)
+            self._all_commands = MappingProxyType(merged)
+        return self._all_commands
+
+    def re_commands_index(self, prefixed: bool) -> RegexCommandIndex:
+        """
+        Returns the dispatch index of the regex commands that can be triggered.
+
+        :param prefixed: True if the message was addressed to the bot, in which case
+            the commands requiring a prefix are included too.
+        """
+        if self._re_commands_indexes is None:
+            self._re_commands_indexes = (
+                RegexCommandIndex(
+                    {
+                        name: func
+                        for name, func in self.re_commands.items()
+                        if not func._err_command_prefix_required
+                    }
+                ),
+                RegexCommandIndex(self.re_commands),
+            )
+        return self._re_commands_indexes[prefixed]
+
+    def filter_chain(self, cmd: str) -> Tuple[Callable, ...]:
+        """Returns the command filters applying to the given command, in order."""
+        chain = self._filter_chains.get(cmd)
+        if chain is None:
+            method = self.re_commands.get(cmd) or self.commands.get(cmd)
+            plugin = getattr(getattr(method, "__self__", None), "name", None)
+            chain = self._filter_chains[cmd] = tuple(
+                cmd_filter
+                for cmd_filter in self.command_filters
+                if filter_applies(cmd_filter, cmd, plugin)
+            )
+        return chain
@@ -0,0 +1,110 @@
+"""Event loop running the coroutines of the plugins"""
+
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Lock, Thread
+from typing import Any, Callable, Coroutine, Optional
+
+log = logging.getLogger(__name__)
+
+
+class EventLoopThread:
+    """
+    An asyncio event loop running in its own daemon thread.
+
+    The `async def` commands, callbacks and pollers are submitted to it from any
+    thread and run there concurrently, so an I/O bound command waiting on a remote
+    service does not hold a thread of the pool for the duration of the call.
+    The thread is only started when the first coroutine is submitted.
+
+    The blocking calls of the coroutines (sending the replies) run on an executor
+    of its own, so they never wait behind the threads of the default executor.
+    """
+
+    def __init__(self, name: str = "Errbot event loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(thread_name_prefix=self.name)
+            self._thread = Thread(
+                target=self._run, args=(self._loop,), name=self.name, daemon=True
+            )
+            self._thread.start()
+            log.debug("%s started.", self.name)
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    async def run_in_thread(self, func: Callable, *args) -> Any:
+        """
+        Runs a blocking function from a coroutine of the loop in a thread of its
+        executor, with the context of the coroutine like asyncio.to_thread.
+        """
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(context.run, func, *args)
+        )
+
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        Schedules the coroutine on the loop, starting it if needed.
+
+        :param coro: the coroutine to run.
+        :return: a concurrent.futures.Future of its result.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def schedule(self, coro: Coroutine, description: str) -> Future:
+        """
+        Same as submit but for fire and forget coroutines: their crashes are logged.
+
+        :param coro: the coroutine to run.
+        :param description: what the coroutine is, for the logs.
+        """
+
+        def log_crash(future: Future) -> None:
+            if not future.cancelled() and future.exception() is not None:
+                log.error("%s crashed.", description, exc_info=future.exception())
+
+        future = self.submit(coro)
+        future.add_done_callback(log_crash)
+        return future
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the loop, cancelling the coroutines still running."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._executor.shutdown(wait=False)
+            self._thread = None
+            self._loop = None
+            self._executor = None
+            log.debug("%s stopped.", self.name)
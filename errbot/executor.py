@@ -0,0 +1,401 @@
+"""Concurrency control around the execution of the bot commands"""
+
+import asyncio
+import logging
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+from threading import Condition, Lock
+from time import monotonic
+from typing import Callable, Deque, Dict, Hashable, List, Mapping, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# What to do with a command arriving when the queue of the FairScheduler is full.
+OVERFLOW_REJECT = "reject"  # refuse the new command.
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # make room by dropping the oldest queued one.
+OVERFLOW_COALESCE = "coalesce"  # merge duplicates with the queued ones, else refuse.
+OVERFLOW_POLICIES = (OVERFLOW_REJECT, OVERFLOW_DROP_OLDEST, OVERFLOW_COALESCE)
+
+
+class ExecutionBarrier:
+    """
+    Reader/writer barrier between the commands executed concurrently.
+
+    Regular commands share the barrier while admin commands (plugin loading,
+    updates etc.) take it exclusively: they wait for the running commands to
+    complete and the commands starting after them wait for their completion.
+    A waiting admin command has priority over the new regular ones.
+
+    The async def commands wait for it on the event loop without holding a thread:
+    they get a future resolved by the next release.
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _notify_all(self) -> None:
+        """Wakes up all the waiters, the lock being held."""
+        self._condition.notify_all()
+        for loop, waiter in self._waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass  # the loop is closed, nobody waits anymore.
+        self._waiters.clear()
+
+    def _waiter(self) -> asyncio.Future:
+        """Returns a future resolved by the next release, the lock being held."""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append((loop, waiter))
+        return waiter
+
+    def acquire_shared(self) -> None:
+        with self._condition:
+            while self._exclusive or self._exclusive_waiting:
+                self._condition.wait()
+            self._shared += 1
+
+    async def acquire_shared_async(self) -> None:
+        while True:
+            with self._condition:
+                if not (self._exclusive or self._exclusive_waiting):
+                    self._shared += 1
+                    return
+                waiter = self._waiter()
+            await waiter
+
+    def release_shared(self) -> None:
+        with self._condition:
+            self._shared -= 1
+            if not self._shared:
+                self._notify_all()
+
+    def acquire_exclusive(self) -> None:
+        with self._condition:
+            self._exclusive_waiting += 1
+            try:
+                while self._exclusive or self._shared:
+                    self._condition.wait()
+            finally:
+                self._exclusive_waiting -= 1
+            self._exclusive = True
+
+    async def acquire_exclusive_async(self) -> None:
+        with self._condition:
+            self._exclusive_waiting += 1
+        acquired = False
+        try:
+            while True:
+                with self._condition:
+                    if not (self._exclusive or self._shared):
+                        self._exclusive = acquired = True
+                        return
+                    waiter = self._waiter()
+                await waiter
+        finally:
+            with self._condition:
+                self._exclusive_waiting -= 1
+                if not acquired:  # cancelled, the regular commands can go.
+                    self._notify_all()
+
+    def release_exclusive(self) -> None:
+        with self._condition:
+            self._exclusive = False
+            self._notify_all()
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield
+        finally:
+            self.release_shared()
+
+    @contextmanager
+    def exclusive(self):
+        self.acquire_exclusive()
+        try:
+            yield
+        finally:
+            self.release_exclusive()
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Job:
+    """A command waiting for or being executed by the FairScheduler."""
+
+    __slots__ = ("func", "kwargs", "keys", "duplicate_key", "queued_at")
+
+    def __init__(
+        self,
+        func: Callable,
+        kwargs: Mapping,
+        keys: tuple,
+        duplicate_key: Optional[Hashable] = None,
+    ):
+        self.func = func
+        self.kwargs = kwargs
+        self.keys = keys  # (user, room, command), None if not applicable.
+        self.duplicate_key = duplicate_key
+        self.queued_at = monotonic()
+
+
+class FairScheduler:
+    """
+    Fair scheduling of the commands in front of the thread pool.
+
+    The commands are queued per user and only handed over to the pool when a
+    thread is free for them, picking the users in weighted round-robin: a user
+    flooding the bot with slow commands only delays their own commands.
+    Optionally, the number of commands running at the same time for a single
+    user, room or command can be capped.
+
+    The queue can be bounded too, so a burst of messages (a backend replaying its
+    backlog after a reconnection for example) cannot pile up in memory: see the
+    OVERFLOW_* policies for what happens to the commands in excess.
+    """
+
+    def __init__(
+        self,
+        pool: ThreadPool,
+        capacity: int,
+        weights: Optional[Mapping[str, int]] = None,
+        max_per_user: Optional[int] = None,
+        max_per_room: Optional[int] = None,
+        max_per_command: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        overflow: str = OVERFLOW_REJECT,
+        on_shed: Optional[Callable[[Job, str], None]] = None,
+    ):
+        """
+        :param pool: the pool executing the commands.
+        :param capacity: the number of commands the pool can execute at the same time.
+        :param weights: the number of turns each user gets per round, 1 by default.
+        :param max_per_user: max number of commands running for a single user.
+        :param max_per_room: max number of commands running for a single room.
+        :param max_per_command: max number of instances of a single command running.
+        :param max_queued: max number of commands waiting for a thread, None for unlimited.
+        :param overflow: one of OVERFLOW_POLICIES, applied when the queue is full.
+        :param on_shed: called with the job and the policy for each rejected or dropped job.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow}, use one of {OVERFLOW_POLICIES}."
+            )
+        self._pool = pool
+        self._capacity = capacity
+        self._weights = weights or {}
+        self._limits = (max_per_user, max_per_room, max_per_command)
+        self._lock = Lock()
+        self._queues: Dict[str, Deque[Job]] = OrderedDict()  # in round-robin order
+        self._turns: Dict[str, int] = {}  # turns left in the current round
+        self._running = 0
+        self._running_per_key = (Counter(), Counter(), Counter())
+        self._max_queued = max_queued
+        self._overflow = overflow
+        self._on_shed = on_shed
+        self._queued = 0
+        self._queued_duplicates = Counter()
+        self._started = 0
+        self._total_wait = 0.0
+        self.rejected = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def oldest_wait(self) -> float:
+        """Seconds the oldest queued command has been waiting for, 0 if none is."""
+        with self._lock:
+            if not self._queues:
+                return 0.0
+            return monotonic() - min(q[0].queued_at for q in self._queues.values())
+
+    @property
+    def average_wait(self) -> float:
+        """Average number of seconds the started commands waited in the queue."""
+        return self._total_wait / self._started if self._started else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of the saturation of the scheduler."""
+        return {
+            "running": self.running,
+            "capacity": self._capacity,
+            "queued": self.queued,
+            "max_queued": self._max_queued,
+            "oldest_wait": self.oldest_wait,
+            "average_wait": self.average_wait,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    def submit(
+        self,
+        func: Callable,
+        kwargs: Mapping,
+        user: str,
+        room: Optional[str] = None,
+        command: Optional[str] = None,
+        duplicate_key: Optional[Hashable] = None,
+    ) -> bool:
+        """
+        Queues func(**kwargs) to be executed by the pool.
+
+        :param user: the user the command is executed for.
+        :param room: the room the command comes from, if any.
+        :param command: the name of the command.
+        :param duplicate_key: jobs with the same key are duplicates of each other
+            for the OVERFLOW_COALESCE policy, typically (user, command, args). They
+            are only coalesced when the queue is full.
+        :return: False if the job has been rejected.
+        """
+        job = Job(func, kwargs, (user, room, command), duplicate_key)
+        with self._lock:
+            if (
+                self._overflow == OVERFLOW_COALESCE
+                and duplicate_key is not None
+                and self._max_queued is not None
+                and self._queued >= self._max_queued
+                and self._queued_duplicates[duplicate_key]
+            ):
+                self.coalesced += 1
+                log.debug("%s is already queued, coalescing.", duplicate_key)
+                return True
+            self._enqueue(job)
+            ready = self._next_jobs()
+            shed = self._shed(job)
+        if shed is not None:
+            self._report_shed(*shed)
+        self._start(ready)
+        return shed is None or shed[0] is not job
+
+    def _enqueue(self, job: Job) -> None:
+        user = job.keys[0]
+        queue = self._queues.get(user)
+        if queue is None:
+            # new users wait for their turn behind the ones already waiting.
+            queue = self._queues[user] = deque()
+            self._turns[user] = self._weights.get(user, 1)
+        queue.append(job)
+        self._queued += 1
+        if job.duplicate_key is not None:
+            self._queued_duplicates[job.duplicate_key] += 1
+
+    def _dequeue(self, user: str, newest: bool = False) -> Job:
+        queue = self._queues[user]
+        job = queue.pop() if newest else queue.popleft()
+        if not queue:
+            del self._queues[user]
+            del self._turns[user]
+        self._queued -= 1
+        if job.duplicate_key is not None:
+            self._queued_duplicates[job.duplicate_key] -= 1
+            if not self._queued_duplicates[job.duplicate_key]:
+                del self._queued_duplicates[job.duplicate_key]
+        return job
+
+    def _shed(self, newest: Job) -> Optional[Tuple[Job, str]]:
+        """Applies the overflow policy if the queue is over capacity. Must be called with the lock held."""
+        if self._max_queued is None or self._queued <= self._max_queued:
+            return None
+        if self._overflow == OVERFLOW_DROP_OLDEST:
+            user = min(self._queues, key=lambda u: self._queues[u][0].queued_at)
+            self.dropped += 1
+            return self._dequeue(user), OVERFLOW_DROP_OLDEST
+        # the queue was not full before: the newest job is the one in excess.
+        self.rejected += 1
+        return self._dequeue(newest.keys[0], newest=True), OVERFLOW_REJECT
+
+    def _report_shed(self, job: Job, policy: str) -> None:
+        log.warning(
+            "The command queue is full (%d), %s %s from %s.",
+            self._max_queued,
+            "dropped" if policy == OVERFLOW_DROP_OLDEST else "rejected",
+            job.keys[2],
+            job.keys[0],
+        )
+        if self._on_shed is not None:
+            try:
+                self._on_shed(job, policy)
+            except Exception:
+                log.exception("Could not notify about the shed command.")
+
+    def _allowed(self, job: Job) -> bool:
+        for key, limit, running in zip(job.keys, self._limits, self._running_per_key):
+            if limit is not None and key is not None and running[key] >= limit:
+                return False
+        return True
+
+    def _pick(self) -> Optional[Job]:
+        for user, queue in self._queues.items():
+            if not self._allowed(queue[0]):
+                continue
+            self._turns[user] -= 1
+            if not self._turns[user] and len(queue) > 1:
+                self._turns[user] = self._weights.get(user, 1)
+                self._queues.move_to_end(user)
+            return self._dequeue(user)
+        return None
+
+    def _next_jobs(self) -> List[Job]:
+        """Takes the jobs that can start now out of the queues. Must be called with the lock held."""
+        ready = []
+        now = monotonic()
+        while self._running < self._capacity:
+            job = self._pick()
+            if job is None:
+                break
+            self._running += 1
+            self._started += 1
+            self._total_wait += now - job.queued_at
+            for key, running in zip(job.keys, self._running_per_key):
+                if key is not None:
+                    running[key] += 1
+            ready.append(job)
+        return ready
+
+    def _start(self, jobs: List[Job]) -> None:
+        while jobs:
+            job = jobs.pop(0)
+            try:
+                self._pool.apply_async(self._run, (job,))
+            except ValueError:  # the pool has been closed.
+                log.warning("The thread pool is closed, dropping %s.", job.keys[2])
+                jobs.extend(self._finish(job))
+
+    def _run(self, job: Job) -> None:
+        try:
+            job.func(**job.kwargs)
+        except Exception:
+            log.exception("Execution of %s crashed.", job.keys[2])
+        finally:
+            self._start(self._finish(job))
+
+    def _finish(self, job: Job) -> List[Job]:
+        """Accounts for the end of the job, returns the jobs that can start now."""
+        with self._lock:
+            self._running -= 1
+            for key, running in zip(job.keys, self._running_per_key):
+                if key is not None:
+                    running[key] -= 1
+                    if not running[key]:
+                        del running[key]
+            return self._next_jobs()
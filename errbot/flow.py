@@ -1,5 +1,7 @@
 import atexit
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 from multiprocessing.pool import ThreadPool
 from threading import RLock
 from typing import Any, Callable, List, Mapping, Optional, Tuple, Union
@@ -15,6 +17,11 @@ EXECUTOR_THREADS = (
     5  # the maximum number of simultaneous flows in automatic mode at the same time.
 )
 
+# the flows started or advanced by the command being executed, see hold_flows.
+_held_flows: ContextVar[Optional[List["Flow"]]] = ContextVar(
+    "errbot_held_flows", default=None
+)
+
 
 class FlowNode:
     """
@@ -418,11 +425,30 @@ class FlowExecutor:
                     return flow
         return None
 
+    @contextmanager
+    def hold_flows(self):
+        """
+        Executes the flows started or advanced in this block only at its end, so
+        their messages come after the replies of the command sent in the block.
+        """
+        held = []
+        token = _held_flows.set(held)
+        try:
+            yield
+        finally:
+            _held_flows.reset(token)
+            for flow in held:
+                self._enqueue_flow(flow)
+
     def _enqueue_flow(self, flow: Flow) -> None:
         with self._lock:
             if flow not in self.in_flight:
                 self.in_flight.append(flow)
-        self._pool.apply_async(self.execute, (flow,))
+        held = _held_flows.get()
+        if held is not None:
+            held.append(flow)
+        else:
+            self._pool.apply_async(self.execute, (flow,))
 
     def execute(self, flow: Flow) -> None:
         """
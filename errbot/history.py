@@ -0,0 +1,103 @@
+"""Per-user history of the commands, for !! and !N"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+HistoryEntry = Tuple[str, str]  # (command, arguments)
+
+
+class UserHistory:
+    """
+    The last commands of a user, the most recent last, without duplicates.
+
+    Adding or removing an entry is O(1): the entries are the keys of an ordered
+    dict, so a repeated command is moved to the end instead of being added twice.
+
+    :param maxlen: how many commands are kept.
+    """
+
+    __slots__ = ("maxlen", "_entries")
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self._entries: "OrderedDict[HistoryEntry, None]" = OrderedDict()
+
+    def append(self, entry: HistoryEntry) -> None:
+        """Records a command as the most recent one, dropping the oldest if full."""
+        entries = self._entries
+        if entry in entries:
+            entries.move_to_end(entry)
+            return
+        entries[entry] = None
+        if len(entries) > self.maxlen:
+            entries.popitem(last=False)
+
+    def discard(self, entry: HistoryEntry) -> None:
+        self._entries.pop(entry, None)
+
+    def __contains__(self, entry: HistoryEntry) -> bool:
+        return entry in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[HistoryEntry]:
+        return iter(list(self._entries))
+
+    def __getitem__(self, index: int) -> HistoryEntry:
+        # maxlen is small, indexing a copy is cheaper than keeping a second structure.
+        return list(self._entries)[index]
+
+
+class CommandHistory:
+    """
+    The command histories of the users, created on first use.
+
+    Only the histories of the most recently active users are kept: the least
+    recently used one is evicted when there are more than max_users of them.
+
+    :param maxlen: how many commands are kept per user.
+    :param max_users: how many users have a history.
+    """
+
+    def __init__(self, maxlen: int = 10, max_users: int = 1000):
+        self.maxlen = maxlen
+        self.max_users = max_users
+        self._users: "OrderedDict[str, UserHistory]" = OrderedDict()
+        self._lock = Lock()
+
+    def __getitem__(self, username: str) -> UserHistory:
+        with self._lock:
+            history = self._users.get(username)
+            if history is None:
+                history = self._users[username] = UserHistory(self.maxlen)
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(username)
+            return history
+
+    def get(self, username: str) -> Optional[UserHistory]:
+        """Returns the history of the user if any, without marking it as used."""
+        return self._users.get(username)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._users
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def dump(self) -> Dict[str, List[HistoryEntry]]:
+        """Returns the histories as plain data, for the storage, oldest user first."""
+        with self._lock:
+            return {
+                username: list(history) for username, history in self._users.items()
+            }
+
+    def load(self, histories: Dict[str, List[HistoryEntry]]) -> None:
+        """Restores histories returned by dump."""
+        for username, entries in histories.items():
+            history = self[username]
+            for entry in entries:
+                history.append(tuple(entry))
@@ -0,0 +1,327 @@
+"""Lightweight in-process metrics about the bot performance"""
+
+import logging
+from bisect import bisect_left
+from contextlib import nullcontext
+from math import inf
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .storage.base import StorageBase, StoragePluginBase
+
+log = logging.getLogger(__name__)
+
+COMMAND_DURATION = "errbot_command_duration_seconds"
+COMMAND_ERRORS = "errbot_command_errors_total"
+FILTERS_DURATION = "errbot_command_filters_duration_seconds"
+SEND_DURATION = "errbot_send_duration_seconds"
+CALLBACK_DURATION = "errbot_plugin_callback_duration_seconds"
+MESSAGES_RECEIVED = "errbot_messages_received_total"
+MESSAGES_SENT = "errbot_messages_sent_total"
+POLLER_LAG = "errbot_poller_lag_seconds"
+STORAGE_DURATION = "errbot_storage_operation_duration_seconds"
+
+METRICS_HELP = {
+    COMMAND_DURATION: "Execution time of the bot commands, replies included.",
+    COMMAND_ERRORS: "Bot commands that raised an exception.",
+    FILTERS_DURATION: "Time spent in the command filters.",
+    SEND_DURATION: "Time spent splitting and sending the messages to the backend.",
+    CALLBACK_DURATION: "Time spent in the callbacks of the plugins.",
+    MESSAGES_RECEIVED: "Messages received from the backend.",
+    MESSAGES_SENT: "Messages sent to the backend.",
+    POLLER_LAG: "Delay between the scheduled and the actual start of the pollers.",
+    STORAGE_DURATION: "Execution time of the storage operations.",
+}
+
+# Upper bounds of the histogram buckets in seconds, from a fast filter to a slow
+# command calling a remote service.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    inf,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# What a collector returns for each metric family: its name, its type ("gauge" or
+# "counter"), its help text and its samples as (labels, value).
+Family = Tuple[str, str, str, Iterable[Tuple[Dict[str, str], float]]]
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    if extra is not None:
+        labels = labels + (extra,)
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimates the q-quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                if upper == inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+    def cumulative(self) -> Iterator[Tuple[float, int]]:
+        total = 0
+        for upper, count in zip(self.buckets, self.counts):
+            total += count
+            yield upper, total
+
+
+class _Timer:
+    """Context manager observing the time spent in its block."""
+
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, labels: Dict[str, str]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, perf_counter() - self.started, **self.labels)
+        return False
+
+
+NO_TIMER = nullcontext()
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms identified by a name and a set of labels.
+
+    Recording a value is a dictionary lookup and a few additions under a lock so
+    it can stay on in production; when disabled, the recording methods return
+    immediately.
+    """
+
+    def __init__(
+        self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.enabled = enabled
+        self._buckets = buckets
+        self._lock = Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Increments a counter."""
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Records a value, typically a duration in seconds, in a histogram."""
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets)
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels: str):
+        """Context manager recording the time spent in its block in a histogram."""
+        if not self.enabled:
+            return NO_TIMER
+        return _Timer(self, name, labels)
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(_labels(labels))
+
+    def series(self, name: str) -> List[Tuple[Dict[str, str], object]]:
+        """All the (labels, counter value or histogram) recorded under name."""
+        with self._lock:
+            series = self._counters.get(name) or self._histograms.get(name) or {}
+            return [(dict(labels), value) for labels, value in series.items()]
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """
+        Registers a function called at each rendering to report values read on the
+        spot, like the depth of a queue, instead of recording them continuously.
+        """
+        self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        self._collectors.remove(collector)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _collect(self) -> Iterator[Family]:
+        for collector in self._collectors:
+            try:
+                yield from collector()
+            except Exception:
+                log.exception("Metrics collector %s crashed.", collector)
+
+    def render(self) -> str:
+        """Renders the metrics in the OpenMetrics text format."""
+        lines = []
+        for name, kind, help, samples in self._collect():
+            family = name[: -len("_total")] if kind == "counter" else name
+            lines.append(f"# TYPE {family} {kind}")
+            lines.append(f"# HELP {family} {help}")
+            for labels, value in samples:
+                lines.append(
+                    f"{name}{_format_labels(_labels(labels))} {_format_value(value)}"
+                )
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                family = name[: -len("_total")]
+                lines.append(f"# TYPE {family} counter")
+                lines.append(f"# HELP {family} {METRICS_HELP.get(name, name)}")
+                for labels, value in sorted(series.items()):
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                lines.append(f"# HELP {name} {METRICS_HELP.get(name, name)}")
+                for labels, histogram in sorted(series.items()):
+                    for upper, count in histogram.cumulative():
+                        le = ("le", _format_value(upper))
+                        lines.append(
+                            f"{name}_bucket{_format_labels(labels, le)} {count}"
+                        )
+                    lines.append(
+                        f"{name}_count{_format_labels(labels)} {histogram.count}"
+                    )
+                    lines.append(
+                        f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}"
+                    )
+        lines.append("# EOF")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class TimedStorage(StorageBase):
+    """Storage recording the execution time of the operations of the wrapped one."""
+
+    def __init__(self, storage: StorageBase, metrics: MetricsRegistry, namespace: str):
+        self._storage = storage
+        self._metrics = metrics
+        self._namespace = namespace
+
+    def _timer(self, operation: str):
+        return self._metrics.timer(
+            STORAGE_DURATION, operation=operation, namespace=self._namespace
+        )
+
+    def set(self, key: str, value: Any) -> None:
+        with self._timer("set"):
+            return self._storage.set(key, value)
+
+    def get(self, key: str) -> Any:
+        with self._timer("get"):
+            return self._storage.get(key)
+
+    def remove(self, key: str) -> None:
+        with self._timer("remove"):
+            return self._storage.remove(key)
+
+    def len(self) -> int:
+        with self._timer("len"):
+            return self._storage.len()
+
+    def keys(self) -> Iterable[str]:
+        with self._timer("keys"):
+            return self._storage.keys()
+
+    def close(self) -> None:
+        with self._timer("close"):
+            return self._storage.close()
+
+
+class TimedStoragePlugin(StoragePluginBase):
+    """Storage plugin opening TimedStorage around the storages of the wrapped one."""
+
+    def __init__(self, storage_plugin: StoragePluginBase, metrics: MetricsRegistry):
+        self._storage_plugin = storage_plugin
+        self._metrics = metrics
+
+    def open(self, namespace: str) -> StorageBase:
+        return TimedStorage(
+            self._storage_plugin.open(namespace), self._metrics, namespace
+        )
+
+    def __getattr__(self, name: str):
+        return getattr(self._storage_plugin, name)
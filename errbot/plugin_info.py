@@ -24,6 +24,7 @@ class PluginInfo:
     errbot_maxversion: VersionType
     dependencies: List[str]
     location: Path = None
+    parallel_callbacks: bool = False
 
     @staticmethod
     def load(plugfile_path: Path) -> "PluginInfo":
@@ -85,9 +86,20 @@ class PluginInfo:
             )
         depends_on = config.get("Core", "DependsOn", fallback=None)
         deps = [name.strip() for name in depends_on.split(",")] if depends_on else []
+        parallel_callbacks = (
+            config.get("Core", "ParallelCallbacks", fallback="false").lower() == "true"
+        )
 
         return PluginInfo(
-            name, module, doc, core, python_version, min_version, max_version, deps
+            name,
+            module,
+            doc,
+            core,
+            python_version,
+            min_version,
+            max_version,
+            deps,
+            parallel_callbacks=parallel_callbacks,
         )
 
     def load_plugin_classes(self, base_module_name: str, baseclass: Type):
@@ -209,6 +209,13 @@ class BotPluginManager(StoreMixin):
         self.flow_infos: Dict[str, PluginInfo] = {}
         self.flows: Dict[str, Flow] = {}
         self.plugin_places = []
+        # Snapshot of the active plugins, rebuilt when its version is bumped by
+        # an activation, deactivation, reload or blacklisting.
+        self._active_plugins_version = 0
+        self._active_plugins: Tuple[int, Tuple[BotPlugin, ...]] = (-1, ())
+        # callback name -> active plugins overriding it, for the same version.
+        self._subscribers: Tuple[int, Dict[str, Tuple[BotPlugin, ...]]] = (-1, {})
+        self._plugin_names_by_path: Optional[Dict[str, List[str]]] = None
         self.open_storage(storage_plugin, "core")
         if CONFIGS not in self:
             self[CONFIGS] = {}
@@ -231,6 +238,7 @@ class BotPluginManager(StoreMixin):
         classes = plugin_info.load_plugin_classes(base_name, BotPlugin)
         _, new_class = classes[0]
         plugin.__class__ = new_class
+        self._invalidate_active_plugins()
 
         self.activate_plugin(name)
 
@@ -315,6 +323,7 @@ class BotPluginManager(StoreMixin):
                 feedback[path] = traceback.format_exc()
 
     def _load_plugins(self) -> Dict[Path, str]:
+        self._plugin_names_by_path = None
         feedback = {}
         for path in self.plugin_places:
             self._load_plugins_generic(
@@ -358,9 +367,24 @@ class BotPluginManager(StoreMixin):
         self.plugin_places = [Path(root) for root in all_roots]
         return self._load_plugins()
 
+    def _invalidate_active_plugins(self) -> None:
+        self._active_plugins_version += 1
+
     def get_all_active_plugins(self) -> List[BotPlugin]:
         """This returns the list of plugins in the callback ordered defined from the config."""
+        return list(self._active_plugins_snapshot())
+
+    def _active_plugins_snapshot(self) -> Tuple[BotPlugin, ...]:
+        """
+        The active plugins in the callback order, as an immutable snapshot only
+        rebuilt after the set of active plugins has changed.
+        """
+        version, active_plugins = self._active_plugins
+        if version == self._active_plugins_version:
+            return active_plugins
 
+        version = self._active_plugins_version
+        ordered = set(self.plugins_callback_order)
         all_plugins = []
         for name in self.plugins_callback_order:
             # None is a placeholder for any plugin not having a defined order
@@ -368,13 +392,53 @@ class BotPluginManager(StoreMixin):
                 all_plugins += [
                     plugin
                     for name, plugin in self.plugins.items()
-                    if name not in self.plugins_callback_order and plugin.is_activated
+                    if name not in ordered and plugin.is_activated
                 ]
             else:
                 plugin = self.plugins[name]
                 if plugin.is_activated:
                     all_plugins.append(plugin)
-        return all_plugins
+        active_plugins = tuple(all_plugins)
+        self._active_plugins = (version, active_plugins)
+        return active_plugins
+
+    def get_subscribers(self, callback: str) -> Tuple[BotPlugin, ...]:
+        """
+        This returns the active plugins really implementing the given callback, in
+        the callback order.
+
+        BotPlugin defines all the callbacks as no-ops so the plugins inheriting them
+        don't need to be called at all.
+        """
+        version, subscribers = self._subscribers
+        if version != self._active_plugins_version:
+            version = self._active_plugins_version
+            subscribers = {}
+            self._subscribers = (version, subscribers)
+        plugins = subscribers.get(callback)
+        if plugins is None:
+            default = getattr(BotPlugin, callback, None)
+            plugins = subscribers[callback] = tuple(
+                plugin
+                for plugin in self._active_plugins_snapshot()
+                if default is None
+                or getattr(getattr(plugin, callback), "__func__", None) is not default
+            )
+        return plugins
+
+    def has_parallel_callbacks(self, name: str) -> bool:
+        """
+        Checks if the callbacks of the plugin can run concurrently with the other plugins.
+
+        The plugin must declare itself order-independent with ParallelCallbacks in its
+        .plug file and not be explicitly ordered in PLUGINS_CALLBACK_ORDER.
+        """
+        plugin_info = self.plugin_infos.get(name)
+        return (
+            plugin_info is not None
+            and plugin_info.parallel_callbacks
+            and name not in self.plugins_callback_order
+        )
 
     def get_all_active_plugin_names(self) -> List[str]:
         return [name for name, plugin in self.plugins.items() if plugin.is_activated]
@@ -382,15 +446,25 @@ class BotPluginManager(StoreMixin):
     def get_all_plugin_names(self) -> List[str]:
         return self.plugins.keys()
 
-    def get_plugin_by_path(self, path: str) -> Optional[str]:
-        for name, pi in self.plugin_infos.items():
-            if str(pi.location.parent) == path:
-                return self.plugins[name]
+    def _plugin_names_in(self, path: str) -> List[str]:
+        by_path = self._plugin_names_by_path
+        if by_path is None:
+            by_path = {}
+            for name, pi in self.plugin_infos.items():
+                by_path.setdefault(str(pi.location.parent), []).append(name)
+            self._plugin_names_by_path = by_path
+        return by_path.get(path, [])
+
+    def get_plugin_by_path(self, path: str) -> Optional[BotPlugin]:
+        for plugin in self.get_plugins_by_path(path):
+            return plugin
+        return None
 
     def get_plugins_by_path(self, path: str):
-        for name, pi in self.plugin_infos.items():
-            if str(pi.location.parent) == path:
-                yield self.plugins[name]
+        for name in self._plugin_names_in(path):
+            plugin = self.plugins.get(name)  # None if excluded by CORE_PLUGINS
+            if plugin is not None:
+                yield plugin
 
     def deactivate_all_plugins(self) -> None:
         for name in self.get_all_active_plugin_names():
@@ -408,6 +482,7 @@ class BotPluginManager(StoreMixin):
             logging.warning("Plugin %s is already blacklisted.", name)
             return f"Plugin {name} is already blacklisted."
         self[BL_PLUGINS] = self.get_blacklisted_plugin() + [name]
+        self._invalidate_active_plugins()
         log.info("Plugin %s is now blacklisted.", name)
         return f"Plugin {name} is now blacklisted."
 
@@ -418,6 +493,7 @@ class BotPluginManager(StoreMixin):
         plugin = self.get_blacklisted_plugin()
         plugin.remove(name)
         self[BL_PLUGINS] = plugin
+        self._invalidate_active_plugins()
         log.info("Plugin %s removed from blacklist.", name)
         return f"Plugin {name} removed from blacklist."
 
@@ -528,6 +604,7 @@ class BotPluginManager(StoreMixin):
             add_plugin_templates_path(plugin_info)
             populate_doc(plugin, plugin_info)
             plugin.activate()
+            self._invalidate_active_plugins()
             route(plugin)
             plugin.callback_connect()
         except Exception:
@@ -618,7 +695,10 @@ class BotPluginManager(StoreMixin):
             log.warning("Plugin already deactivated, ignore.")
             return
         plugin_info = self.plugin_infos[name]
-        plugin.deactivate()
+        try:
+            plugin.deactivate()
+        finally:
+            self._invalidate_active_plugins()
         remove_plugin_templates_path(plugin_info)
 
     def remove_plugin(self, plugin: BotPlugin) -> None:
@@ -633,6 +713,8 @@ class BotPluginManager(StoreMixin):
 
         del self.plugins[plugin.name]
         del self.plugin_infos[plugin.name]
+        self._plugin_names_by_path = None
+        self._invalidate_active_plugins()
 
     def remove_plugins_from_path(self, root: str) -> None:
         """
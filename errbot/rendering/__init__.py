@@ -1,5 +1,8 @@
 # vim: noai:ts=4:sw=4
 import re
+from collections import OrderedDict
+from threading import Lock, local
+from typing import Callable, Hashable, Optional, Tuple
 
 from markdown import Markdown
 from markdown.extensions.extra import ExtraExtension
@@ -30,6 +33,18 @@ MD_ESCAPE_RE = re.compile(
     )
 )
 
+# How many rendered messages are kept by the shared render cache.
+RENDER_CACHE_SIZE = 256
+
+# A single line of text markdown renders as is: no markup, html or control character
+# (markdown uses some internally), nothing starting a list or a heading, no leading
+# or trailing space starting a code block or a line break.
+PLAIN_RE = re.compile(
+    r"(?![-+=\s]|\d+[.)])[^\\`*_{}\[\]<>#|~&^\x00-\x1f\x7f]+(?<!\s)\Z"
+)
+# Rendered once by each converter to learn what it puts around a plain line.
+PLAIN_PROBE = "Plain text probe."
+
 # Here are few helpers to simplify the conversion from markdown to various
 # backend formats.
 
@@ -110,8 +125,150 @@ def xhtml():
     return Markdown(output_format="xhtml", extensions=[ExtraExtension()])
 
 
+def is_plain(body: str) -> bool:
+    """Returns True if markdown renders the body as is, inside a paragraph."""
+    return PLAIN_RE.match(body) is not None
+
+
 def md_escape(txt):
     """Call this if you want to be sure your text won't be interpreted as markdown
     :param txt: bare text to escape.
     """
     return MD_ESCAPE_RE.sub(lambda match: "\\" + match.group(0), txt)
+
+
+class RenderCache:
+    """
+    A bounded LRU cache of rendered messages keyed by (converter, body).
+
+    Help output, status templates and relayed messages are rendered over and over,
+    a hit saves a full markdown conversion. The dict hashes the body once (the hash
+    of a str is cached by Python) and compares the bodies on a collision, so a
+    cached output is never returned for another body.
+
+    :param maxsize: how many rendered messages are kept.
+    """
+
+    def __init__(self, maxsize: int = RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[Hashable, str], str]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, converter: Hashable, body: str) -> Optional[str]:
+        key = (converter, body)
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+            return rendered
+
+    def put(self, converter: Hashable, body: str, rendered: str) -> None:
+        with self._lock:
+            self._entries[(converter, body)] = rendered
+            self._entries.move_to_end((converter, body))
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+render_cache = RenderCache()
+
+# bumped when an output format changes, the pools then rebuild their converters.
+_formats_version = 0
+
+
+def formats_changed() -> None:
+    """
+    Drops what was rendered in the previous output formats: the render cache and the
+    converters of the ConverterPool instances, with their plain text affixes.
+    """
+    global _formats_version
+    _formats_version += 1
+    render_cache.clear()
+
+
+class ConverterPool:
+    """
+    A thread-safe converter built from one of the factories above.
+
+    A Markdown instance keeps the state of the conversion in progress and must be
+    reset between two texts: it cannot be shared by the threads sending replies.
+    The pool gives each thread its own converter, created on first use, and resets
+    it after every conversion, so the conversions run concurrently without locking.
+    The converters are created again after formats_changed.
+    The outputs are cached in render_cache, pass cache=None to disable it.
+
+    Plain text bodies (see is_plain) skip the conversion: each converter renders
+    PLAIN_PROBE once and the text it puts around it is reused for them, so their
+    output is the one of a full conversion.
+
+    It can be used instead of the converter itself:
+    from errbot.rendering import ConverterPool, text
+    md_converter = ConverterPool(text)  # you need to cache the pool
+
+    pure_text = md_converter.convert(md_txt)
+
+    :param factory: makes a converter, for example text or xhtml.
+    :param cache: where the rendered outputs are cached.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Markdown],
+        cache: Optional[RenderCache] = render_cache,
+    ):
+        self.factory = factory
+        self.cache = cache
+        self._local = local()
+
+    @property
+    def converter(self) -> Markdown:
+        """The converter of the current thread."""
+        return self._thread_local().converter
+
+    def _thread_local(self) -> local:
+        thread_local = self._local
+        if getattr(thread_local, "version", None) != _formats_version:
+            thread_local.version = _formats_version
+            thread_local.converter = self.factory()
+            thread_local.plain = self._plain_affixes(thread_local.converter)
+        return thread_local
+
+    def convert(self, body: str) -> str:
+        thread_local = self._thread_local()
+        if thread_local.plain is not None and is_plain(body):
+            prefix, suffix = thread_local.plain
+            return prefix + body + suffix
+        cache = self.cache
+        if cache is not None:
+            rendered = cache.get(self, body)
+            if rendered is not None:
+                return rendered
+        rendered = self._convert(thread_local.converter, body)
+        if cache is not None:
+            cache.put(self, body, rendered)
+        return rendered
+
+    @staticmethod
+    def _convert(converter: Markdown, body: str) -> str:
+        try:
+            return converter.convert(body)
+        finally:
+            reset = getattr(converter, "reset", None)
+            if reset is not None:
+                reset()
+
+    def _plain_affixes(self, converter: Markdown) -> Optional[Tuple[str, str]]:
+        """Returns what the converter puts before and after a plain line, if known."""
+        prefix, probe, suffix = self._convert(converter, PLAIN_PROBE).partition(
+            PLAIN_PROBE
+        )
+        if not probe or PLAIN_PROBE in suffix:
+            return None  # the converter changes plain text, no fast path.
+        return prefix, suffix
@@ -1,7 +1,6 @@
-import io
 import logging
 from collections import namedtuple
-from functools import partial
+from functools import lru_cache, partial
 from html import unescape
 from itertools import chain
 
@@ -12,6 +11,8 @@ from markdown.extensions.fenced_code import FencedBlockPreprocessor
 from markdown.inlinepatterns import SubstituteTagPattern
 from markdown.postprocessors import Postprocessor
 
+from . import formats_changed
+
 log = logging.getLogger(__name__)
 
 
@@ -162,13 +163,55 @@ IMTEXT_CHRS = CharacterTable(
 
 
 NEXT_ROW = "&NEXT_ROW;"
+HR = "─" * 80 + "\n"
+
+
+@lru_cache(maxsize=None)
+def control_sequences(chr_table):
+    """
+    Returns the text and the width of each sequence of a character table.
+    Only the str sequences take some space, NSC and escape sequences do not.
+    """
+    return {
+        name: (str(value), len(value) if isinstance(value, str) else 0)
+        for name, value in chr_table._asdict().items()
+    }
+
+
+@lru_cache(maxsize=None)
+def tag_sequences(chr_table):
+    """Returns what is written before and after the elements of each tag."""
+    seqs = control_sequences(chr_table)
+    bold, normal = seqs["fx_bold"], seqs["fx_normal"]
+    underline, not_underline = seqs["fx_underline"], seqs["fx_not_underline"]
+    heading_end = (("\n\n", 2),)
+    return {
+        "strong": ((bold,), (normal,)),
+        "code": ((seqs["inline_code"],), (seqs["end_inline_code"],)),
+        "em": ((underline,), (not_underline,)),
+        "p": (((" ", 1),), (("\n", 1),)),
+        "li": ((("• ", 2),), (("\n", 1),)),
+        "hr": (((HR, len(HR)),), ()),
+        "h1": ((bold,), (normal,) + heading_end),
+        "h2": ((("\n  ", 3), bold), (normal,) + heading_end),
+        "h3": ((("\n    ", 5), underline), (not_underline,) + heading_end),
+        "h4": ((("\n      ", 7),), (("\n", 1),)),
+        "h5": ((("\n      ", 7),), (("\n", 1),)),
+        "h6": ((("\n      ", 7),), (("\n", 1),)),
+    }
+
+
+class Table:
+    """
+    A table being translated: the fragments written in each cell are collected in a
+    list, with the width they take, and joined once when the table is rendered.
+    """
 
-
-class Table(object):
     def __init__(self, chr_table):
         self.headers = []
         self.rows = []
         self.in_headers = False
+        self.cell = None  # [fragments, width] of the cell being written
         self.ct = chr_table
 
     def next_row(self):
@@ -176,314 +219,209 @@ class Table(object):
             self.headers.append([])  # is that exists ?
         else:
             self.rows.append([])
+        self.cell = None
 
     def add_col(self):
         if not self.rows:
             self.rows = [[]]
+            self.cell = None
         else:
-            self.rows[-1].append(("", 0))
+            self.cell = [[], 0]
+            self.rows[-1].append(self.cell)
 
     def add_header(self):
         if not self.headers:
             self.headers = [[]]
+            self.cell = None
         else:
-            self.headers[-1].append(("", 0))
+            self.cell = [[], 0]
+            self.headers[-1].append(self.cell)
 
     def begin_headers(self):
         self.in_headers = True
+        self.cell = None
 
     def end_headers(self):
         self.in_headers = False
+        self.cell = None
 
-    def write(self, text):
-        cells = self.headers if self.in_headers else self.rows
-
-        text_cell, count = cells[-1][-1]
-        if isinstance(text, str):
-            text_cell += text
-            count += len(text)
-        else:
-            text_cell += str(text)  # This is a non space chr
-        cells[-1][-1] = text_cell, count
+    def write(self, text, width=None):
+        if width is None:
+            width = len(text) if isinstance(text, str) else 0  # NSC take no space
+        fragments, count = self.cell
+        fragments.append(str(text))
+        self.cell[1] = count + width
 
     def __str__(self):
-        nbcols = max(len(row) for row in chain(self.headers, self.rows))
-        maxes = [
-            0,
-        ] * nbcols
-
-        for row in chain(self.headers, self.rows):
-            for i, el in enumerate(row):
-                txt, length = el
+        headers = [[("".join(parts), n) for parts, n in row] for row in self.headers]
+        rows = [[("".join(parts), n) for parts, n in row] for row in self.rows]
+        nbcols = max(len(row) for row in chain(headers, rows))
+        maxes = [0] * nbcols
+        for row in chain(headers, rows):
+            for i, (txt, length) in enumerate(row):
                 # Account for multiline cells
-                cnt = str(txt).count(NEXT_ROW)
-                if cnt > 0:
-                    length -= cnt * len(NEXT_ROW)
+                length -= txt.count(NEXT_ROW) * len(NEXT_ROW)
                 if maxes[i] < length:
                     maxes[i] = length
 
         # add up margins
         maxes = [m + 2 for m in maxes]
 
-        output = io.StringIO()
-        if self.headers:
-            output.write("┏" + "┳".join("━" * m for m in maxes) + "┓")
-            output.write("\n")
-            first = True
-            for row in self.headers:
-                if not first:
-                    output.write("┣" + "╋".join("━" * m for m in maxes) + "┫")
-                    output.write("\n")
-                first = False
-                for i, header in enumerate(row):
-                    text, ln = header
-                    output.write("┃ " + text + " " * (maxes[i] - 2 - ln) + " ")
-                output.write("┃")
-                output.write("\n")
-            output.write("┡" + "╇".join("━" * m for m in maxes) + "┩")
-            output.write("\n")
-        else:
-            output.write("┌" + "┬".join("─" * m for m in maxes) + "┐")
-            output.write("\n")
-        first = True
-        for row in self.rows:
-            max_row_height = 1
-            for i, item in enumerate(row):
-                text, _ = item
-                row_height = str(text).count(NEXT_ROW) + 1
-                if row_height > max_row_height:
-                    max_row_height = row_height
-            if not first:
-                output.write("├" + "┼".join("─" * m for m in maxes) + "┤")
-                output.write("\n")
-            first = False
-            for j in range(max_row_height):
-                for i, item in enumerate(row):
-                    text, ln = item
-                    multi = text.split(NEXT_ROW)
-                    if len(multi) > j:
-                        text = multi[j]
-                        ln = len(text)
-                    else:
-                        ln = 1
-                        text = " "
-                    output.write("│ " + text + " " * (maxes[i] - 2 - ln) + " ")
-                output.write("│")
-                output.write("\n")
-        output.write("└" + "┴".join("─" * m for m in maxes) + "┘")
-        output.write("\n")
-        return (
-            str(self.ct.fixed_width) + output.getvalue() + str(self.ct.end_fixed_width)
-        )
-
-
-class BorderlessTable:
-    def __init__(self, chr_table):
-        self.headers = []
-        self.rows = []
-        self.in_headers = False
-        self.ct = chr_table
-
-    def next_row(self):
-        if self.in_headers:
-            self.headers.append([])  # is that exists ?
-        else:
-            self.rows.append([])
-
-    def add_col(self):
-        if not self.rows:
-            self.rows = [[]]
-        else:
-            self.rows[-1].append(("", 0))
-
-    def add_header(self):
-        if not self.headers:
-            self.headers = [[]]
+        output = [str(self.ct.fixed_width)]
+        self.render(output, headers, rows, maxes)
+        output.append(str(self.ct.end_fixed_width))
+        return "".join(output)
+
+    @staticmethod
+    def render_row(output, row, maxes, left, end):
+        lines = [text.split(NEXT_ROW) for text, _ in row]
+        for j in range(max((len(multi) for multi in lines), default=1)):
+            for i, multi in enumerate(lines):
+                if len(multi) > j:
+                    text = multi[j]
+                    ln = len(text)
+                else:
+                    ln = 1
+                    text = " "
+                output += (left, text, " " * (maxes[i] - 2 - ln), " ")
+            output.append(end)
+
+    def render(self, output, headers, rows, maxes):
+        def line(left, middle, right, fill):
+            return left + middle.join(fill * m for m in maxes) + right + "\n"
+
+        if headers:
+            output.append(line("┏", "┳", "┓", "━"))
+            separator = line("┣", "╋", "┫", "━")
+            for n, row in enumerate(headers):
+                if n:
+                    output.append(separator)
+                for i, (text, ln) in enumerate(row):
+                    output += ("┃ ", text, " " * (maxes[i] - 2 - ln), " ")
+                output.append("┃\n")
+            output.append(line("┡", "╇", "┩", "━"))
         else:
-            self.headers[-1].append(("", 0))
+            output.append(line("┌", "┬", "┐", "─"))
+        separator = line("├", "┼", "┤", "─")
+        for n, row in enumerate(rows):
+            if n:
+                output.append(separator)
+            self.render_row(output, row, maxes, "│ ", "│\n")
+        output.append(line("└", "┴", "┘", "─"))
 
-    def begin_headers(self):
-        self.in_headers = True
 
-    def end_headers(self):
-        self.in_headers = False
+class BorderlessTable(Table):
+    def render(self, output, headers, rows, maxes):
+        for row in headers:
+            for i, (text, ln) in enumerate(row):
+                output += (text, " " * (maxes[i] - 2 - ln), " ")
+            output.append("\n")
+        for row in rows:
+            self.render_row(output, row, maxes, "", "\n")
 
-    def write(self, text):
-        cells = self.headers if self.in_headers else self.rows
 
-        text_cell, count = cells[-1][-1]
-        if isinstance(text, str):
-            text_cell += text
-            count += len(text)
+def translate(element, chr_table=ANSI_CHRS, borders=True):
+    """
+    Translates the element tree built by markdown with the given character table.
+
+    The tree is walked iteratively, so deeply nested elements do not hit the
+    recursion limit, and the fragments are collected in a list joined once.
+    """
+    seqs = control_sequences(chr_table)
+    tags = tag_sequences(chr_table)
+    output = []
+    append = output.append
+    table = None  # the table we are in, its cells get the fragments instead of output
+    stack = [element]  # the elements to enter and the (element, ...) to leave
+
+    def write(text, width):
+        if table is None:
+            append(text)
         else:
-            text_cell += str(text)  # This is a non space chr
-        cells[-1][-1] = text_cell, count
-
-    def __str__(self):
-        nbcols = max(len(row) for row in chain(self.headers, self.rows))
-        maxes = [
-            0,
-        ] * nbcols
-
-        for row in chain(self.headers, self.rows):
-            for i, el in enumerate(row):
-                txt, length = el
-                # Account for multiline cells
-                cnt = str(txt).count(NEXT_ROW)
-                if cnt > 0:
-                    length -= cnt * len(NEXT_ROW)
-                if maxes[i] < length:
-                    maxes[i] = length
-
-        # add up margins
-        maxes = [m + 2 for m in maxes]
-
-        output = io.StringIO()
-        if self.headers:
-            for row in self.headers:
-                for i, header in enumerate(row):
-                    text, ln = header
-                    output.write(text + " " * (maxes[i] - 2 - ln) + " ")
-                output.write("\n")
-        for row in self.rows:
-            max_row_height = 1
-            for i, item in enumerate(row):
-                text, _ = item
-                row_height = str(text).count(NEXT_ROW) + 1
-                if row_height > max_row_height:
-                    max_row_height = row_height
-            for j in range(max_row_height):
-                for i, item in enumerate(row):
-                    text, ln = item
-                    multi = text.split(NEXT_ROW)
-                    if len(multi) > j:
-                        text = multi[j]
-                        ln = len(text)
-                    else:
-                        ln = 1
-                        text = " "
-                    output.write(text + " " * (maxes[i] - 2 - ln) + " ")
-                output.write("\n")
-        return (
-            str(self.ct.fixed_width) + output.getvalue() + str(self.ct.end_fixed_width)
-        )
-
-
-def recurse(write, chr_table, element, table=None, borders=True):
-    post_element = []
-    if element.text:
+            cell = table.cell
+            cell[0].append(text)
+            cell[1] += width
+
+    while stack:
+        element = stack.pop()
+        if element.__class__ is tuple:  # we are done with its children
+            element, post_element, outer_table, tail = element
+            if element.tag == "table":
+                rendered = str(table)
+                table = outer_table
+                write(rendered, len(rendered))
+            elif element.tag == "thead":
+                table.end_headers()
+            for restore in post_element:
+                write(*restore)
+            if tail:
+                write(tail, len(tail))
+            continue
+
+        post_element = ()
+        outer_table = table
         text = element.text
-    else:
-        text = ""
-    items = element.items()
-    for k, v in items:
-        if k == "color":
-            color_attr = getattr(chr_table, "fg_" + v, None)
-            if color_attr is None:
-                log.warning("there is no '%s' color in ansi.", v)
-                continue
-            write(color_attr)
-            post_element.append(chr_table.fg_default)
-        elif k == "bgcolor":
-            color_attr = getattr(chr_table, "bg_" + v, None)
-            if color_attr is None:
-                log.warning("there is no '%s' bgcolor in ansi", v)
-                continue
-            write(color_attr)
-            post_element.append(chr_table.bg_default)
-    if element.tag == "img":
-        text = dict(items)["src"]
-    elif element.tag == "strong":
-        write(chr_table.fx_bold)
-        post_element.append(chr_table.fx_normal)
-    elif element.tag == "code":
-        write(chr_table.inline_code)
-        post_element.append(chr_table.end_inline_code)
-    elif element.tag == "em":
-        write(chr_table.fx_underline)
-        post_element.append(chr_table.fx_not_underline)
-    elif element.tag == "p":
-        write(" ")
-        post_element.append("\n")
-    elif element.tag == "br" and table:  # Treat <br/> differently in a table.
-        write(NEXT_ROW)
-    elif element.tag == "a":
-        post_element.append(" (" + element.get("href") + ")")
-    elif element.tag == "li":
-        write("• ")
-        post_element.append("\n")
-    elif element.tag == "hr":
-        write("─" * 80)
-        write("\n")
-    elif element.tag == "ul":  # ignore the text part
-        text = None
-    elif element.tag == "h1":
-        write(chr_table.fx_bold)
-        text = text.upper()
-        post_element.append(chr_table.fx_normal)
-        post_element.append("\n\n")
-    elif element.tag == "h2":
-        write("\n")
-        write("  ")
-        write(chr_table.fx_bold)
-        post_element.append(chr_table.fx_normal)
-        post_element.append("\n\n")
-    elif element.tag == "h3":
-        write("\n")
-        write("    ")
-        write(chr_table.fx_underline)
-        post_element.append(chr_table.fx_not_underline)
-        post_element.append("\n\n")
-    elif element.tag in ("h4", "h5", "h6"):
-        write("\n")
-        write("      ")
-        post_element.append("\n")
-    elif element.tag == "table":
-        table = Table(chr_table) if borders else BorderlessTable(chr_table)
-        orig_write = write
-        write = table.write
-        text = None
-    elif element.tag == "tbody":
-        text = None
-    elif element.tag == "thead":
-        table.begin_headers()
-        text = None
-    elif element.tag == "tr":
-        table.next_row()
-        text = None
-    elif element.tag == "td":
-        table.add_col()
-    elif element.tag == "th":
-        table.add_header()
-
-    if text:
-        write(text)
-    for e in element:
-        recurse(write, chr_table, e, table, borders)
-    if element.tag == "table":
-        write = orig_write
-        write(str(table))
-
-    if element.tag == "thead":
-        table.end_headers()
-
-    for restore in post_element:
-        write(restore)
-    if element.tail:
-        tail = element.tail.rstrip("\n")
-        if tail:
-            write(tail)
-
-
-def translate(element, chr_table=ANSI_CHRS, borders=True):
-    f = io.StringIO()
-
-    def write(ansi_obj):
-        return f.write(str(ansi_obj))
-
-    recurse(write, chr_table, element, borders=borders)
-    result = f.getvalue().rstrip("\n")  # remove the useless final \n
-    return result + str(chr_table.fx_reset)
+        tag = element.tag
+        if element.attrib:
+            post_element = []
+            for k, v in element.items():
+                if k == "color":
+                    color_attr = seqs.get("fg_" + v)
+                    if color_attr is None:
+                        log.warning("there is no '%s' color in ansi.", v)
+                        continue
+                    write(*color_attr)
+                    post_element.append(seqs["fg_default"])
+                elif k == "bgcolor":
+                    color_attr = seqs.get("bg_" + v)
+                    if color_attr is None:
+                        log.warning("there is no '%s' bgcolor in ansi", v)
+                        continue
+                    write(*color_attr)
+                    post_element.append(seqs["bg_default"])
+        sequences = tags.get(tag)
+        if sequences is not None:
+            before, after = sequences
+            for seq in before:
+                write(*seq)
+            if after:
+                post_element = (*post_element, *after)
+            if tag == "h1" and text:
+                text = text.upper()
+        elif tag == "img":
+            text = element.attrib["src"]
+        elif tag == "br":
+            if table:  # Treat <br/> differently in a table.
+                write(NEXT_ROW, len(NEXT_ROW))
+        elif tag == "a":
+            link = " (" + element.get("href") + ")"
+            post_element = (*post_element, (link, len(link)))
+        elif tag == "table":
+            table = Table(chr_table) if borders else BorderlessTable(chr_table)
+            text = None
+        elif tag in ("ul", "tbody"):  # ignore the text part
+            text = None
+        elif tag == "thead":
+            table.begin_headers()
+            text = None
+        elif tag == "tr":
+            table.next_row()
+            text = None
+        elif tag == "td":
+            table.add_col()
+        elif tag == "th":
+            table.add_header()
+
+        if text:
+            write(text, len(text))
+        tail = element.tail.rstrip("\n") if element.tail else None
+        if post_element or tail or tag == "table" or tag == "thead":
+            stack.append((element, post_element, outer_table, tail))
+        if len(element):
+            stack.extend(reversed(element))
+
+    result = "".join(output).rstrip("\n")  # remove the useless final \n
+    return result + seqs["fx_reset"][0]
 
 
 # patch us in
@@ -491,6 +429,7 @@ def enable_format(name, chr_table, borders=True):
     Markdown.output_formats[name] = partial(
         translate, chr_table=chr_table, borders=borders
     )
+    formats_changed()  # what was rendered in the previous format is stale.
 
 
 for n, ct in (("ansi", ANSI_CHRS), ("text", TEXT_CHRS), ("imtext", IMTEXT_CHRS)):
@@ -0,0 +1,191 @@
+"""Splitting of the markdown messages too long for a backend"""
+
+import re
+from typing import Callable, Iterator, List, Optional
+
+# An opening or closing code fence, with the fence itself as group 1.
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+# The line under the header of a table: | --- | :---: |
+TABLE_SEPARATOR_RE = re.compile(r"^(?=.*\|)\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+
+
+class MarkdownSplitter:
+    """
+    Cuts a markdown message in chunks fitting in the message size limit of a backend.
+
+    The chunks are cut between lines, preferably between blocks (paragraphs, lists,
+    tables...), so every chunk renders like the corresponding part of the message:
+    a code block cut in two is closed at the end of the first chunk and reopened at
+    the beginning of the next one, a table cut in two gets its header repeated.
+    Only a line longer than the limit by itself is cut in the middle, on a space
+    if possible. A code block or a table whose fences or header leave no room for
+    their content in a chunk is split like text.
+
+    :param limit: the maximum size of a chunk.
+    :param measure: returns the size of a piece of text as the backend counts it,
+        for example the length of its UTF-8 encoding for a limit in bytes.
+    """
+
+    def __init__(self, limit: int, measure: Callable[[str], int] = len):
+        self.limit = limit
+        self.measure = measure
+
+    def split(self, body: str) -> Iterator[str]:
+        """Yields the chunks of the given markdown body, the body itself if it fits."""
+        measure = self.measure
+        if measure(body) <= self.limit:
+            yield body
+            return
+        newline = measure("\n")
+        lines: List[str] = []  # the lines of the chunk being built
+        size = 0  # the size of the chunk being built, with its newlines
+        boundary = 0  # index after the last blank line out of any code block
+        fence = None  # the opening line of the code block we are in
+        reopen = None  # the same if the code block can be reopened in the next chunk
+        header = None  # the header and separator lines of the table we are in
+        previous = None
+        for line in body.split("\n"):
+            new_fence, new_header = self._state_after(line, previous, fence, header)
+            if new_fence is None:
+                new_reopen = None
+            elif fence is None:  # a code block starts, leave room for some code.
+                fences = self._size([new_fence, _closing(new_fence)])
+                new_reopen = new_fence if fences + newline < self.limit else None
+            else:
+                new_reopen = reopen
+            if (
+                header is None
+                and new_header is not None
+                and self._size(new_header) + newline >= self.limit
+            ):
+                new_header = None  # a table with no room for a row is split like text.
+            reserve = (
+                0 if new_reopen is None else newline + measure(_closing(new_reopen))
+            )
+            line_size = measure(line)
+            if lines and size + newline + line_size + reserve > self.limit:
+                if new_header is not None and header is None:
+                    # this is the separator of a table, keep its header line with it.
+                    cut = len(lines) - 1
+                elif boundary and self._size(lines[:boundary]) * 2 >= self.limit:
+                    cut = boundary
+                else:
+                    cut = len(lines)
+                if cut == len(lines):
+                    yield from self._emit(lines, reopen)
+                    row_size = newline + line_size
+                    if (
+                        header is not None
+                        and self._size(header) + row_size > self.limit
+                    ):
+                        header = new_header = None  # the row would not fit.
+                    lines = self._prefix(reopen, header)
+                    if reopen is not None and new_fence is None:
+                        # the chunk has been closed already, do not reopen it.
+                        lines, size, fence, reopen, previous = [], 0, None, None, line
+                        continue
+                else:
+                    # the state was clean at the cut: no code block and no table.
+                    yield from self._emit(lines[:cut], None)
+                    lines = lines[cut:]
+                boundary = 0
+                size = self._size(lines)
+            if size + (newline if lines else 0) + line_size + reserve > self.limit:
+                # the line does not fit in a chunk by itself.
+                lines, size = yield from self._cut(lines, line, reserve, new_reopen)
+            else:
+                size += (newline if lines else 0) + line_size
+                lines.append(line)
+            fence, reopen, header = new_fence, new_reopen, new_header
+            if fence is None and not line.strip():
+                boundary = len(lines)
+            previous = line
+        yield from self._emit(lines, None)
+
+    @staticmethod
+    def _state_after(line, previous, fence, header):
+        """Returns the code block and table we are in after the given line."""
+        if fence is not None:
+            marker = FENCE_RE.match(fence).group(1)
+            if line.strip().startswith(marker) and not line.strip(marker[0]).strip():
+                return None, None
+            return fence, None
+        if FENCE_RE.match(line):
+            return line, None
+        if header is not None:
+            return None, header if "|" in line and line.strip() else None
+        if previous is not None and "|" in previous and TABLE_SEPARATOR_RE.match(line):
+            return None, [previous, line]
+        return None, None
+
+    @staticmethod
+    def _prefix(fence: Optional[str], header: Optional[List[str]]) -> List[str]:
+        """Returns the lines reopening the code block or the table we are in."""
+        if fence is not None:
+            return [fence]
+        if header is not None:
+            return list(header)
+        return []
+
+    def _size(self, lines: List[str]) -> int:
+        if not lines:
+            return 0
+        return sum(map(self.measure, lines)) + self.measure("\n") * (len(lines) - 1)
+
+    def _emit(self, lines: List[str], fence: Optional[str]) -> Iterator[str]:
+        if fence is not None:
+            lines = lines + [_closing(fence)]
+        chunk = "\n".join(lines).strip("\n")
+        if chunk.strip():
+            yield chunk
+
+    def _cut(self, lines: List[str], line: str, reserve: int, fence: Optional[str]):
+        """Yields the chunks of a line too long to fit in one, returns the new chunk."""
+        measure = self.measure
+        newline = measure("\n")
+        prefix = [] if fence is None else [fence]
+        while True:
+            size = self._size(lines)
+            room = self.limit - size - (newline if lines else 0) - reserve
+            if measure(line) <= room:
+                lines.append(line)
+                return lines, size + (newline if lines[:-1] else 0) + measure(line)
+            if not line.strip():
+                return lines, size  # what is left of the line is blank.
+            if measure(line[:1]) <= room:
+                end = _fitting_prefix(line, room, measure)
+                yield from self._emit(lines + [line[:end].rstrip()], fence)
+            elif lines and lines != prefix:
+                yield from self._emit(lines, fence)
+                lines = list(prefix)
+                continue
+            else:
+                # not even a character fits between the fences, cut it out of them.
+                end = _fitting_prefix(line, self.limit, measure)
+                yield from self._emit([line[:end].rstrip()], None)
+            line = line[end:].lstrip()
+            lines = list(prefix)
+
+
+def _closing(fence: str) -> str:
+    return FENCE_RE.match(fence).group(1)
+
+
+def _fitting_prefix(text: str, room: int, measure: Callable[[str], int]) -> int:
+    """Returns where to cut text so its first part measures at most room."""
+    low, high = 1, len(text)
+    while low < high:  # the longest prefix fitting in room
+        middle = (low + high + 1) // 2
+        if measure(text[:middle]) <= room:
+            low = middle
+        else:
+            high = middle - 1
+    space = text.rfind(" ", 0, low + 1)
+    return space if space > low // 2 else low
+
+
+def split_markdown(
+    body: str, limit: int, measure: Callable[[str], int] = len
+) -> Iterator[str]:
+    """Yields the chunks of body measuring at most limit, see MarkdownSplitter."""
+    return MarkdownSplitter(limit, measure).split(body)
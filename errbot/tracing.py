@@ -0,0 +1,231 @@
+"""Tracing of the dispatch of the incoming messages
+
+A :class:`DispatchTrace` follows one incoming message through the bot: it can
+log the steps of the dispatch and record them as spans, compatible with the
+OpenTelemetry ones, in the ring buffer of the :class:`DispatchTracer`.
+
+The spans are opened with :func:`span` which is a no-op when the current thread
+or coroutine is not tracing a message, the untraced messages pay a ContextVar
+lookup per step.
+"""
+
+import logging
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from random import getrandbits, random
+from time import time_ns
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .backends.base import Message
+
+log = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("errbot_span", default=None)
+
+NO_SPAN = nullcontext()
+
+
+class Span:
+    """A timed step of the dispatch of a message."""
+
+    __slots__ = ("trace", "parent", "name", "span_id", "start", "end", "attributes")
+
+    def __init__(
+        self,
+        trace: "DispatchTrace",
+        parent: Optional["Span"],
+        name: str,
+        attributes: Dict[str, Any],
+    ):
+        self.trace = trace
+        self.parent = parent
+        self.name = name
+        self.span_id = f"{getrandbits(64):016x}"
+        self.start = time_ns()
+        self.end = None
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Duration of the span in seconds, None until it is finished."""
+        return None if self.end is None else (self.end - self.start) / 1e9
+
+    def finish(self) -> None:
+        self.end = time_ns()
+        self.trace._finished(self)
+
+    def child(self, name: str, **attributes) -> "Span":
+        return Span(self.trace, self, name, attributes)
+
+    def to_json(self) -> Dict[str, Any]:
+        """Returns the span in the OpenTelemetry (OTLP) JSON format."""
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent else "",
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in self.attributes.items()
+            ],
+        }
+
+
+@contextmanager
+def activate(span: Span) -> Iterator[Span]:
+    """Makes the given span the current one for the duration of the block.
+
+    This is how a trace crosses to another thread, like the ones of the pool
+    executing the commands.
+    """
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def _run_span(span: Span) -> Iterator[Span]:
+    with activate(span):
+        try:
+            yield span
+        finally:
+            span.finish()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace() -> Optional["DispatchTrace"]:
+    span = _current_span.get()
+    return None if span is None else span.trace
+
+
+def span(name: str, **attributes):
+    """Times the block as a child of the current span, if a message is being traced."""
+    parent = _current_span.get()
+    if parent is None:
+        return NO_SPAN
+    return _run_span(parent.child(name, **attributes))
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """Starts a child of the current span that will be finished by someone else.
+
+    It returns None if no message is being traced.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return parent.child(name, **attributes)
+
+
+class DispatchTrace:
+    """Follows the dispatch of one message.
+
+    It only exists for the messages being traced so the dispatch path tests it
+    for None instead of formatting log lines nobody will read.
+
+    :param level: the logging level of the steps, None to not log them.
+    :param tracer: the tracer recording the spans, None to not record them.
+    """
+
+    __slots__ = ("trace_id", "level", "tracer")
+
+    def __init__(self, level: Optional[int], tracer: Optional["DispatchTracer"]):
+        self.trace_id = f"{getrandbits(128):032x}"
+        self.level = level
+        self.tracer = tracer
+
+    def log(self, msg: str, *args) -> None:
+        if self.level is not None:
+            log.log(self.level, "[%s] " + msg, self.trace_id[:8], *args)
+
+    def root(self, name: str, **attributes):
+        """Times the block as the root span of the trace."""
+        return _run_span(Span(self, None, name, attributes))
+
+    def _finished(self, span: Span) -> None:
+        if self.tracer is not None:
+            self.tracer.spans.append(span)
+        if self.level is not None:
+            log.log(
+                self.level,
+                "[%s] %s took %.3fms.",
+                self.trace_id[:8],
+                span.name,
+                span.duration * 1000,
+            )
+
+
+class DispatchTracer:
+    """Decides which incoming messages get a :class:`DispatchTrace`.
+
+    The messages of the given users and rooms are traced at INFO level so they
+    show up in a production log, all the others are only traced when this
+    module logs at DEBUG level. The spans of the traced users and rooms and of
+    a random sample of all the messages are kept in a ring buffer.
+
+    :param users: the persons to trace.
+    :param rooms: the rooms to trace.
+    :param sample_rate: the fraction of the messages to record, between 0 and 1.
+    :param buffer_size: how many spans are kept.
+    """
+
+    def __init__(
+        self,
+        users: Iterable[str] = (),
+        rooms: Iterable[str] = (),
+        sample_rate: float = 0.0,
+        buffer_size: int = 1000,
+    ):
+        self.users = frozenset(users)
+        self.rooms = frozenset(rooms)
+        self.sample_rate = sample_rate
+        self.spans = deque(maxlen=buffer_size)
+
+    def trace(self, msg: Message) -> Optional[DispatchTrace]:
+        """Returns the trace of the given message or None if it is not traced."""
+        if self.users or self.rooms:
+            frm = msg.frm
+            if getattr(frm, "person", None) in self.users or (
+                msg.is_group and str(frm.room) in self.rooms
+            ):
+                return DispatchTrace(logging.INFO, self)
+        level = logging.DEBUG if log.isEnabledFor(logging.DEBUG) else None
+        sampled = self.sample_rate and random() < self.sample_rate
+        if level is None and not sampled:
+            return None
+        return DispatchTrace(level, self if sampled else None)
+
+    def finished_spans(self) -> List[Span]:
+        return list(self.spans)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+    def export(self) -> Dict[str, Any]:
+        """Returns the recorded spans as an OpenTelemetry (OTLP) JSON export request."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": "errbot"}}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_json() for span in self.finished_spans()],
+                        }
+                    ],
+                }
+            ]
+        }
@@ -0,0 +1,144 @@
+"""Detection of the plugin callbacks holding the thread of the backend"""
+
+import logging
+import sys
+import traceback
+from collections import Counter
+from contextlib import nullcontext
+from threading import Condition, Thread, get_ident
+from time import monotonic
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+MIN_PERIOD = 0.01  # seconds, between two checks of the running callbacks
+
+
+class _Watched:
+    __slots__ = ("thread_id", "plugin", "method", "started", "reported")
+
+    def __init__(self, plugin: str, method: str):
+        self.thread_id = get_ident()
+        self.plugin = plugin
+        self.method = method
+        self.started = monotonic()
+        self.reported = False
+
+
+class _Watch:
+    """Context manager registering a callback with the watchdog for the duration of its block."""
+
+    __slots__ = ("watchdog", "plugin", "method", "watched")
+
+    def __init__(self, watchdog: "CallbackWatchdog", plugin: str, method: str):
+        self.watchdog = watchdog
+        self.plugin = plugin
+        self.method = method
+
+    def __enter__(self):
+        self.watched = self.watchdog._enter(self.plugin, self.method)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.watchdog._exit(self.watched)
+        return False
+
+
+NO_WATCH = nullcontext()
+
+
+class CallbackWatchdog:
+    """
+    Logs a stack sample of the plugin callbacks running for longer than a threshold.
+
+    The callbacks are executed one after the other on the thread receiving the
+    messages from the backend so a slow one delays everything else. A daemon thread,
+    started with the first watched callback, checks the running callbacks
+    periodically and logs where the ones over the threshold currently are, once per
+    call.
+    """
+
+    def __init__(self, threshold: Optional[float]):
+        """
+        :param threshold: seconds after which a callback is reported, None or 0 to
+            disable.
+        """
+        if threshold is not None and threshold <= 0:
+            if threshold < 0:
+                log.warning("Invalid slow callback threshold %s, disabled.", threshold)
+            threshold = None
+        self.threshold = threshold
+        self.slow_callbacks = Counter()  # (plugin, method) -> number of slow calls
+        self._condition = Condition()
+        self._watched: Dict[int, _Watched] = {}
+        self._thread: Optional[Thread] = None
+        self._stopped = False
+
+    def watch(self, plugin: str, method: str):
+        """Context manager watching the callback executed in its block."""
+        if self.threshold is None:
+            return NO_WATCH
+        return _Watch(self, plugin, method)
+
+    def _enter(self, plugin: str, method: str) -> _Watched:
+        watched = _Watched(plugin, method)
+        with self._condition:
+            self._watched[id(watched)] = watched
+            if self._thread is None and not self._stopped:
+                self._thread = Thread(
+                    target=self._run, name="Callback watchdog", daemon=True
+                )
+                self._thread.start()
+            elif len(self._watched) == 1:
+                self._condition.notify()
+        return watched
+
+    def _exit(self, watched: _Watched) -> None:
+        with self._condition:
+            del self._watched[id(watched)]
+        if watched.reported:
+            log.warning(
+                "%s on %s completed after %.1fs.",
+                watched.method,
+                watched.plugin,
+                monotonic() - watched.started,
+            )
+
+    def _overdue(self, now: float) -> List[_Watched]:
+        overdue = []
+        for watched in self._watched.values():
+            if not watched.reported and now - watched.started >= self.threshold:
+                watched.reported = True
+                overdue.append(watched)
+        return overdue
+
+    def _run(self) -> None:
+        period = max(self.threshold / 2, MIN_PERIOD)
+        while True:
+            with self._condition:
+                while not self._watched and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                self._condition.wait(period)
+                overdue = self._overdue(monotonic())
+            if overdue:
+                frames = sys._current_frames()
+                for watched in overdue:
+                    self.slow_callbacks[(watched.plugin, watched.method)] += 1
+                    frame = frames.get(watched.thread_id)
+                    stack = "".join(traceback.format_stack(frame)) if frame else "?"
+                    log.warning(
+                        "%s on %s has been running for more than %.1fs, it is at:\n%s",
+                        watched.method,
+                        watched.plugin,
+                        self.threshold,
+                        stack,
+                    )
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
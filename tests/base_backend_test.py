@@ -1,4 +1,5 @@
 # coding=utf-8
+import asyncio
 import logging
 import os  # noqa
 import re  # noqa
@@ -8,10 +9,12 @@ from os.path import sep
 from pathlib import Path
 from queue import Empty, Queue  # noqa
 from tempfile import mkdtemp
+from threading import Event
+from unittest.mock import MagicMock
 
 import pytest
 
-from errbot import arg_botcmd, botcmd, re_botcmd, templating  # noqa
+from errbot import arg_botcmd, botcmd, cmdfilter, re_botcmd, templating  # noqa
 from errbot.backend_plugin_manager import BackendPluginManager
 from errbot.backends.base import ONLINE, Identifier, Message, Room
 from errbot.backends.test import (
@@ -23,7 +26,7 @@ from errbot.backends.test import (
 )
 from errbot.bootstrap import CORE_STORAGE, bot_config_defaults
 from errbot.core import ErrBot
-from errbot.core_plugins.acls import ACLS
+from errbot.core_plugins.acls import ACLS, ciglob, compile_globs, glob
 from errbot.plugin_manager import BotPluginManager
 from errbot.rendering import text
 from errbot.repo_manager import BotRepoManager
@@ -247,6 +250,35 @@ class DummyBackend(ErrBot):
         # str * int gives a repeated string
         return value * count
 
+    ##
+    # async def test commands
+    ##
+
+    @botcmd
+    async def async_return_args(self, msg, args):
+        await asyncio.sleep(0)
+        return args
+
+    @botcmd(split_args_with=" ")
+    async def async_yield_args(self, msg, args):
+        for arg in args:
+            await asyncio.sleep(0)
+            yield arg
+
+    @botcmd
+    async def async_raises_exception(self, msg, args):
+        raise Exception("Kaboom!")
+
+    @arg_botcmd("value", type=str)
+    async def async_arg_value(self, msg, value=None):
+        return value
+
+    @botcmd
+    async def async_wait_for_release(self, msg, args):
+        while not self.released.is_set():
+            await asyncio.sleep(0.01)
+        return "released"
+
     @property
     def mode(self):
         return "Dummy"
@@ -261,6 +293,7 @@ def dummy_backend(request):
     def on_finish():
         backend.flow_executor._pool.close()
         backend.flow_executor._pool.join()
+        backend.event_loop.stop()
 
     backend = DummyBackend()
     request.addfinalizer(on_finish)
@@ -1019,3 +1052,200 @@ def test_access_controls(dummy_backend):
         )
         dummy_backend.callback_message(test["message"])
         assert test["expected_response"] == dummy_backend.pop_message().body
+
+
+def test_acl_decisions_are_cached_until_the_config_is_reloaded(dummy_backend):
+    acls = next(
+        f.__self__ for f in dummy_backend.command_filters if f.__name__ == "acls"
+    )
+    dummy_backend.bot_config.ACCESS_CONTROLS_DEFAULT = {}
+    dummy_backend.bot_config.ACCESS_CONTROLS = {"command": {"denyusers": ("noterr",)}}
+    for _ in range(2):
+        dummy_backend.callback_message(makemessage(dummy_backend, "!command"))
+        assert (
+            "You're not allowed to access this command from this user"
+            == dummy_backend.pop_message().body
+        )
+    compiled = acls.compiled_acls()
+    assert list(compiled.decisions.values()) == [
+        "You're not allowed to access this command from this user"
+    ]
+    assert list(compiled.acls) == ["DummyBackendRealName:command"]
+
+    dummy_backend.bot_config.ACCESS_CONTROLS = {"command": {"allowusers": ("*err",)}}
+    dummy_backend.callback_message(makemessage(dummy_backend, "!command"))
+    assert "Regular command" == dummy_backend.pop_message().body
+    assert acls.compiled_acls() is not compiled
+
+
+def test_compiled_globs():
+    assert compile_globs(("*@localhost", "gbin")).match("zoni@localhost")
+    assert compile_globs("gbin").match("gbin")
+    assert not compile_globs(("gbin",)).match("gbin@localhost")
+    assert not compile_globs(()).match("")
+    assert glob(1234, (1234,))
+    assert ciglob("Health:Status", ("health:*",))
+
+
+class TargetedFilters:
+    def __init__(self):
+        self.seen = []
+
+    @cmdfilter(commands="command")
+    def command_only(self, msg, cmd, args, dry_run):
+        self.seen.append(("command_only", cmd))
+        return msg, cmd, args
+
+    @cmdfilter(plugins="DummyBackendRealName")
+    def dummy_only(self, msg, cmd, args, dry_run):
+        self.seen.append(("dummy_only", cmd))
+        return msg, cmd, args
+
+    @cmdfilter(plugins=("Other",))
+    def other_only(self, msg, cmd, args, dry_run):
+        self.seen.append(("other_only", cmd))
+        return msg, cmd, args
+
+
+def test_filters_only_see_the_commands_they_target(dummy_backend):
+    filters = TargetedFilters()
+    dummy_backend.inject_command_filters_from(filters)
+    dummy_backend.callback_message(makemessage(dummy_backend, "!command"))
+    assert "Regular command" == dummy_backend.pop_message().body
+    dummy_backend.callback_message(makemessage(dummy_backend, "!return_args_as_str a"))
+    assert "a" == dummy_backend.pop_message().body
+    assert filters.seen == [
+        ("command_only", "command"),
+        ("dummy_only", "command"),
+        ("dummy_only", "return_args_as_str"),
+    ]
+    assert [f.__name__ for f in dummy_backend._registry.filter_chain("command")] == [
+        "acls",
+        "command_only",
+        "dummy_only",
+    ]
+
+    dummy_backend.remove_command_filters_from(filters)
+    assert [f.__name__ for f in dummy_backend._registry.filter_chain("command")] == [
+        "acls"
+    ]
+
+
+def test_callback_message_with_words_as_command(dummy_backend):
+    dummy_backend.callback_message(
+        makemessage(dummy_backend, "!return args as str one\ntwo")
+    )
+    assert "one\ntwo" == dummy_backend.pop_message().body
+
+
+def test_async_commands(dummy_backend):
+    dummy_backend.callback_message(makemessage(dummy_backend, "!async_return_args one"))
+    assert "one" == dummy_backend.pop_message().body
+    assert dummy_backend.event_loop.is_running
+
+    dummy_backend.callback_message(makemessage(dummy_backend, "!async_yield_args a b"))
+    assert "a" == dummy_backend.pop_message().body
+    assert "b" == dummy_backend.pop_message().body
+
+    dummy_backend.callback_message(makemessage(dummy_backend, "!async_arg_value v"))
+    assert "v" == dummy_backend.pop_message().body
+
+    dummy_backend.callback_message(
+        makemessage(dummy_backend, "!async_raises_exception")
+    )
+    assert dummy_backend.MSG_ERROR_OCCURRED in dummy_backend.pop_message().body
+
+
+def test_async_commands_do_not_use_the_thread_pool():
+    dummy = DummyBackend({"BOT_ASYNC": True, "BOT_ASYNC_POOLSIZE": 1})
+    pool_busy = Event()
+    try:
+        dummy.thread_pool.apply_async(pool_busy.wait, (5,))
+        dummy.callback_message(makemessage(dummy, "!async_return_args one"))
+        assert "one" == dummy.pop_message().body
+    finally:
+        pool_busy.set()
+        dummy.thread_pool.close()
+        dummy.thread_pool.join()
+        dummy.event_loop.stop()
+
+
+def test_async_commands_waiting_behind_an_admin_command_do_not_hold_the_replies():
+    dummy = DummyBackend({"BOT_ASYNC": True, "BOT_ADMINS": ("noterr",)})
+    dummy.released = Event()
+    barrier = dummy._execution_barrier
+    waiting = min(32, (os.cpu_count() or 1) + 4)  # the size of the default executor
+    try:
+        dummy.callback_message(makemessage(dummy, "!async_wait_for_release"))
+        while not barrier._shared:
+            dummy.released.wait(0.01)
+        dummy.callback_message(makemessage(dummy, "!admin_command"))
+        while not barrier._exclusive_waiting:
+            dummy.released.wait(0.01)
+        for i in range(waiting):
+            dummy.callback_message(makemessage(dummy, f"!async_return_args {i}"))
+        dummy.released.set()
+        replies = [dummy.pop_message(timeout=5).body for _ in range(waiting + 2)]
+        assert replies[:2] == ["released", "Admin command"]
+        assert sorted(replies[2:]) == sorted(str(i) for i in range(waiting))
+    finally:
+        dummy.released.set()
+        dummy.thread_pool.close()
+        dummy.thread_pool.join()
+        dummy.event_loop.stop()
+
+
+def test_commands_over_the_queue_size_are_rejected():
+    dummy = DummyBackend(
+        {"BOT_ASYNC": True, "BOT_ASYNC_POOLSIZE": 1, "BOT_ASYNC_QUEUE_SIZE": 1}
+    )
+    pool_busy = Event()
+    try:
+        dummy.command_scheduler.submit(pool_busy.wait, {"timeout": 5}, user="other")
+        dummy.callback_message(makemessage(dummy, "!return_args_as_str one"))
+        dummy.callback_message(makemessage(dummy, "!return_args_as_str two"))
+        assert "overloaded" in dummy.pop_message().body
+        assert dummy.command_scheduler.queued == 1
+        pool_busy.set()
+        assert "one" == dummy.pop_message().body
+    finally:
+        pool_busy.set()
+        dummy.thread_pool.close()
+        dummy.thread_pool.join()
+        dummy.event_loop.stop()
+
+
+class CallbackRecorder:
+    def __init__(self, name, calls, wait_for=None):
+        self.name = name
+        self.calls = calls
+        self.wait_for = wait_for
+
+    def callback_message(self, msg):
+        if self.wait_for is not None:
+            assert self.wait_for.wait(5)
+        self.calls.append(self.name)
+
+
+def test_parallel_callbacks_do_not_hold_the_ordered_ones():
+    dummy = DummyBackend({"BOT_PARALLEL_CALLBACKS": True})
+    calls = []
+    ordered_done = Event()
+    slow = CallbackRecorder("Slow", calls, wait_for=ordered_done)
+    first = CallbackRecorder("First", calls)
+    last = CallbackRecorder("Last", calls)
+    dummy.plugin_manager = MagicMock()
+    dummy.plugin_manager.get_subscribers.return_value = [slow, first, last]
+    dummy.plugin_manager.has_parallel_callbacks.side_effect = (
+        lambda name: name == "Slow"
+    )
+    try:
+        dummy._dispatch_to_plugins("callback_message", "msg")
+        assert calls == ["First", "Last"]
+        ordered_done.set()
+        dummy.callback_pool.close()
+        dummy.callback_pool.join()
+        assert calls == ["First", "Last", "Slow"]
+    finally:
+        ordered_done.set()
+        dummy.event_loop.stop()
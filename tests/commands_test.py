@@ -71,6 +71,25 @@ def test_status_gc(testbot):
     assert "GC 0->" in testbot.exec_command("!status gc")
 
 
+def test_status_metrics(testbot):
+    testbot.exec_command("!echo metrics")
+    testbot.exec_command("!echo again")  # the first one is recorded by now
+    report = testbot.exec_command("!status metrics")
+    assert "echo" in report
+    assert "Commands" in report
+
+
+def test_status_callbacks(testbot):
+    testbot.exec_command("!echo callbacks")
+    report = testbot.exec_command("!status callbacks")
+    assert "Callbacks per plugin" in report
+    assert "callback_message" in report
+
+
+def test_status_queue(testbot):
+    assert "waiting (oldest" in testbot.exec_command("!status queue")
+
+
 def test_config_cycle(testbot):
     testbot.push_message("!plugin config Webserver")
     m = testbot.pop_message()
@@ -416,3 +435,63 @@ def test_plugin_info_command(testbot):
     assert "module: help" in output
     assert "help.py" in output
     assert "log level: NOTSET" in output
+
+
+def test_active_plugins_snapshot(testbot):
+    pm = testbot.bot.plugin_manager
+    chatroom = pm.get_plugin_obj_by_name("ChatRoom")
+    active = pm.get_all_active_plugins()
+    assert isinstance(active, list)
+    assert any(p is chatroom for p in active)
+    active.clear()  # the caller gets its own copy
+    assert pm.get_all_active_plugins()
+    snapshot = pm._active_plugins_snapshot()
+    assert pm._active_plugins_snapshot() is snapshot  # not rebuilt
+
+    testbot.push_message("!plugin deactivate ChatRoom")
+    assert "Plugin ChatRoom deactivated." == testbot.pop_message()
+    assert not any(p is chatroom for p in pm.get_all_active_plugins())
+
+    testbot.push_message("!plugin reload ChatRoom")  # it activates it too
+    assert "is currently not activated" in testbot.pop_message()
+    assert "Plugin ChatRoom reloaded." == testbot.pop_message()
+    assert any(p is chatroom for p in pm.get_all_active_plugins())
+    assert pm._active_plugins_snapshot() is not snapshot
+
+
+def test_all_commands_view(testbot):
+    all_commands = testbot.bot.all_commands
+    assert "room_list" in all_commands
+    assert "re_foo" in all_commands  # regex commands are merged in
+    assert testbot.bot.all_commands is all_commands  # not rebuilt
+    with pytest.raises(TypeError):
+        all_commands["nope"] = None
+
+    testbot.push_message("!plugin deactivate ChatRoom")
+    assert "Plugin ChatRoom deactivated." == testbot.pop_message()
+    assert "room_list" not in testbot.bot.all_commands
+    testbot.push_message("!plugin activate ChatRoom")
+    assert "Plugin ChatRoom activated." == testbot.pop_message()
+    assert "room_list" in testbot.bot.all_commands
+
+
+def test_plugins_by_path(testbot):
+    pm = testbot.bot.plugin_manager
+    core_path = str(pm.plugin_infos["ChatRoom"].location.parent)
+    names = [plugin.name for plugin in pm.get_plugins_by_path(core_path)]
+    assert "ChatRoom" in names
+    assert "Health" in names
+    assert pm.get_plugin_by_path(core_path).name in names
+    assert pm.get_plugin_by_path("/nowhere") is None
+    assert list(pm.get_plugins_by_path("/nowhere")) == []
+
+
+def test_events_are_only_routed_to_the_plugins_implementing_them(testbot):
+    pm = testbot.bot.plugin_manager
+    subscribers = [plugin.name for plugin in pm.get_subscribers("callback_message")]
+    assert "ChatRoom" in subscribers  # it overrides callback_message
+    assert "Health" not in subscribers
+    assert pm.get_subscribers("callback_message") is pm.get_subscribers(
+        "callback_message"
+    )
+    assert [p.name for p in pm.get_subscribers("callback_presence")] == []
@@ -0,0 +1,160 @@
+import re
+from unittest.mock import MagicMock
+
+import pytest
+
+from errbot import cmdfilter
+from errbot.dispatch import (
+    CommandRegistry,
+    CommandTrie,
+    LiteralIndex,
+    RegexCommandIndex,
+    required_literal,
+)
+
+
+def test_command_trie_longest_prefix():
+    trie = CommandTrie()
+    trie.add("plugin")
+    trie.add("plugin_config")
+    assert trie.longest_prefix("plugin config Webserver".split()) == 2
+    assert trie.longest_prefix("plugin_config Webserver".split()) == 1
+    assert trie.longest_prefix("plugin info".split()) == 1
+    assert trie.longest_prefix("plugins config".split()) == 0
+    assert trie.longest_prefix([]) == 0
+
+
+def re_command(pattern, flags=0, matchall=False):
+    def command(msg, match):
+        pass
+
+    command._err_command_re_pattern = re.compile(pattern, flags)
+    command._err_command_matchall = matchall
+    return command
+
+
+def test_regex_command_index_matches_in_order():
+    index = RegexCommandIndex(
+        {
+            "one": re_command(r"matched by two commands"),
+            "two": re_command(r"MATCHED BY TWO COMMANDS", flags=re.IGNORECASE),
+            "capture": re_command(r"capture group: (?P<capture>.*)"),
+            "all": re_command(r"match_here", matchall=True),
+        }
+    )
+    assert [name for name, _, _ in index.matches("matched by two commands")] == [
+        "one",
+        "two",
+    ]
+    ((name, _, match),) = index.matches("a capture group: yes")
+    assert (name, match.group("capture")) == ("capture", "yes")
+    ((name, _, matches),) = index.matches("match_here and match_here")
+    assert (name, len(matches)) == ("all", 2)
+    assert list(index.matches("just chatting")) == []
+
+
+def test_regex_command_index_falls_back_on_uncombinable_patterns():
+    index = RegexCommandIndex(
+        {
+            "backref": re_command(r"(\w+) \1"),
+            "global_flag": re_command(r"(?i)hello"),
+            "verbose": re_command(r"bye # a comment", flags=re.VERBOSE),
+            "name1": re_command(r"(?P<word>foo)"),
+            "name2": re_command(r"(?P<word>bar)"),
+        }
+    )
+    assert [name for name, _, _ in index.matches("HELLO again again")] == [
+        "backref",
+        "global_flag",
+    ]
+    assert [name for name, _, _ in index.matches("bye bar")] == ["verbose", "name2"]
+
+
+@pytest.mark.parametrize(
+    "pattern,flags,literal",
+    [
+        (r"JIRA-\d+", 0, ("JIRA-", False)),
+        (r"https://github.com/", 0, ("https://github", False)),
+        (r"(?i)Hello World", 0, ("hello world", True)),
+        (r"Hello World", re.IGNORECASE, ("hello world", True)),
+        (r"x(?:ab|cd)?yz", 0, ("yz", False)),
+        (r"(?P<word>foo)+bar", 0, ("foo", False)),
+        (r"(?i:this) CASE", 0, (" CASE", False)),
+        (r"kiss", re.IGNORECASE, None),
+        (r"a|b", 0, None),
+        (r".*", 0, None),
+    ],
+)
+def test_required_literal(pattern, flags, literal):
+    assert required_literal(re.compile(pattern, flags)) == literal
+
+
+def test_regex_command_index_prefilters_on_literals():
+    ticket = re_command(r"JIRA-(\d+)")
+    index = RegexCommandIndex(
+        {"ticket": ticket, "greet": re_command(r"hello there", flags=re.IGNORECASE)}
+    )
+    ticket._err_command_re_pattern = MagicMock(wraps=ticket._err_command_re_pattern)
+    assert list(index.matches("nothing to see here")) == []
+    ticket._err_command_re_pattern.search.assert_not_called()
+
+    ((name, _, match),) = index.matches("see JIRA-42")
+    assert (name, match.group(1)) == ("ticket", "42")
+    assert [name for name, _, _ in index.matches("HELLO There")] == ["greet"]
+
+
+def test_literal_index():
+    index = LiteralIndex(["JIRA-", "JIRA", "IRA", "a.b", "zz"])
+    assert index.find("see JIRA-42 and a.b") == {"JIRA-", "JIRA", "IRA", "a.b"}
+    assert index.find("JIRAaxb") == {"JIRA", "IRA"}
+    assert index.find("nothing") == set()
+
+
+def test_regex_command_index_keeps_the_order_of_the_commands():
+    index = RegexCommandIndex(
+        {
+            "first": re_command(r"hello"),
+            "no_literal": re_command(r"h\w+"),
+            "caseless": re_command(r"hello", flags=re.IGNORECASE),
+            "same_literal": re_command(r"hello+"),
+        }
+    )
+    assert [name for name, _, _ in index.matches("hello")] == [
+        "first",
+        "no_literal",
+        "caseless",
+        "same_literal",
+    ]
+    assert [name for name, _, _ in index.matches("HELLO")] == ["caseless"]
+
+
+def test_command_registry_snapshots_are_immutable():
+    def command(msg, args):
+        pass
+
+    @cmdfilter(commands="help")
+    def help_filter(msg, cmd, args, dry_run):
+        pass
+
+    regex = re_command(r"hello")
+    regex._err_command_prefix_required = True
+    empty = CommandRegistry()
+    registry = empty.replace(
+        commands={"plugin_config": command, "help": command},
+        re_commands={"hello": regex},
+    )
+    assert not empty.commands and not empty.trie.longest_prefix(["help"])
+    assert registry.trie.longest_prefix("plugin config x".split()) == 2
+    assert set(registry.all_commands) == {"plugin_config", "help", "hello"}
+    assert registry.all_commands is registry.all_commands  # built once
+    with pytest.raises(TypeError):
+        registry.commands["help"] = None
+
+    assert [name for name, _, _ in registry.re_commands_index(True).matches("hello")]
+    assert not list(registry.re_commands_index(False).matches("hello"))
+
+    filtered = registry.replace(command_filters=[help_filter])
+    assert filtered.commands is not registry.commands
+    assert filtered.filter_chain("help") == (help_filter,)
+    assert filtered.filter_chain("plugin_config") == ()
+    assert registry.command_filters == ()
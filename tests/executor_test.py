@@ -0,0 +1,257 @@
+from threading import Event, Thread
+
+import pytest
+
+from errbot.executor import (
+    OVERFLOW_COALESCE,
+    OVERFLOW_DROP_OLDEST,
+    OVERFLOW_REJECT,
+    ExecutionBarrier,
+    FairScheduler,
+)
+
+
+def test_shared_holders_run_together():
+    barrier = ExecutionBarrier()
+    with barrier.shared():
+        acquired = Event()
+
+        def other():
+            with barrier.shared():
+                acquired.set()
+
+        Thread(target=other).start()
+        assert acquired.wait(5)
+
+
+def test_exclusive_waits_for_shared_and_has_priority():
+    barrier = ExecutionBarrier()
+    order = []
+    barrier.acquire_shared()
+
+    def admin():
+        with barrier.exclusive():
+            order.append("admin")
+
+    def regular():
+        with barrier.shared():
+            order.append("regular")
+
+    admin_thread = Thread(target=admin)
+    admin_thread.start()
+    while not barrier._exclusive_waiting:
+        admin_thread.join(0.01)
+    regular_thread = Thread(target=regular)
+    regular_thread.start()
+    regular_thread.join(0.1)
+    assert order == []  # both wait for the running command
+
+    barrier.release_shared()
+    admin_thread.join(5)
+    regular_thread.join(5)
+    assert order == ["admin", "regular"]
+
+
+class ManualPool:
+    """Thread pool stand-in running the submitted jobs on demand."""
+
+    def __init__(self):
+        self.pending = []
+        self.closed = False
+
+    def apply_async(self, func, args):
+        if self.closed:
+            raise ValueError("Pool not running")
+        self.pending.append((func, args))
+
+    def run_next(self):
+        func, args = self.pending.pop(0)
+        func(*args)
+
+
+@pytest.fixture
+def executed():
+    return []
+
+
+def submit(scheduler, executed, user, name, room=None, command=None, key=None):
+    return scheduler.submit(
+        lambda name: executed.append(name),
+        {"name": name},
+        user=user,
+        room=room,
+        command=command,
+        duplicate_key=key,
+    )
+
+
+def run_all(pool):
+    while pool.pending:
+        pool.run_next()
+
+
+def test_scheduler_round_robin_between_users(executed):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 1)
+    submit(scheduler, executed, "blocker", "blocker")  # holds the only slot
+    for i in range(3):
+        submit(scheduler, executed, "flooder", f"flooder{i}")
+    submit(scheduler, executed, "other", "other0")
+    submit(scheduler, executed, "other", "other1")
+    assert scheduler.running == 1
+    assert scheduler.queued == 5
+    run_all(pool)
+    assert executed == [
+        "blocker",
+        "flooder0",
+        "other0",
+        "flooder1",
+        "other1",
+        "flooder2",
+    ]
+    assert scheduler.running == 0
+    assert scheduler.queued == 0
+
+
+def test_scheduler_users_get_their_turn_in_arrival_order(executed):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 1)
+    submit(scheduler, executed, "blocker", "blocker")  # holds the only slot
+    submit(scheduler, executed, "A", "A")
+    for i in range(5):
+        submit(scheduler, executed, f"N{i}", f"N{i}")
+    run_all(pool)
+    assert executed == ["blocker", "A", "N0", "N1", "N2", "N3", "N4"]
+
+
+def test_scheduler_resubmitting_while_running_does_not_jump_the_queue(executed):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 1)
+
+    def spam(i):
+        executed.append(f"S{i}")
+        if i < 9:  # the next one is queued while this one runs
+            scheduler.submit(spam, {"i": i + 1}, user="S")
+
+    scheduler.submit(spam, {"i": 0}, user="S")
+    submit(scheduler, executed, "A", "A0")
+    run_all(pool)
+    assert executed == ["S0", "A0"] + [f"S{i}" for i in range(1, 10)]
+
+
+def test_scheduler_weights(executed):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 1, weights={"vip": 2})
+    submit(scheduler, executed, "blocker", "blocker")  # holds the only slot
+    for i in range(3):
+        submit(scheduler, executed, "vip", f"vip{i}")
+        submit(scheduler, executed, "user", f"user{i}")
+    run_all(pool)
+    # vip gets two turns per round.
+    assert executed == ["blocker", "vip0", "vip1", "user0", "vip2", "user1", "user2"]
+
+
+@pytest.mark.parametrize(
+    "limit, keys",
+    [
+        ("max_per_user", [("u", None, "a"), ("u", None, "b")]),
+        ("max_per_room", [("u1", "#room", "a"), ("u2", "#room", "b")]),
+        ("max_per_command", [("u1", None, "cmd"), ("u2", None, "cmd")]),
+    ],
+)
+def test_scheduler_limits(executed, limit, keys):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 10, **{limit: 1})
+    for user, room, command in keys:
+        submit(scheduler, executed, user, command, room, command)
+    submit(scheduler, executed, "unrelated", "unrelated", None, "unrelated")
+    assert scheduler.running == 2  # the first one and the unrelated one
+    assert scheduler.queued == 1
+    run_all(pool)
+    assert sorted(executed) == sorted([c for _, _, c in keys] + ["unrelated"])
+    assert scheduler.running == 0
+
+
+def test_scheduler_survives_crashes_and_closed_pool(executed):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 1)
+
+    def crash():
+        raise Exception("Kaboom!")
+
+    scheduler.submit(crash, {}, user="u")
+    submit(scheduler, executed, "u", "after crash")
+    run_all(pool)
+    assert executed == ["after crash"]
+
+    pool.closed = True
+    submit(scheduler, executed, "u", "dropped")
+    assert scheduler.running == 0
+    assert scheduler.queued == 0
+
+
+def test_scheduler_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        FairScheduler(ManualPool(), 1, overflow="explode")
+
+
+@pytest.mark.parametrize(
+    "policy, expected_shed, expected_executed",
+    [
+        (OVERFLOW_REJECT, "u2-1", ["running", "u1-0", "u1-1"]),
+        (OVERFLOW_DROP_OLDEST, "u1-0", ["running", "u1-1", "u2-1"]),
+        (OVERFLOW_COALESCE, "u2-1", ["running", "u1-0", "u1-1"]),
+    ],
+)
+def test_scheduler_overflow(executed, policy, expected_shed, expected_executed):
+    shed = []
+    pool = ManualPool()
+    scheduler = FairScheduler(
+        pool,
+        1,
+        max_queued=2,
+        overflow=policy,
+        on_shed=lambda job, p: shed.append((job.kwargs["name"], p)),
+    )
+    submit(scheduler, executed, "u0", "running")
+    assert submit(scheduler, executed, "u1", "u1-0")
+    assert submit(scheduler, executed, "u1", "u1-1")
+    accepted = submit(scheduler, executed, "u2", "u2-1")
+    assert accepted == (policy == OVERFLOW_DROP_OLDEST)
+    assert scheduler.queued == 2
+    assert shed == [
+        (expected_shed, OVERFLOW_DROP_OLDEST if accepted else OVERFLOW_REJECT)
+    ]
+    run_all(pool)
+    assert executed == expected_executed
+    stats = scheduler.stats()
+    assert stats["rejected"] + stats["dropped"] == 1
+    assert stats["queued"] == 0
+    assert stats["oldest_wait"] == 0.0
+
+
+def test_scheduler_coalesces_duplicates(executed):
+    pool = ManualPool()
+    scheduler = FairScheduler(pool, 1, max_queued=2, overflow=OVERFLOW_COALESCE)
+    submit(scheduler, executed, "u", "running", key=("u", "cmd", "a"))
+    submit(scheduler, executed, "u", "queued", key=("u", "cmd", "a"))
+    submit(scheduler, executed, "u", "other args", key=("u", "cmd", "b"))
+    assert submit(scheduler, executed, "u", "duplicate", key=("u", "cmd", "a"))
+    assert scheduler.coalesced == 1
+    run_all(pool)
+    assert executed == ["running", "queued", "other args"]
+    assert scheduler.average_wait >= 0.0
+
+
+@pytest.mark.parametrize("max_queued", [None, 3])
+def test_scheduler_does_not_coalesce_when_not_full(executed, max_queued):
+    pool = ManualPool()
+    scheduler = FairScheduler(
+        pool, 1, max_queued=max_queued, overflow=OVERFLOW_COALESCE
+    )
+    submit(scheduler, executed, "u", "running", key=("u", "cmd", "a"))
+    submit(scheduler, executed, "u", "queued", key=("u", "cmd", "a"))
+    submit(scheduler, executed, "u", "duplicate", key=("u", "cmd", "a"))
+    assert scheduler.coalesced == 0
+    run_all(pool)
+    assert executed == ["running", "queued", "duplicate"]
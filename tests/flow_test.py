@@ -1,9 +1,10 @@
 import logging
+from types import SimpleNamespace
 
 import pytest
 
 from errbot.backends.test import TestPerson
-from errbot.flow import Flow, FlowRoot, InvalidState
+from errbot.flow import Flow, FlowExecutor, FlowRoot, InvalidState
 
 log = logging.getLogger(__name__)
 
@@ -45,3 +46,19 @@ def test_autotrigger():
         "a", lambda ctx: "toto" in ctx and ctx["toto"] == "titui", auto_trigger=True
     )
     assert node.command in root.auto_triggers
+
+
+def test_flows_held_until_the_command_is_done():
+    executor = FlowExecutor(bot=None)
+    executor.add_flow(FlowRoot("test", "This is my flowroot"))
+    executor._pool.close()
+    submitted = []
+    executor._pool = SimpleNamespace(
+        apply_async=lambda func, args: submitted.append(args)
+    )
+
+    with executor.hold_flows():
+        flow = executor.start_flow("test", TestPerson("me"), {})
+        assert executor.in_flight == [flow]
+        assert submitted == []
+    assert submitted == [(flow,)]
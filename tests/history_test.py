@@ -0,0 +1,65 @@
+from errbot.backends.base import Message
+from errbot.backends.test import TestPerson
+from errbot.history import CommandHistory, UserHistory
+
+
+def test_user_history_is_bounded_and_deduplicated():
+    history = UserHistory(maxlen=3)
+    for entry in (("a", ""), ("b", "1"), ("a", ""), ("c", ""), ("d", "")):
+        history.append(entry)
+    assert list(history) == [("a", ""), ("c", ""), ("d", "")]
+    assert history[-1] == ("d", "")
+    assert history[0] == ("a", "")
+    assert ("b", "1") not in history
+    history.discard(("c", ""))
+    history.discard(("unknown", ""))
+    assert len(history) == 2
+
+
+def test_least_recently_active_users_are_evicted():
+    histories = CommandHistory(maxlen=2, max_users=2)
+    histories["gbin"].append(("about", ""))
+    histories["zoni"].append(("help", ""))
+    histories["gbin"]  # gbin is active again
+    histories["tali"].append(("echo", "hi"))
+    assert "zoni" not in histories
+    assert list(histories["gbin"]) == [("about", "")]
+    assert len(histories) == 2
+
+
+def test_dump_and_load():
+    histories = CommandHistory()
+    histories["gbin"].append(("echo", "hi"))
+    histories["gbin"].append(("about", ""))
+    restored = CommandHistory()
+    restored.load(histories.dump())
+    assert list(restored["gbin"]) == [("echo", "hi"), ("about", "")]
+
+
+def test_get_does_not_create_or_reorder():
+    histories = CommandHistory(max_users=2)
+    histories["gbin"].append(("about", ""))
+    histories["zoni"].append(("help", ""))
+    assert histories.get("tali") is None
+    assert "tali" not in histories
+    assert list(histories.get("gbin")) == [("about", "")]
+    histories["tali"]  # gbin is still the least recently used one
+    assert "gbin" not in histories
+
+
+def test_chat_does_not_touch_the_histories(testbot):
+    histories = testbot.bot.cmd_history
+    testbot.push_message("!echo hi")
+    testbot.pop_message()
+    testbot.bot.cmd_history = CommandHistory(max_users=1)
+    try:
+        testbot.bot.cmd_history.load(histories.dump())
+        testbot.bot.callback_message(
+            Message(
+                "just chatting", frm=TestPerson("zoni"), to=testbot.bot.bot_identifier
+            )
+        )
+        assert "zoni" not in testbot.bot.cmd_history
+        assert testbot.bot.cmd_history.get("gbin@localhost")[-1] == ("echo", "hi")
+    finally:
+        testbot.bot.cmd_history = histories
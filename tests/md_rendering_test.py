@@ -1,7 +1,10 @@
 # vim: ts=4:sw=4
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree.ElementTree import Element, SubElement
 
 from errbot import rendering
+from errbot.rendering.ansiext import ANSI_CHRS, TEXT_CHRS, enable_format, translate
 
 log = logging.getLogger(__name__)
 
@@ -28,3 +31,70 @@ def test_escaping():
     original = "#not a title\n*not italic*\n`not code`\ntoto{not annotation}"
     escaped = rendering.md_escape(original)
     assert original == mdc.convert(escaped)
+
+
+def test_converter_pool_caches_the_outputs():
+    cache = rendering.RenderCache(maxsize=2)
+    mdc = rendering.ConverterPool(rendering.text, cache=cache)
+    assert mdc.convert("*woot*") == "woot"
+    assert cache.get(mdc, "*woot*") == "woot"
+    assert mdc.convert("*woot*") == "woot"
+    mdc.convert("# woot")
+    mdc.convert("`woot`")
+    assert cache.get(mdc, "*woot*") is None  # evicted
+    assert len(cache) == 2
+
+
+def test_converter_pool_is_thread_safe():
+    mdc = rendering.ConverterPool(rendering.text, cache=None)
+    bodies = [f"# title {i}\n\n*item* [{i}][r]\n\n[r]: http://{i}" for i in range(50)]
+    expected = [rendering.text().convert(body) for body in bodies]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(mdc.convert, bodies)) == expected
+
+
+def test_plain_text_fast_path():
+    assert rendering.is_plain("Plugin Webserver activated.")
+    for body in ("*woot*", "1. first", "- item", "    code", "a <b>", "a\x02b", ""):
+        assert not rendering.is_plain(body)
+    for factory in (rendering.text, rendering.ansi, rendering.xhtml):
+        mdc = rendering.ConverterPool(factory, cache=None)
+        for body in ("Done.", "42 items: 3-4 are well-known!", "'quoted' (yes)"):
+            assert mdc.convert(body) == factory().convert(body)
+
+
+def test_converter_pool_follows_the_format_changes():
+    mdc = rendering.ConverterPool(rendering.text)
+    assert mdc.convert("Done.") == "Done."
+    assert mdc.convert("*woot*") == "woot"
+    try:
+        enable_format("text", ANSI_CHRS)
+        assert mdc.convert("Done.") == rendering.text().convert("Done.") != "Done."
+        assert mdc.convert("*woot*") == rendering.text().convert("*woot*") != "woot"
+    finally:
+        enable_format("text", TEXT_CHRS)
+    assert mdc.convert("Done.") == "Done."
+    assert mdc.convert("*woot*") == "woot"
+
+
+def test_large_tables():
+    rows = "\n".join(f"| Plugin{i} | *active* |" for i in range(500))
+    lines = rendering.text().convert(f"| name | state |\n|---|---|\n{rows}").split("\n")
+    assert lines[:3] == [
+        "┏━━━━━━━━━━━┳━━━━━━━━┓",
+        "┃ name      ┃ state  ┃",
+        "┡━━━━━━━━━━━╇━━━━━━━━┩",
+    ]
+    assert lines[-3:] == [
+        "├───────────┼────────┤",
+        "│ Plugin499 │ active │",
+        "└───────────┴────────┘",
+    ]
+
+
+def test_deep_trees_do_not_hit_the_recursion_limit():
+    root = element = Element("div")
+    for _ in range(5000):
+        element = SubElement(element, "strong")
+        element.text = "x"
+    assert translate(root, TEXT_CHRS) == "x" * 5000
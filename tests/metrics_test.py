@@ -0,0 +1,100 @@
+from errbot.metrics import (
+    STORAGE_DURATION,
+    Histogram,
+    MetricsRegistry,
+    TimedStoragePlugin,
+)
+from errbot.storage.memory import MemoryStoragePlugin
+
+
+def test_counters_and_histograms_per_labels():
+    metrics = MetricsRegistry()
+    metrics.inc("errors_total", command="a")
+    metrics.inc("errors_total", command="a")
+    metrics.inc("errors_total", command="b")
+    metrics.observe("duration_seconds", 0.2, command="a")
+    with metrics.timer("duration_seconds", command="a"):
+        pass
+    assert metrics.counter("errors_total", command="a") == 2
+    assert metrics.counter("errors_total", command="b") == 1
+    assert metrics.counter("errors_total", command="c") == 0
+    histogram = metrics.histogram("duration_seconds", command="a")
+    assert histogram.count == 2
+    assert 0.2 <= histogram.sum < 0.3
+    assert metrics.histogram("duration_seconds", command="b") is None
+    commands = sorted(labels["command"] for labels, _ in metrics.series("errors_total"))
+    assert commands == ["a", "b"]
+
+
+def test_disabled_registry_records_nothing():
+    metrics = MetricsRegistry(enabled=False)
+    metrics.inc("errors_total")
+    metrics.observe("duration_seconds", 1.0)
+    with metrics.timer("duration_seconds"):
+        pass
+    assert metrics.render() == "# EOF\n"
+    assert metrics.histogram("duration_seconds") is None
+
+
+def test_histogram_quantiles():
+    histogram = Histogram((1.0, 2.0, float("inf")))
+    assert histogram.quantile(0.5) == 0.0
+    for value in (0.5, 1.5, 1.5, 100.0):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1]
+    assert histogram.mean == 103.5 / 4
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(1.0) == 2.0  # the +Inf bucket reports its lower bound
+    assert list(histogram.cumulative()) == [(1.0, 1), (2.0, 3), (float("inf"), 4)]
+
+
+def test_render_openmetrics_text_format():
+    metrics = MetricsRegistry(buckets=(0.1, float("inf")))
+    metrics.inc("errbot_command_errors_total", command='say "hi"')
+    metrics.observe("errbot_command_duration_seconds", 0.05, command="echo")
+    metrics.register_collector(
+        lambda: [("errbot_queue_depth", "gauge", "Queued commands.", [({}, 3)])]
+    )
+    assert metrics.render().splitlines() == [
+        "# TYPE errbot_queue_depth gauge",
+        "# HELP errbot_queue_depth Queued commands.",
+        "errbot_queue_depth 3",
+        "# TYPE errbot_command_errors counter",
+        "# HELP errbot_command_errors Bot commands that raised an exception.",
+        'errbot_command_errors_total{command="say \\"hi\\""} 1',
+        "# TYPE errbot_command_duration_seconds histogram",
+        "# HELP errbot_command_duration_seconds Execution time of the bot commands, replies included.",
+        'errbot_command_duration_seconds_bucket{command="echo",le="0.1"} 1',
+        'errbot_command_duration_seconds_bucket{command="echo",le="+Inf"} 1',
+        'errbot_command_duration_seconds_count{command="echo"} 1',
+        'errbot_command_duration_seconds_sum{command="echo"} 0.05',
+        "# EOF",
+    ]
+
+
+def test_crashing_collector_is_skipped():
+    metrics = MetricsRegistry()
+
+    def crash():
+        raise Exception("Kaboom!")
+
+    metrics.register_collector(crash)
+    assert metrics.render() == "# EOF\n"
+    metrics.unregister_collector(crash)
+
+
+def test_timed_storage():
+    metrics = MetricsRegistry()
+    plugin = TimedStoragePlugin(MemoryStoragePlugin(object()), metrics)
+    storage = plugin.open("ns")
+    storage.set("key", "value")
+    assert storage.get("key") == "value"
+    assert list(storage.keys()) == ["key"]
+    assert storage.len() == 1
+    storage.remove("key")
+    storage.close()
+    for operation in ("set", "get", "keys", "len", "remove", "close"):
+        histogram = metrics.histogram(
+            STORAGE_DURATION, operation=operation, namespace="ns"
+        )
+        assert histogram.count == 1
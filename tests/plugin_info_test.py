@@ -75,3 +75,16 @@ def test_errbot_version():
     info = PluginInfo.load_file(f, None)
     assert info.errbot_minversion == (1, 2, 3, sys.maxsize)
     assert info.errbot_maxversion == (4, 5, 6, 0)
+
+
+def test_parallel_callbacks():
+    f = StringIO(
+        """
+    [Core]
+    Name = Config
+    Module = config
+    ParallelCallbacks = True
+    """
+    )
+    assert PluginInfo.load_file(f, None).parallel_callbacks
+    assert not PluginInfo.load(plugfile_path).parallel_callbacks
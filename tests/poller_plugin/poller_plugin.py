@@ -1,5 +1,8 @@
 from __future__ import absolute_import
 
+import asyncio
+import threading
+
 from errbot import BotPlugin, botcmd
 
 
@@ -22,3 +25,18 @@ class PollerPlugin(BotPlugin):
         """Say hello to the world."""
         self.start_poller(0.1, self.delayed_hello_loop, args=(msg.frm,))
         return "Hello, world!"
+
+    async def async_hello(self, frm):
+        await asyncio.sleep(0.1)
+        # the timer which started this coroutine does not wait for it.
+        waiting = any(
+            thread.name == "Poller thread for PollerPlugin"
+            for thread in threading.enumerate()
+        )
+        self.send(frm, f"Hello from a coroutine, timer waiting: {waiting}")
+
+    @botcmd
+    def hello_async(self, msg, args):
+        """Say hello to the world from a coroutine, twice."""
+        self.start_poller(0.1, self.async_hello, times=2, args=(msg.frm,))
+        return "Hello, world!"
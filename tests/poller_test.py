@@ -21,3 +21,20 @@ def test_delayed_hello_loop(testbot):
     assert delayed_msg in testbot.pop_message(timeout=1)
     # Assert that only one message has been enqueued
     assert testbot.bot.outgoing_message_queue.empty()
+
+
+def test_async_poller(testbot):
+    assert "Hello, world!" in testbot.exec_command("!hello_async")
+    for _ in range(2):
+        assert "Hello from a coroutine, timer waiting: False" in testbot.pop_message(
+            timeout=2
+        )
+    time.sleep(0.5)
+    assert testbot.bot.outgoing_message_queue.empty()
+
+
+def test_poller_lag_is_measured(testbot):
+    assert "Hello, world!" in testbot.exec_command("!hello")
+    assert "Hello world!" in testbot.pop_message(timeout=2)
+    lags = testbot.bot.metrics.series("errbot_poller_lag_seconds")
+    assert [labels for labels, _ in lags] == [{"plugin": "PollerPlugin"}]
@@ -0,0 +1,70 @@
+from errbot.rendering.splitter import split_markdown
+
+
+def utf8(text):
+    return len(text.encode("utf-8"))
+
+
+def test_a_fitting_body_is_left_untouched():
+    body = "# Title\n\nSome *text*.\n"
+    assert list(split_markdown(body, len(body))) == [body]
+
+
+def test_cut_between_blocks():
+    first = "A first paragraph, long enough to fill most of a chunk."
+    second = "- a list item\n- another list item"
+    chunks = list(split_markdown(f"{first}\n\n{second}", len(first) + 20))
+    assert chunks == [first, second]
+
+
+def test_code_blocks_are_reopened():
+    code = "\n".join(f"print({i})" for i in range(10))
+    chunks = list(split_markdown(f"```python\n{code}\n```", 50))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 50
+        assert chunk.startswith("```python\n")
+        assert chunk.endswith("\n```")
+    inside = [line for chunk in chunks for line in chunk.split("\n")[1:-1]]
+    assert "\n".join(inside) == code
+
+
+def test_table_headers_are_repeated():
+    rows = "\n".join(f"| {i} | {i * i} |" for i in range(10))
+    chunks = list(split_markdown(f"| n | square |\n|---|---|\n{rows}", 60))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 60
+        assert chunk.startswith("| n | square |\n|---|---|\n")
+
+
+def test_long_lines_are_cut_on_spaces():
+    chunks = list(split_markdown("x" * 25 + " " + "y" * 30, 20))
+    assert chunks == ["x" * 20, "x" * 5 + " " + "y" * 14, "y" * 16]
+
+
+def test_size_in_bytes():
+    chunks = list(split_markdown("é" * 30, 20, utf8))
+    assert chunks == ["é" * 10] * 3
+    assert all(utf8(chunk) <= 20 for chunk in chunks)
+
+
+def test_oversized_table_headers_are_not_repeated():
+    header = "| " + " | ".join(["a long column title"] * 3) + " |"
+    rows = "\n".join(f"| {i} | {i} | {i} |" for i in range(10))
+    chunks = list(split_markdown(f"{header}\n|---|---|---|\n{rows}", 36))
+    assert all(len(chunk) <= 36 for chunk in chunks)
+    assert sum(chunk.count("title") for chunk in chunks) == 3
+
+
+def test_table_separators_split_across_chunks():
+    separator = "|" + "|".join(["-" * 20] * 3) + "|"
+    rows = "\n".join(f"| {i} | {i} | {i} |" for i in range(10))
+    chunks = list(split_markdown(f"| a | b | c |\n{separator}\n{rows}", 30, utf8))
+    assert all(utf8(chunk) <= 30 for chunk in chunks)
+    assert sum(chunk.count("| a | b | c |") for chunk in chunks) == 1
+
+
+def test_code_block_fences_too_long_to_be_repeated():
+    body = "```python\n" + "é" * 20 + "\n```"
+    assert all(utf8(chunk) <= 13 for chunk in split_markdown(body, 13, utf8))
@@ -0,0 +1,91 @@
+import logging
+
+from errbot.backends.base import Message
+from errbot.backends.test import TestPerson
+from errbot.tracing import DispatchTracer, span
+
+extra_config = {"BOT_TRACE_USERS": ("gbin@localhost",)}
+
+
+def test_only_the_traced_users_get_a_trace(caplog):
+    tracer = DispatchTracer(users=("gbin",))
+    with caplog.at_level(logging.INFO, logger="errbot.tracing"):
+        assert tracer.trace(Message("!help", frm=TestPerson("gbin"))).level == (
+            logging.INFO
+        )
+        assert tracer.trace(Message("!help", frm=TestPerson("zoni"))) is None
+
+
+def test_everybody_is_traced_at_debug_level(caplog):
+    tracer = DispatchTracer()
+    msg = Message("!help", frm=TestPerson("zoni"))
+    with caplog.at_level(logging.INFO, logger="errbot.tracing"):
+        assert tracer.trace(msg) is None
+    with caplog.at_level(logging.DEBUG, logger="errbot.tracing"):
+        assert tracer.trace(msg).level == logging.DEBUG
+
+
+def test_dispatch_is_traced(testbot, caplog):
+    with caplog.at_level(logging.INFO, logger="errbot.tracing"):
+        assert "Errbot version" in testbot.exec_command("!about")
+        testbot.exec_command("!echo hello")
+    traces = [r.getMessage() for r in caplog.records if r.name == "errbot.tracing"]
+    assert any('Received "!about" from gbin@localhost' in t for t in traces)
+    assert any('Processing command "echo" with parameters "hello"' in t for t in traces)
+
+
+def test_commands_are_logged_without_a_trace(testbot, caplog):
+    with caplog.at_level(logging.INFO, logger="errbot.core"):
+        testbot.exec_command("!echo hello")
+    assert 'Processing command "echo" with parameters "hello" from gbin@localhost' in [
+        r.getMessage() for r in caplog.records if r.name == "errbot.core"
+    ]
+
+
+def test_spans_are_recorded_across_the_dispatch(testbot):
+    tracer = testbot.bot.tracer
+    tracer.clear()
+    assert "Yes I am alive" in testbot.exec_command("!status")
+    testbot.exec_command("!echo again")  # the spans of !status are finished by now
+    spans = tracer.finished_spans()
+    command = next(
+        s for s in spans if s.name == "command" and s.attributes["command"] == "status"
+    )
+    status = [s for s in spans if s.trace is command.trace]
+    names = {s.name for s in status}
+    assert {
+        "receive",
+        "process_message",
+        "filters",
+        "queue",
+        "command",
+        "template",
+        "send",
+        "markdown",
+    } <= names
+    (root,) = [s for s in status if s.parent is None]
+    assert root.name == "receive"
+    assert all(s.start >= root.start for s in status)
+    assert next(s for s in status if s.name == "queue").parent.name == "process_message"
+
+
+def test_sampling_and_ring_buffer(caplog):
+    msg = Message("!help", frm=TestPerson("zoni"))
+    tracer = DispatchTracer(sample_rate=1.0, buffer_size=2)
+    trace = tracer.trace(msg)
+    with trace.root("receive"):
+        with span("process_message"):
+            pass
+        with span("send"):
+            pass
+    assert [s.name for s in tracer.finished_spans()] == ["send", "receive"]
+    with caplog.at_level(logging.INFO, logger="errbot.tracing"):
+        assert DispatchTracer(sample_rate=0.0).trace(msg) is None
+    with span("outside of a trace"):
+        pass  # no-op
+
+    (exported,) = tracer.export()["resourceSpans"][0]["scopeSpans"][0]["spans"][1:]
+    assert exported["name"] == "receive"
+    assert exported["traceId"] == trace.trace_id
+    assert exported["parentSpanId"] == ""
+    assert int(exported["endTimeUnixNano"]) >= int(exported["startTimeUnixNano"])
@@ -0,0 +1,40 @@
+import logging
+from time import sleep
+
+import pytest
+
+from errbot.watchdog import CallbackWatchdog
+
+
+def slow_callback():
+    sleep(0.3)
+
+
+def test_slow_callbacks_are_reported_with_their_stack(caplog):
+    watchdog = CallbackWatchdog(0.05)
+    try:
+        with caplog.at_level(logging.WARNING, logger="errbot.watchdog"):
+            with watchdog.watch("Slowpoke", "callback_message"):
+                slow_callback()
+            with watchdog.watch("Quick", "callback_message"):
+                pass
+    finally:
+        watchdog.stop()
+    assert watchdog.slow_callbacks == {("Slowpoke", "callback_message"): 1}
+    reports = [r.getMessage() for r in caplog.records]
+    assert any(
+        "callback_message on Slowpoke has been running" in report
+        and "slow_callback" in report
+        for report in reports
+    )
+    assert any("callback_message on Slowpoke completed after" in r for r in reports)
+    assert not any("Quick" in report for report in reports)
+
+
+@pytest.mark.parametrize("threshold", (None, 0, -1.0))
+def test_disabled_watchdog_does_not_start_a_thread(threshold):
+    watchdog = CallbackWatchdog(threshold)
+    with watchdog.watch("Plugin", "callback_message"):
+        pass
+    assert watchdog._thread is None
+    watchdog.stop()
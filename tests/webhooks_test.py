@@ -210,3 +210,44 @@ def test_lambda_webhook(webhook_testbot):
         requests.post("http://localhost:{}/lambda".format(WEBSERVER_PORT)).status_code
         == 200
     )
+
+
+def test_metrics_endpoint(webhook_testbot):
+    webhook_testbot.exec_command("!echo metrics")
+    webhook_testbot.exec_command("!echo again")  # the first one is recorded by now
+    response = requests.get("http://localhost:{}/metrics".format(WEBSERVER_PORT))
+    assert response.headers["Content-Type"].startswith("application/openmetrics-text")
+    assert "# TYPE errbot_command_duration_seconds histogram" in response.text
+    assert 'errbot_command_duration_seconds_count{command="echo"}' in response.text
+    assert "errbot_thread_pool_active_workers " in response.text
+    assert 'errbot_messages_received_total{backend="test"}' in response.text
+    assert 'errbot_backend_reconnections{backend="test"} 0' in response.text
+    assert response.text.endswith("# EOF\n")
+
+
+def test_traces_endpoint_is_off_by_default(webhook_testbot):
+    response = requests.get("http://localhost:{}/traces".format(WEBSERVER_PORT))
+    assert response.status_code == 404
+
+
+def test_traces_endpoint(webhook_testbot):
+    config = webhook_testbot.bot.bot_config
+    tracer = webhook_testbot.bot.tracer
+    tracer.sample_rate = 1.0
+    config.BOT_TRACE_EXPORT = True
+    try:
+        webhook_testbot.exec_command("!echo traced")
+        webhook_testbot.exec_command("!echo again")
+        response = requests.get("http://localhost:{}/traces".format(WEBSERVER_PORT))
+    finally:
+        tracer.sample_rate = 0.0
+        config.BOT_TRACE_EXPORT = False
+    (resource,) = response.json()["resourceSpans"]
+    spans = resource["scopeSpans"][0]["spans"]
+    assert {"key": "command", "value": {"stringValue": "echo"}} in [
+        attribute for span in spans for attribute in span["attributes"]
+    ]
+    assert "receive" in {span["name"] for span in spans}
+    assert "frm" not in {
+        attribute["key"] for span in spans for attribute in span["attributes"]
+    }
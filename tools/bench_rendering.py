@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Measures the rendering of typical bot replies, with and without the fast path
+skipping markdown for the plain text ones.
+
+Usage: python tools/bench_rendering.py [number of rounds]
+"""
+
+import sys
+from timeit import timeit
+
+from errbot.rendering import ConverterPool, ansi, is_plain, text, xhtml
+
+# Short plain replies, as most of the replies are, and a few formatted ones.
+REPLIES = [
+    "Done.",
+    "42",
+    "Yes I am alive...",
+    "Plugin Webserver activated.",
+    "Plugin configuration done.",
+    "You are not allowed to do that.",
+    "Command not found, did you mean echo?",
+    "The weather in Paris is 21 degrees, sunny with a light breeze.",
+    "gbin@localhost has been kicked from the room.",
+    "Restarting in 5 seconds...",
+    "**Status**: all systems nominal",
+    "- `!about` about errbot\n- `!help` this help",
+    "| plugin | state |\n|---|---|\n| Webserver | active |\n| Chatroom | active |",
+    "# Title\n\nSome *emphasis* and a [link](https://errbot.io).",
+]
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    plain = sum(map(is_plain, REPLIES))
+    print(f"{len(REPLIES)} replies, {plain} of them plain, {rounds} rounds")
+    for factory in (text, ansi, xhtml):
+        converter = factory()
+        pool = ConverterPool(factory, cache=None)  # no cache, only the fast path
+
+        def full():
+            for reply in REPLIES:
+                converter.convert(reply)
+                converter.reset()
+
+        def fast():
+            for reply in REPLIES:
+                pool.convert(reply)
+
+        full_time = timeit(full, number=rounds)
+        fast_time = timeit(fast, number=rounds)
+        print(
+            f"{factory.__name__:>6}: markdown {full_time * 1000:8.1f} ms, "
+            f"with the fast path {fast_time * 1000:8.1f} ms "
+            f"({full_time / fast_time:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()